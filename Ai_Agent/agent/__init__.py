@@ -1,4 +1,5 @@
 """Agent 模块"""
 from .agent import LangChainAgent
+from .answer_cache import AnswerCache
 
-__all__ = ["LangChainAgent"]
+__all__ = ["LangChainAgent", "AnswerCache"]
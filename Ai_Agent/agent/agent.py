@@ -4,57 +4,136 @@
 """
 from typing import Optional, AsyncIterator, List, Dict, Any
 from langchain_openai import ChatOpenAI
-from langchain.agents import AgentExecutor, create_react_agent
-from langchain.prompts import PromptTemplate
+from langchain.agents import AgentExecutor, create_react_agent, create_openai_tools_agent
+from langchain.prompts import PromptTemplate, ChatPromptTemplate, MessagesPlaceholder
 from langchain.memory import ConversationBufferMemory
 from langchain.callbacks.base import AsyncCallbackHandler
 from langchain.schema import AgentAction, AgentFinish, LLMResult
 from tools import create_rag_tool, create_search_tool
+from tools.speculation import begin_prefetch, SpeculativePrefetch
+from tools.openai_connection import open_connection
+from .stream_parser import FinalAnswerParser
+from .usage import instrument_llm, start_usage_tracking, TokenUsage
+from .answer_cache import AnswerCache
+from .router import QueryRouter, ROUTE_AGENT, ROUTE_DIRECT
+from observability import span
 import os
 import asyncio
+import logging
+
+
+logger = logging.getLogger(__name__)
+
+
+# chat_stream 事件队列长度上限
+STREAM_QUEUE_SIZE = int(os.getenv("STREAM_QUEUE_SIZE", "256"))
+
+# 缓存回答回放时每个 content 事件的字符数
+REPLAY_CHUNK_CHARS = 32
+
+# AgentExecutor 达到迭代上限时的输出前缀，这类回答不缓存
+STOPPED_OUTPUT_PREFIX = "Agent stopped"
+
+# Agent 模式：react（文本 ReAct 解析）或 tools（模型原生函数调用）
+AGENT_MODE_REACT = "react"
+AGENT_MODE_TOOLS = "tools"
+
+# 人设（Agent 与直答两条路径共用，作为 prompt 的静态前缀）
+PERSONA_PROMPT = """你是"脑智"，一个专为脑机接口（BCI）设计的智能助手。你不仅能够回答问题，还具有情感智能，能够感知用户的情绪状态并给予恰当的情感反馈。
+
+## 你的个性特点：
+- 温暖、善解人意，关注用户的情绪状态
+- 专业可靠，在技术问题上给予准确的帮助
+- 积极乐观，善于用正面的方式引导对话
+- 敏锐细腻，能够从用户的语言中察觉情绪变化
+
+## 情感响应原则：
+- 当用户表现出焦虑、沮丧时：给予安慰和鼓励，用温和的语气回应
+- 当用户表现出兴奋、开心时：分享他们的喜悦，用积极热情的语气回应
+- 当用户表现出困惑、迷茫时：耐心引导，用清晰易懂的方式解释
+- 当用户表现出愤怒、不满时：保持冷静，用理解和同理心回应
+- 当用户表现出疲惫、压力时：表达关心，建议适当休息"""
+
+
+def _has_tool_calls(message: Any) -> bool:
+    """消息（或流式消息块）是否包含工具调用"""
+    additional_kwargs = getattr(message, "additional_kwargs", None) or {}
+    return bool(additional_kwargs.get("tool_calls") or getattr(message, "tool_call_chunks", None))
 
 
 class StreamingCallbackHandler(AsyncCallbackHandler):
     """流式输出回调处理器"""
 
-    def __init__(self, queue: asyncio.Queue):
+    def __init__(self, queue: asyncio.Queue, parse_final_answer: bool = True):
+        """
+        Args:
+            queue: 事件队列
+            parse_final_answer: ReAct 模式需要识别 "Final Answer:"；
+                原生函数调用模式下只输出不含工具调用的那次生成（最终回答）
+        """
         self.queue = queue
         self.current_tool = None
-        self.is_final_answer = False  # 标记是否在输出 Final Answer
-        self.buffer = ""  # 缓冲区用于检测 "Final Answer:"
+        # 增量解析器：逐 token 检测 "Final Answer:"，不缓存推理文本
+        self.parser = FinalAnswerParser() if parse_final_answer else None
+        # 原生函数调用模式：内容 token 到达即转发；本次生成出现工具调用增量后不再转发。
+        # 只暂存第一个内容 token，紧接着就是工具调用时丢弃，避免把调用前的引导语发给前端
+        self._held: Optional[str] = None
+        self._seen_content = False
+        self._tool_call = False
+
+    def _reset(self):
+        if self.parser:
+            self.parser.reset()
+        self._held = None
+        self._seen_content = False
+        self._tool_call = False
+
+    async def _emit(self, content: str):
+        await self.queue.put({
+            "type": "content",
+            "content": content
+        })
+
+    async def _flush_held(self):
+        if self._held is not None:
+            held, self._held = self._held, None
+            await self._emit(held)
 
     async def on_llm_start(self, serialized: Dict[str, Any], prompts: List[str], **kwargs) -> None:
         """LLM 开始时触发"""
-        self.is_final_answer = False
-        self.buffer = ""
+        self._reset()
+
+    async def on_chat_model_start(self, serialized: Dict[str, Any], messages: List[List[Any]], **kwargs) -> None:
+        """Chat 模型开始时触发（ChatOpenAI 走这个回调）"""
+        self._reset()
 
     async def on_llm_new_token(self, token: str, **kwargs) -> None:
         """接收到新 token 时触发"""
-        # 添加到缓冲区
-        self.buffer += token
-
-        # 检测是否到达 "Final Answer:"
-        if not self.is_final_answer:
-            if "Final Answer:" in self.buffer:
-                self.is_final_answer = True
-                # 提取 Final Answer: 之后的内容
-                parts = self.buffer.split("Final Answer:", 1)
-                if len(parts) > 1 and parts[1].strip():
-                    await self.queue.put({
-                        "type": "content",
-                        "content": parts[1].strip()
-                    })
-                self.buffer = ""
-        else:
-            # 已经在 Final Answer 部分，直接输出
-            await self.queue.put({
-                "type": "content",
-                "content": token
-            })
+        if self.parser is None:
+            if self._tool_call:
+                return
+            chunk = kwargs.get("chunk")
+            if chunk is not None and _has_tool_calls(getattr(chunk, "message", None)):
+                self._tool_call = True
+                self._held = None
+            elif token:
+                if not self._seen_content:
+                    self._seen_content = True
+                    self._held = token
+                    return
+                await self._flush_held()
+                await self._emit(token)
+            return
+
+        content = self.parser.feed(token)
+        if content:
+            await self._emit(content)
 
     async def on_llm_end(self, response: LLMResult, **kwargs) -> None:
         """LLM 结束时触发"""
-        pass
+        if self.parser is None and not self._tool_call:
+            # 只有一个内容 token 的生成在这里发出
+            await self._flush_held()
 
     async def on_llm_error(self, error: Exception, **kwargs) -> None:
         """LLM 错误时触发"""
@@ -68,17 +147,17 @@ class StreamingCallbackHandler(AsyncCallbackHandler):
         tool_name = serialized.get("name", "unknown")
         self.current_tool = tool_name
         # 工具调用信息只在后端日志显示，不发送到前端
-        print(f"[TOOL] Using {tool_name} with input: {input_str}")
+        logger.debug("Tool %s input: %s", tool_name, input_str)
 
     async def on_tool_end(self, output: str, **kwargs) -> None:
         """工具执行结束时触发"""
         # 工具结果只在后端日志显示
-        print(f"[TOOL] {self.current_tool} returned: {output[:200]}...")
+        logger.debug("Tool %s returned: %.200s", self.current_tool, output)
         self.current_tool = None
 
     async def on_tool_error(self, error: Exception, **kwargs) -> None:
         """工具执行错误时触发"""
-        print(f"[TOOL ERROR] {str(error)}")
+        logger.warning("Tool %s failed: %s", self.current_tool, error)
         await self.queue.put({
             "type": "error",
             "message": f"Tool error: {str(error)}"
@@ -87,7 +166,7 @@ class StreamingCallbackHandler(AsyncCallbackHandler):
     async def on_agent_action(self, action: AgentAction, **kwargs) -> None:
         """Agent 决策时触发"""
         # 推理过程只在后端日志显示
-        print(f"[AGENT] Thought: {action.log}")
+        logger.debug("Agent thought: %s", action.log)
 
     async def on_agent_finish(self, finish: AgentFinish, **kwargs) -> None:
         """Agent 完成时触发"""
@@ -108,40 +187,101 @@ class LangChainAgent:
     - AgentExecutor 协同执行
     """
 
-    def __init__(self, rag_retriever=None, search_tool=None):
+    def __init__(
+        self,
+        rag_retriever=None,
+        search_tool=None,
+        answer_cache: Optional[AnswerCache] = None,
+        agent_mode: Optional[str] = None
+    ):
         """
         初始化 LangChain Agent
 
         Args:
             rag_retriever: RAG 检索器实例
             search_tool: 搜索工具实例
+            answer_cache: 回答缓存（None 表示不缓存）
+            agent_mode: react 或 tools，默认读取 AGENT_MODE 环境变量
         """
         self.rag_retriever = rag_retriever
         self.search_tool = search_tool
+        self.answer_cache = answer_cache
+        self.agent_mode = (agent_mode or os.getenv("AGENT_MODE", AGENT_MODE_REACT)).lower()
+        if self.agent_mode not in (AGENT_MODE_REACT, AGENT_MODE_TOOLS):
+            raise ValueError(f"Unsupported AGENT_MODE: {self.agent_mode}")
 
         # 初始化 LLM
-        self.llm = ChatOpenAI(
+        model_kwargs = {}
+        if os.getenv("OPENAI_STREAM_USAGE", "true").lower() == "true":
+            # 流式响应末尾附带 usage（含 prompt 前缀缓存命中的 token 数）
+            model_kwargs["extra_body"] = {"stream_options": {"include_usage": True}}
+        self.llm = instrument_llm(ChatOpenAI(
             model=os.getenv("OPENAI_MODEL", "gpt-3.5-turbo"),
             temperature=float(os.getenv("TEMPERATURE", "0.7")),
             streaming=True,
             api_key=os.getenv("OPENAI_API_KEY"),
-            base_url=os.getenv("OPENAI_API_BASE")
-        )
+            base_url=os.getenv("OPENAI_API_BASE"),
+            model_kwargs=model_kwargs
+        ))
 
         # 创建工具列表
         self.tools = self._create_tools()
 
-        # 创建 Agent 提示模板
-        self.prompt = self._create_prompt()
+        if self.agent_mode == AGENT_MODE_TOOLS:
+            # 原生函数调用 Agent：工具选择走 tools 参数，不生成 Thought/Action 文本
+            self.prompt = self._create_tools_prompt()
+            self.agent = create_openai_tools_agent(
+                llm=self.llm,
+                tools=self.tools,
+                prompt=self.prompt
+            )
+        else:
+            # 创建 Agent 提示模板
+            self.prompt = self._create_prompt()
+
+            # 创建 ReAct Agent
+            self.agent = create_react_agent(
+                llm=self.llm,
+                tools=self.tools,
+                prompt=self.prompt
+            )
+
+        # AgentExecutor 只创建一次，对话历史按请求传入
+        self.agent_executor = self.create_agent_executor()
+
+        # 直答链：不需要工具的问题只调用一次 LLM，token 直接流式输出
+        self.direct_chain = self._create_direct_prompt() | self.llm
+
+        # 推测式预取：第一次 LLM 调用的同时按原始问题检索（默认关闭）
+        self.speculative = os.getenv("SPECULATIVE_RETRIEVAL", "false").lower() == "true"
+        self.speculative_web = os.getenv("SPECULATIVE_WEB_SEARCH", "false").lower() == "true"
+        self.speculative_overlap = float(os.getenv("SPECULATIVE_MIN_OVERLAP", "0.6"))
+
+        # 路由器：规则 + 可选的小模型分类
+        self.router = None
+        if os.getenv("ROUTER_ENABLED", "true").lower() == "true":
+            classifier_llm = None
+            if os.getenv("ROUTER_MODEL"):
+                classifier_llm = ChatOpenAI(
+                    model=os.getenv("ROUTER_MODEL"),
+                    temperature=0,
+                    max_tokens=5,
+                    api_key=os.getenv("OPENAI_API_KEY"),
+                    base_url=os.getenv("OPENAI_API_BASE")
+                )
+            self.router = QueryRouter(
+                classifier_llm=classifier_llm,
+                classifier_timeout=float(os.getenv("ROUTER_TIMEOUT", "2"))
+            )
 
-        # 创建 ReAct Agent
-        self.agent = create_react_agent(
-            llm=self.llm,
-            tools=self.tools,
-            prompt=self.prompt
-        )
+        logger.info("LangChain Agent initialized with %d tools (%s mode)", len(self.tools), self.agent_mode)
 
-        print(f"[INFO] LangChain Agent initialized with {len(self.tools)} tools")
+    async def awarm_up(self):
+        """预先建立到 LLM 接口的连接（请求模型列表，不消耗 token）"""
+        llms = [self.llm]
+        if self.router and self.router.classifier_llm is not None:
+            llms.append(self.router.classifier_llm)
+        await asyncio.gather(*(open_connection(llm.async_client) for llm in llms))
 
     def _create_tools(self) -> List:
         """创建工具列表"""
@@ -160,30 +300,18 @@ class LangChainAgent:
         return tools
 
     def _create_prompt(self) -> PromptTemplate:
-        """创建 Agent 提示模板"""
-        template = """你是"脑智"，一个专为脑机接口（BCI）设计的智能助手。你不仅能够回答问题，还具有情感智能，能够感知用户的情绪状态并给予恰当的情感反馈。
+        """创建 Agent 提示模板
 
-## 你的个性特点：
-- 温暖、善解人意，关注用户的情绪状态
-- 专业可靠，在技术问题上给予准确的帮助
-- 积极乐观，善于用正面的方式引导对话
-- 敏锐细腻，能够从用户的语言中察觉情绪变化
-
-## 情感响应原则：
-- 当用户表现出焦虑、沮丧时：给予安慰和鼓励，用温和的语气回应
-- 当用户表现出兴奋、开心时：分享他们的喜悦，用积极热情的语气回应
-- 当用户表现出困惑、迷茫时：耐心引导，用清晰易懂的方式解释
-- 当用户表现出愤怒、不满时：保持冷静，用理解和同理心回应
-- 当用户表现出疲惫、压力时：表达关心，建议适当休息
+        静态部分（人设、工具说明、回答格式）放在最前面且每次请求完全相同，
+        便于 OpenAI 兼容接口做 prompt 前缀缓存；对话历史和问题放在最后。
+        """
+        template = PERSONA_PROMPT + """
 
 ## 可用工具：
 {tools}
 
 工具名称: {tool_names}
 
-## 对话历史：
-{chat_history}
-
 ## 回答格式：
 Question: 用户的问题
 Thought: 我需要思考用户的情绪状态和问题需求，决定如何回应
@@ -194,6 +322,9 @@ Observation: 工具的输出
 Thought: 我现在知道最终答案了，需要用合适的情感语气回应
 Final Answer: 用温暖、贴心的语气给出最终回答，体现对用户情绪的理解
 
+## 对话历史：
+{chat_history}
+
 开始!
 
 Question: {input}
@@ -204,12 +335,41 @@ Thought: {agent_scratchpad}"""
             input_variables=["input", "agent_scratchpad", "tools", "tool_names", "chat_history"]
         )
 
+    def _create_tools_prompt(self) -> ChatPromptTemplate:
+        """创建原生函数调用模式的提示模板（静态人设在前，历史和问题在后）"""
+        system = PERSONA_PROMPT + """
+
+## 工具使用：
+- 问题涉及已上传的文档或专业资料时，先调用 knowledge_search
+- 需要实时信息或知识库中没有相关内容时，调用 web_search
+- 闲聊和常识问题直接回答，不调用工具
+- 最终回答用温暖、贴心的语气，体现对用户情绪的理解"""
+
+        return ChatPromptTemplate.from_messages([
+            ("system", system),
+            ("system", "## 对话历史：\n{chat_history}"),
+            ("human", "{input}"),
+            MessagesPlaceholder(variable_name="agent_scratchpad"),
+        ])
+
+    def _create_direct_prompt(self) -> PromptTemplate:
+        """创建直答提示模板（与 Agent 提示共用人设前缀）"""
+        template = PERSONA_PROMPT + """
+
+## 对话历史：
+{chat_history}
+
+用户: {input}
+脑智:"""
+
+        return PromptTemplate(template=template, input_variables=["input", "chat_history"])
+
     def create_agent_executor(self, memory: Optional[ConversationBufferMemory] = None) -> AgentExecutor:
         """
         创建 AgentExecutor 实例
 
         Args:
-            memory: 对话记忆实例
+            memory: 对话记忆实例（共享的 executor 不绑定记忆，历史通过 _build_inputs 传入）
 
         Returns:
             AgentExecutor 实例
@@ -218,16 +378,75 @@ Thought: {agent_scratchpad}"""
             agent=self.agent,
             tools=self.tools,
             memory=memory,
-            verbose=True,
+            # verbose 会把每步推理直接打印到标准输出，只在 DEBUG 日志级别下开启
+            verbose=logger.isEnabledFor(logging.DEBUG),
             max_iterations=3,
             handle_parsing_errors=True,
             return_intermediate_steps=False
         )
 
+    @staticmethod
+    def _build_inputs(query: str, memory: Optional[ConversationBufferMemory] = None) -> Dict[str, Any]:
+        """组装单次请求的输入（问题 + 该会话的对话历史）"""
+        chat_history = ""
+        if memory is not None:
+            chat_history = memory.load_memory_variables({}).get(memory.memory_key, "")
+        return {"input": query, "chat_history": chat_history}
+
+    async def _lookup_answer(self, query: str):
+        """
+        查询回答缓存
+
+        Returns:
+            (缓存的回答或 None, 知识库版本, 问题向量或 None)
+        """
+        version = self.rag_retriever.version if self.rag_retriever else 0
+        vector = None
+        if self.rag_retriever and self.answer_cache.needs_vector(query):
+            try:
+                vector = await self.rag_retriever.aembed_query(query)
+            except Exception as e:
+                logger.warning("Answer cache embedding failed: %s", e)
+        return self.answer_cache.get(query, version, vector), version, vector
+
+    @staticmethod
+    async def _replay_answer(answer: str) -> AsyncIterator[Dict[str, Any]]:
+        """按 chat_stream 的事件格式回放缓存的回答"""
+        for i in range(0, len(answer), REPLAY_CHUNK_CHARS):
+            yield {"type": "content", "content": answer[i:i + REPLAY_CHUNK_CHARS]}
+        yield {"type": "done"}
+        yield {
+            "type": "complete",
+            "output": answer,
+            "usage": TokenUsage().as_dict(),
+            "cached": True
+        }
+
+    def _start_prefetch(self, query: str) -> SpeculativePrefetch:
+        """为 Agent 路径启动推测式检索（知识库非空时检索知识库，可选同时联网搜索）"""
+        prefetch = begin_prefetch(query, self.speculative_overlap)
+        for tool in self.tools:
+            if tool.name == "knowledge_search" and self.rag_retriever.has_documents():
+                prefetch.start(tool.name, tool.coroutine)
+            elif tool.name == "web_search" and self.speculative_web:
+                prefetch.start(tool.name, tool.coroutine)
+        return prefetch
+
+    async def _run_direct(self, inputs: Dict[str, Any], queue: asyncio.Queue) -> str:
+        """直答路径：单次 LLM 调用，token 直接作为 content 事件输出"""
+        parts = []
+        async for chunk in self.direct_chain.astream(inputs):
+            if chunk.content:
+                parts.append(chunk.content)
+                await queue.put({"type": "content", "content": chunk.content})
+        await queue.put({"type": "done"})
+        return "".join(parts)
+
     async def chat_stream(
         self,
         query: str,
-        memory: Optional[ConversationBufferMemory] = None
+        memory: Optional[ConversationBufferMemory] = None,
+        use_cache: bool = True
     ) -> AsyncIterator[Dict[str, Any]]:
         """
         流式对话接口
@@ -235,25 +454,72 @@ Thought: {agent_scratchpad}"""
         Args:
             query: 用户问题
             memory: 对话记忆实例
+            use_cache: 是否使用回答缓存（会话已有对话历史时总是跳过）
 
         Yields:
             字典格式的流式响应（由调用方决定传输格式）
         """
-        queue = asyncio.Queue()
-        callback = StreamingCallbackHandler(queue)
-
-        # 创建 AgentExecutor
-        agent_executor = self.create_agent_executor(memory=memory)
+        with span("prompt_build"):
+            inputs = self._build_inputs(query, memory)
+
+        # 回答缓存是进程级共享的，键里没有会话信息：
+        # 只在没有对话历史时查询和写入，避免把依赖某个会话上下文的回答回放给其他会话
+        cache_version = None
+        vector = None
+        if self.answer_cache and use_cache and not inputs["chat_history"]:
+            with span("answer_cache") as attrs:
+                cached, cache_version, vector = await self._lookup_answer(query)
+                attrs["hit"] = cached is not None
+            if cached is not None:
+                logger.debug("Answer cache hit for query: %s", query)
+                async for item in self._replay_answer(cached):
+                    yield item
+                return
+
+        # 有界队列：下游（WebSocket 慢客户端）消费不过来时，LLM 流式回调在 put 处等待
+        queue = asyncio.Queue(maxsize=STREAM_QUEUE_SIZE)
+        callback = StreamingCallbackHandler(queue, parse_final_answer=self.agent_mode == AGENT_MODE_REACT)
 
         # 异步执行 Agent
         async def run_agent():
+            # 任务有独立的上下文，只统计本次请求的 LLM 调用
+            usage = start_usage_tracking()
             try:
-                result = await agent_executor.ainvoke(
-                    {"input": query},
-                    config={"callbacks": [callback]}
-                )
+                route = ROUTE_AGENT
+                if not self.tools:
+                    route = ROUTE_DIRECT
+                elif self.router:
+                    with span("route"):
+                        route = await self.router.aroute(query)
+
+                prefetch_outcome = None
+                if route == ROUTE_DIRECT:
+                    with span("direct"):
+                        output = await self._run_direct(inputs, queue)
+                else:
+                    prefetch = self._start_prefetch(query) if self.speculative else None
+                    try:
+                        with span("agent", mode=self.agent_mode):
+                            result = await self.agent_executor.ainvoke(
+                                inputs,
+                                config={"callbacks": [callback]}
+                            )
+                    finally:
+                        # 没用上的预取立即取消
+                        if prefetch:
+                            prefetch_outcome = prefetch.cancel_unused()
+                    output = result.get("output", "")
+                logger.debug("Route: %s, token usage: %s, prefetch: %s", route, usage.as_dict(), prefetch_outcome)
                 # 只发送输出文本，不发送整个result对象（包含不可序列化的消息对象）
-                await queue.put({"type": "complete", "output": result.get("output", "")})
+                complete = {
+                    "type": "complete",
+                    "output": output,
+                    "usage": usage.as_dict(),
+                    "route": route
+                }
+                if prefetch_outcome is not None:
+                    complete["prefetch"] = prefetch_outcome
+                await queue.put(complete)
             except Exception as e:
                 await queue.put({"type": "error", "message": str(e)})
             finally:
@@ -263,14 +529,26 @@ Thought: {agent_scratchpad}"""
         task = asyncio.create_task(run_agent())
 
         # 从队列中读取并生成流式响应
+        answer = ""
+        failed = False
         try:
             while True:
                 item = await queue.get()
                 if item is None:
                     break
 
+                if item["type"] == "error":
+                    failed = True
+                elif item["type"] == "complete":
+                    answer = item.get("output", "")
+
                 yield item
 
+            # 只缓存正常结束的回答
+            if cache_version is not None and answer and not failed \
+                    and not answer.startswith(STOPPED_OUTPUT_PREFIX):
+                self.answer_cache.put(query, answer, cache_version, vector)
+
         finally:
             # 确保任务完成
             if not task.done():
@@ -295,6 +573,9 @@ Thought: {agent_scratchpad}"""
         Returns:
             Agent 的回答
         """
-        agent_executor = self.create_agent_executor(memory=memory)
-        result = await agent_executor.ainvoke({"input": query})
+        inputs = self._build_inputs(query, memory)
+        if not self.tools or (self.router and await self.router.aroute(query) == ROUTE_DIRECT):
+            result = await self.direct_chain.ainvoke(inputs)
+            return result.content
+        result = await self.agent_executor.ainvoke(inputs)
         return result.get("output", "")
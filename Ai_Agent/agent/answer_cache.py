@@ -0,0 +1,188 @@
+"""回答缓存 - 按规范化问题（可选问题向量相似度）复用完整回答，避免重复运行 Agent"""
+from typing import List, Optional
+from collections import OrderedDict
+import re
+import threading
+import time
+import unicodedata
+import numpy as np
+
+
+# 问题末尾不影响语义的标点和语气符号
+_TRAILING = re.compile(r"[\s?？!！。.,，~～…]+$")
+
+
+def normalize_question(question: str) -> str:
+    """规范化问题：全角转半角、小写、合并空白、去掉末尾标点"""
+    text = unicodedata.normalize("NFKC", question).lower()
+    text = " ".join(text.split())
+    return _TRAILING.sub("", text)
+
+
+class AnswerCache:
+    """回答缓存
+
+    - 精确匹配：规范化后的问题文本
+    - 语义匹配（可选）：问题向量余弦相似度超过阈值
+    - 条目按 TTL 过期、按 LRU 淘汰；知识库版本前进时整体失效
+    """
+
+    def __init__(
+        self,
+        ttl: float = 3600.0,
+        max_entries: int = 1024,
+        similarity_threshold: Optional[float] = None,
+    ):
+        """
+        初始化回答缓存
+
+        Args:
+            ttl: 条目有效期（秒）
+            max_entries: 最大缓存条目数
+            similarity_threshold: 语义匹配的最小余弦相似度，None 表示只做精确匹配
+        """
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.similarity_threshold = similarity_threshold
+        self.version = 0
+        self.hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        # 规范化问题 -> (答案, 过期时间, 归一化向量或 None)
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._matrix: Optional[np.ndarray] = None
+        self._matrix_keys: List[str] = []
+        self._lock = threading.Lock()
+
+    @property
+    def semantic(self) -> bool:
+        """是否启用语义匹配"""
+        return self.similarity_threshold is not None
+
+    @staticmethod
+    def _normalize_vector(vector) -> np.ndarray:
+        vec = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(vec)
+        return vec / norm if norm > 0 else vec
+
+    def _sync_version(self, version: int):
+        """知识库版本前进时清空缓存（版本单调递增）"""
+        if version > self.version:
+            self._entries.clear()
+            self._matrix = None
+            self.version = version
+
+    def _expire(self, key: str):
+        del self._entries[key]
+        self._matrix = None
+
+    def get(self, question: str, version: int, vector=None) -> Optional[str]:
+        """
+        查找缓存的回答
+
+        Args:
+            question: 用户问题
+            version: 当前知识库版本
+            vector: 问题向量（启用语义匹配且精确匹配未命中时使用）
+
+        Returns:
+            命中时返回回答文本，否则返回 None
+        """
+        key = normalize_question(question)
+        now = time.monotonic()
+        with self._lock:
+            self._sync_version(version)
+            if version != self.version:
+                self.misses += 1
+                return None
+
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[1] >= now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return entry[0]
+                self._expire(key)
+
+            if vector is not None and self.semantic:
+                answer = self._semantic_get(self._normalize_vector(vector), now)
+                if answer is not None:
+                    self.hits += 1
+                    self.semantic_hits += 1
+                    return answer
+
+            self.misses += 1
+            return None
+
+    def _semantic_get(self, query: np.ndarray, now: float) -> Optional[str]:
+        if self._matrix is None:
+            self._matrix_keys = [k for k, entry in self._entries.items() if entry[2] is not None]
+            if not self._matrix_keys:
+                return None
+            self._matrix = np.stack([self._entries[k][2] for k in self._matrix_keys])
+
+        scores = self._matrix @ query
+        for idx in np.argsort(-scores):
+            if scores[idx] < self.similarity_threshold:
+                break
+            key = self._matrix_keys[idx]
+            entry = self._entries.get(key)
+            if entry is None:
+                continue
+            if entry[1] < now:
+                self._expire(key)
+                return None
+            self._entries.move_to_end(key)
+            return entry[0]
+        return None
+
+    def needs_vector(self, question: str) -> bool:
+        """精确匹配未命中且启用语义匹配时，才需要计算问题向量"""
+        if not self.semantic:
+            return False
+        with self._lock:
+            entry = self._entries.get(normalize_question(question))
+            return entry is None or entry[1] < time.monotonic()
+
+    def put(self, question: str, answer: str, version: int, vector=None):
+        """
+        写入回答
+
+        Args:
+            question: 用户问题
+            answer: 完整回答
+            version: 回答对应的知识库版本
+            vector: 问题向量（可选，用于语义匹配）
+        """
+        if not answer:
+            return
+        key = normalize_question(question)
+        normalized = self._normalize_vector(vector) if vector is not None and self.semantic else None
+        with self._lock:
+            self._sync_version(version)
+            # 回答生成期间知识库已更新，不写入
+            if version != self.version:
+                return
+            self._entries[key] = (answer, time.monotonic() + self.ttl, normalized)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            self._matrix = None
+
+    def invalidate(self):
+        """清空缓存"""
+        with self._lock:
+            self._entries.clear()
+            self._matrix = None
+
+    def get_stats(self) -> dict:
+        """获取缓存统计信息"""
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "similarity_threshold": self.similarity_threshold,
+            "hits": self.hits,
+            "semantic_hits": self.semantic_hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0
+        }
@@ -0,0 +1,146 @@
+"""查询路由 - 判断问题是否需要调用工具，闲聊和无需工具的问题走单次 LLM 直答"""
+from typing import Any, Optional
+import asyncio
+import logging
+import re
+import unicodedata
+
+
+logger = logging.getLogger(__name__)
+
+
+# 路由结果
+ROUTE_DIRECT = "direct"
+ROUTE_AGENT = "agent"
+
+# 寒暄、致谢、告别、简单应答
+_CHITCHAT = re.compile(
+    r"^(你好|您好|嗨|哈喽|hi|hello|hey|早上好|早安|中午好|下午好|晚上好|晚安|"
+    r"谢谢|多谢|感谢|谢啦|thanks|thank you|thx|再见|拜拜|bye|回头见|"
+    r"好的|好吧|好|嗯|嗯嗯|哦|ok|okay|收到|明白了|懂了|知道了|哈哈+|呵呵|嘿嘿|"
+    r"你是谁|你叫什么|你叫什么名字|你能做什么|你会什么)"
+    r"[\s,，.。!！?？~～…]*(呀|啊|哦|呢|吧|啦)?[\s,，.。!！?？~～…]*$"
+)
+
+# 需要查资料或实时信息的信号词
+_TOOL_SIGNALS = re.compile(
+    r"(搜索|搜一下|查一下|查查|查询|检索|上网|联网|网上|最新|新闻|近期|最近的|今天|今年|现在的|实时|"
+    r"天气|价格|股价|汇率|知识库|文档|资料|手册|论文|文献|上传|根据|参考|来源|出处|"
+    r"数据|参数|规格|型号|http|www\.|(?<!\d)20\d\d(?!\d)|search|latest|news|price)",
+    re.IGNORECASE
+)
+
+# 情绪表达、语气词和填充语（如"在吗""好累啊"）；短问题不按长度直答，领域短问题仍需检索
+_SMALL_TALK = re.compile(
+    r"^(在吗|在不在|在嘛|有人吗|好累|累了|好困|困了|好烦|烦死了|无聊|好无聊|开心|好开心|难过|好难过|"
+    r"郁闷|唉|哎|哇|哇塞|嘻嘻|哈|嗯哼|额|呃|emm+|666+|厉害|牛|太棒了|真棒|不错|没事|算了|随便)"
+    r"[\s,，.。!！?？~～…]*(呀|啊|哦|呢|吧|啦|了)?[\s,，.。!！?？~～…]*$"
+)
+
+_CLASSIFIER_PROMPT = """判断回答下面的用户消息是否需要查询知识库或联网搜索。
+闲聊、情绪倾诉、常识问答、对已有对话的追问等不需要；涉及具体资料、文档内容、实时信息或专业数据的需要。
+只回答一个词：TOOL 或 DIRECT。
+
+用户消息：{query}"""
+
+
+def _normalize(query: str) -> str:
+    return " ".join(unicodedata.normalize("NFKC", query).lower().split())
+
+
+def _parse_label(content: str) -> Optional[str]:
+    """
+    解析分类模型的输出
+
+    两个标签首字母不同，只看第一个字母，输出被 max_tokens 截断（如 "DIR"）也能识别。
+
+    Args:
+        content: 模型输出
+
+    Returns:
+        ROUTE_DIRECT / ROUTE_AGENT，无法识别时返回 None
+    """
+    match = re.search(r"[A-Za-z]", content or "")
+    if match is None:
+        return None
+    letter = match.group().upper()
+    if letter == "D":
+        return ROUTE_DIRECT
+    if letter == "T":
+        return ROUTE_AGENT
+    return None
+
+
+class QueryRouter:
+    """查询路由器
+
+    先用规则判断（寒暄/语气词直答，含查询信号词走 Agent），
+    规则无法确定时可选用小模型分类，未配置分类模型或分类失败时保守地走 Agent。
+    """
+
+    def __init__(
+        self,
+        classifier_llm: Optional[Any] = None,
+        classifier_timeout: float = 2.0,
+    ):
+        """
+        初始化路由器
+
+        Args:
+            classifier_llm: 用于分类的小模型（None 表示只用规则）
+            classifier_timeout: 分类调用超时（秒）
+        """
+        self.classifier_llm = classifier_llm
+        self.classifier_timeout = classifier_timeout
+        self.stats = {ROUTE_DIRECT: 0, ROUTE_AGENT: 0, "classified": 0}
+
+    def route_by_rules(self, query: str) -> Optional[str]:
+        """
+        规则路由
+
+        Returns:
+            ROUTE_DIRECT / ROUTE_AGENT，无法确定时返回 None
+        """
+        text = _normalize(query)
+        if _CHITCHAT.match(text):
+            return ROUTE_DIRECT
+        if _TOOL_SIGNALS.search(text):
+            return ROUTE_AGENT
+        if _SMALL_TALK.match(text):
+            return ROUTE_DIRECT
+        # 其余（包括"脑电是什么"这类短问题）交给分类模型，没有分类模型时走 Agent
+        return None
+
+    async def aroute(self, query: str) -> str:
+        """
+        判断问题的处理路径
+
+        Args:
+            query: 用户问题
+
+        Returns:
+            ROUTE_DIRECT 或 ROUTE_AGENT
+        """
+        route = self.route_by_rules(query)
+        if route is None and self.classifier_llm is not None:
+            route = await self._classify(query)
+        route = route or ROUTE_AGENT
+        self.stats[route] += 1
+        return route
+
+    async def _classify(self, query: str) -> Optional[str]:
+        """小模型分类，超时或出错时返回 None"""
+        try:
+            result = await asyncio.wait_for(
+                self.classifier_llm.ainvoke(_CLASSIFIER_PROMPT.format(query=query)),
+                timeout=self.classifier_timeout
+            )
+        except Exception as e:
+            logger.warning("Router classification failed: %s", e)
+            return None
+        route = _parse_label(result.content)
+        if route is None:
+            logger.warning("Router classifier returned an unknown label: %r", result.content)
+            return None
+        self.stats["classified"] += 1
+        return route
@@ -0,0 +1,88 @@
+"""ReAct 流式输出解析器 - 增量识别 "Final Answer:" 并输出其后的内容"""
+
+
+class FinalAnswerParser:
+    """增量状态机解析器
+
+    每个字符只扫描一次（KMP 前缀匹配），不保留已扫描的文本，
+    标记被任意拆分到多个 token 中也能识别；每个 token 的开销与推理长度无关。
+    """
+
+    MARKER = "Final Answer:"
+
+    # 解析状态
+    SEARCHING = 0   # 寻找标记
+    LEADING = 1     # 已匹配标记，跳过答案前的空白
+    ANSWER = 2      # 输出答案内容
+
+    def __init__(self, marker: str = MARKER):
+        """
+        初始化解析器
+
+        Args:
+            marker: 最终答案标记
+        """
+        self.marker = marker
+        self._failure = self._build_failure(marker)
+        self.reset()
+
+    @staticmethod
+    def _build_failure(pattern: str) -> list:
+        """KMP 失配表"""
+        failure = [0] * len(pattern)
+        j = 0
+        for i in range(1, len(pattern)):
+            while j > 0 and pattern[i] != pattern[j]:
+                j = failure[j - 1]
+            if pattern[i] == pattern[j]:
+                j += 1
+            failure[i] = j
+        return failure
+
+    def reset(self):
+        """开始新一轮 LLM 输出时重置"""
+        self.state = self.SEARCHING
+        self._matched = 0
+
+    @property
+    def in_answer(self) -> bool:
+        """是否已进入最终答案部分"""
+        return self.state != self.SEARCHING
+
+    def feed(self, token: str) -> str:
+        """
+        输入一个 token
+
+        Args:
+            token: LLM 新生成的文本片段
+
+        Returns:
+            可以立即输出的最终答案内容（可能为空字符串）
+        """
+        if self.state == self.ANSWER:
+            return token
+
+        marker = self.marker
+        failure = self._failure
+        i = 0
+        if self.state == self.SEARCHING:
+            matched = self._matched
+            while i < len(token):
+                char = token[i]
+                i += 1
+                while matched > 0 and marker[matched] != char:
+                    matched = failure[matched - 1]
+                if marker[matched] == char:
+                    matched += 1
+                    if matched == len(marker):
+                        self.state = self.LEADING
+                        break
+            self._matched = matched
+            if self.state == self.SEARCHING:
+                return ""
+
+        # LEADING：跳过标记与答案之间的空白
+        rest = token[i:].lstrip()
+        if rest:
+            self.state = self.ANSWER
+        return rest
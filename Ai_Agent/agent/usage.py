@@ -0,0 +1,114 @@
+"""LLM token 用量统计 - 从 OpenAI 兼容接口的流式响应中读取 usage（含前缀缓存命中的 token 数）"""
+from typing import Any, Dict, Optional
+from contextvars import ContextVar
+import time
+from observability import record_span, LLM_TTFT_SECONDS
+
+
+class TokenUsage:
+    """单个请求内所有 LLM 调用的 token 用量累计"""
+
+    def __init__(self):
+        self.llm_calls = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.cached_tokens = 0
+
+    def add(self, usage: Any):
+        """累加一次调用的 usage（兼容 dict 与 SDK 对象）"""
+        if usage is None:
+            return
+        self.llm_calls += 1
+        self.prompt_tokens += _field(usage, "prompt_tokens") or 0
+        self.completion_tokens += _field(usage, "completion_tokens") or 0
+        details = _field(usage, "prompt_tokens_details")
+        if details is not None:
+            self.cached_tokens += _field(details, "cached_tokens") or 0
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "llm_calls": self.llm_calls,
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "cached_tokens": self.cached_tokens,
+            "cache_hit_rate": round(self.cached_tokens / self.prompt_tokens, 4) if self.prompt_tokens else 0.0
+        }
+
+
+def _field(obj: Any, name: str) -> Any:
+    if isinstance(obj, dict):
+        return obj.get(name)
+    return getattr(obj, name, None)
+
+
+# 当前请求的用量累计器；asyncio 任务创建时复制上下文，Agent 内部的 LLM 调用都能取到
+_current_usage: ContextVar[Optional[TokenUsage]] = ContextVar("llm_token_usage", default=None)
+
+
+def start_usage_tracking() -> TokenUsage:
+    """在当前上下文中开始统计 token 用量"""
+    usage = TokenUsage()
+    _current_usage.set(usage)
+    return usage
+
+
+class _UsageRecordingCompletions:
+    """包装 openai 的 AsyncCompletions：透传调用，从响应中记录 usage，并为每次调用计时"""
+
+    def __init__(self, completions: Any):
+        self._completions = completions
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._completions, name)
+
+    async def create(self, *args, **kwargs):
+        start = time.perf_counter()
+        response = await self._completions.create(*args, **kwargs)
+        usage = _current_usage.get()
+        if not kwargs.get("stream"):
+            if usage is not None:
+                usage.add(getattr(response, "usage", None))
+            record_span("llm", start, time.perf_counter() - start, model=kwargs.get("model"), stream=False)
+            return response
+        return _record_stream(response, usage, start, kwargs.get("model"))
+
+
+async def _record_stream(stream: Any, usage: Optional[TokenUsage], start: float, model: Optional[str] = None):
+    """逐块透传流式响应；开启 include_usage 时最后一块（choices 为空）携带 usage"""
+    first_chunk = None
+    chunks = 0
+    try:
+        async for chunk in stream:
+            if first_chunk is None:
+                first_chunk = time.perf_counter()
+                LLM_TTFT_SECONDS.observe(first_chunk - start)
+            chunks += 1
+            if usage is not None:
+                chunk_usage = _field(chunk, "usage")
+                if chunk_usage is not None:
+                    usage.add(chunk_usage)
+            yield chunk
+    finally:
+        attrs = {"model": model, "stream": True, "chunks": chunks}
+        if first_chunk is not None:
+            attrs["ttft_ms"] = round((first_chunk - start) * 1000, 2)
+        record_span("llm", start, time.perf_counter() - start, **attrs)
+        # 被取消或提前结束时立即关闭上游 HTTP 响应，不等待垃圾回收
+        response = getattr(stream, "response", None)
+        if response is not None:
+            await response.aclose()
+
+
+def instrument_llm(llm: Any) -> Any:
+    """
+    为 ChatOpenAI 的异步客户端加上 usage 统计
+
+    Args:
+        llm: ChatOpenAI 实例（需通过 model_kwargs 开启 stream_options.include_usage）
+
+    Returns:
+        同一个 llm 实例
+    """
+    if not isinstance(llm.async_client, _UsageRecordingCompletions):
+        llm.async_client = _UsageRecordingCompletions(llm.async_client)
+    return llm
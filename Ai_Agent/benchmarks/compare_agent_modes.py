@@ -0,0 +1,149 @@
+"""ReAct 与原生函数调用两种 Agent 模式的对比测试
+
+对同一组问题分别用两种模式运行，统计每轮的 LLM 调用次数、token 用量、
+首 token 时间和端到端延迟。需要可用的 OpenAI 兼容接口（读取 .env）。
+
+用法:
+    python benchmarks/compare_agent_modes.py
+    python benchmarks/compare_agent_modes.py --questions questions.txt --runs 3 --with-rag --output result.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dotenv import load_dotenv
+
+
+DEFAULT_QUESTIONS = [
+    "你好，今天有点累",
+    "脑机接口中常用的 P300 范式是什么原理？",
+    "知识库里关于电极阻抗的要求是怎样的？",
+    "最近有哪些脑机接口的新闻？",
+    "SSVEP 和运动想象两种范式各有什么优缺点？",
+]
+
+
+def percentile(values, q):
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(q / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+async def run_turn(agent, question: str) -> dict:
+    """运行一轮对话，记录首 token 时间、总延迟和 token 用量"""
+    start = time.perf_counter()
+    first_token = None
+    record = {"question": question, "error": None, "usage": {}}
+    async for event in agent.chat_stream(question, use_cache=False):
+        if event["type"] == "content" and first_token is None:
+            first_token = time.perf_counter() - start
+        elif event["type"] == "complete":
+            record["usage"] = event.get("usage", {})
+            record["output_chars"] = len(event.get("output", ""))
+        elif event["type"] == "error":
+            record["error"] = event.get("message")
+    record["ttft"] = first_token
+    record["latency"] = time.perf_counter() - start
+    return record
+
+
+def summarize(records: list) -> dict:
+    ok = [r for r in records if not r["error"]]
+
+    def mean(key):
+        values = [r["usage"].get(key, 0) for r in ok]
+        return round(statistics.mean(values), 2) if values else None
+
+    latencies = [r["latency"] for r in ok]
+    ttfts = [r["ttft"] for r in ok if r["ttft"] is not None]
+    return {
+        "turns": len(records),
+        "errors": len(records) - len(ok),
+        "llm_calls_per_turn": mean("llm_calls"),
+        "prompt_tokens_per_turn": mean("prompt_tokens"),
+        "completion_tokens_per_turn": mean("completion_tokens"),
+        "cached_tokens_per_turn": mean("cached_tokens"),
+        "latency_p50": percentile(latencies, 50),
+        "latency_p95": percentile(latencies, 95),
+        "latency_mean": round(statistics.mean(latencies), 3) if latencies else None,
+        "ttft_p50": percentile(ttfts, 50),
+        "ttft_mean": round(statistics.mean(ttfts), 3) if ttfts else None,
+    }
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="对比 react 与 tools 两种 Agent 模式")
+    parser.add_argument("--questions", help="问题文件（每行一个）")
+    parser.add_argument("--runs", type=int, default=1, help="每个问题运行次数")
+    parser.add_argument("--with-rag", action="store_true", help="启用知识库检索工具（读取 QDRANT_* 配置）")
+    parser.add_argument("--with-search", action="store_true", help="启用网络搜索工具")
+    parser.add_argument("--router", action="store_true", help="保留快速路由（默认关闭，所有问题都走 Agent）")
+    parser.add_argument("--output", help="结果 JSON 输出路径")
+    args = parser.parse_args()
+
+    load_dotenv()
+    if not args.router:
+        os.environ["ROUTER_ENABLED"] = "false"
+
+    from agent import LangChainAgent
+
+    questions = DEFAULT_QUESTIONS
+    if args.questions:
+        with open(args.questions, encoding="utf-8") as f:
+            questions = [line.strip() for line in f if line.strip()]
+
+    rag_retriever = None
+    if args.with_rag:
+        from tools.rag import RAGRetriever
+        rag_retriever = RAGRetriever(
+            collection_name=os.getenv("QDRANT_COLLECTION", "knowledge_base"),
+            qdrant_url=os.getenv("QDRANT_URL"),
+            qdrant_path=os.getenv("QDRANT_PATH"),
+            qdrant_api_key=os.getenv("QDRANT_API_KEY"),
+            registry_path=os.getenv("DOCUMENT_REGISTRY_PATH"),
+        )
+
+    search_tool = None
+    if args.with_search:
+        from tools import SearchTool
+        search_tool = SearchTool()
+
+    report = {"questions": questions, "runs": args.runs, "modes": {}}
+    for mode in ("react", "tools"):
+        agent = LangChainAgent(rag_retriever=rag_retriever, search_tool=search_tool, agent_mode=mode)
+        records = []
+        for _ in range(args.runs):
+            for question in questions:
+                record = await run_turn(agent, question)
+                records.append(record)
+                print(f"[{mode}] {record['latency']:.2f}s calls={record['usage'].get('llm_calls')} {question}")
+        report["modes"][mode] = {"summary": summarize(records), "turns": records}
+
+    print()
+    print(f"{'metric':<28}{'react':>14}{'tools':>14}")
+    for key in report["modes"]["react"]["summary"]:
+        react_value = report["modes"]["react"]["summary"][key]
+        tools_value = report["modes"]["tools"]["summary"][key]
+        print(f"{key:<28}{str(react_value):>14}{str(tools_value):>14}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"\nSaved to {args.output}")
+
+    if search_tool:
+        await search_tool.aclose()
+    if rag_retriever:
+        await rag_retriever.aclose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,263 @@
+"""本地 OpenAI 兼容桩服务 - 以可配置的延迟流式返回 token，用于压测
+
+支持:
+- POST /v1/chat/completions（流式/非流式；ReAct 文本格式与原生 tools 两种 Agent 模式）
+- POST /v1/embeddings（按输入哈希生成确定性的单位向量）
+- GET /v1/models（预热时用于建立连接）
+
+用法（单独启动）:
+    python benchmarks/fake_openai.py --port 9100 --ttft-ms 300 --token-ms 20 --tokens 120
+"""
+from typing import Any, Dict, List, Optional
+from dataclasses import dataclass
+import argparse
+import asyncio
+import base64
+import hashlib
+import json
+import random
+import re
+import time
+
+import numpy as np
+from fastapi import APIRouter, FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+
+# 回答 token 池：每个 token 一个汉字，客户端按字符数即可还原 token 数
+_TOKEN_POOL = "脑机接口通过采集神经信号实现大脑与外部设备之间的直接通信常见范式包括运动想象稳态视觉诱发电位和事件相关电位"
+
+_QUESTION = re.compile(r"Question: (.*?)\nThought:", re.S)
+
+
+@dataclass
+class FakeLLMConfig:
+    """桩服务行为配置"""
+    ttft_ms: float = 300.0          # 首 token 延迟
+    token_ms: float = 20.0          # token 间隔
+    tokens: int = 120               # 最终回答的 token 数
+    tool_rate: float = 0.5          # 首轮推理决定调用 knowledge_search 的比例
+    embed_ms: float = 30.0          # 嵌入请求延迟
+    embed_dim: int = 1536
+    search_ms: float = 150.0        # 搜索桩延迟
+    seed: int = 42
+
+
+class _PrefixCache:
+    """模拟服务端 prompt 前缀缓存：以 1024 token 为起点、128 token 为粒度命中"""
+
+    def __init__(self):
+        self._seen = set()
+
+    def cached_tokens(self, prompt: str, prompt_tokens: int) -> int:
+        if prompt_tokens < 1024:
+            return 0
+        blocks = prompt_tokens // 128
+        # 逐级检查前缀块是否见过（按字符近似切分）
+        chars_per_token = max(1, len(prompt) // prompt_tokens)
+        cached = 0
+        for block in range(8, blocks + 1):
+            key = hashlib.sha1(prompt[:block * 128 * chars_per_token].encode("utf-8")).hexdigest()
+            if key in self._seen:
+                cached = block * 128
+            self._seen.add(key)
+        return cached
+
+
+def _prompt_text(messages: List[Dict[str, Any]]) -> str:
+    parts = []
+    for message in messages:
+        content = message.get("content")
+        if isinstance(content, str):
+            parts.append(content)
+    return "\n".join(parts)
+
+
+def _answer(config: FakeLLMConfig) -> List[str]:
+    start = random.randrange(len(_TOKEN_POOL))
+    return [_TOKEN_POOL[(start + i) % len(_TOKEN_POOL)] for i in range(config.tokens)]
+
+
+def _plan_response(body: Dict[str, Any], config: FakeLLMConfig) -> Dict[str, Any]:
+    """
+    决定本次调用返回什么
+
+    Returns:
+        {"text": [token...]} 或 {"tool_call": (name, arguments)}
+    """
+    messages = body.get("messages", [])
+    prompt = _prompt_text(messages)
+
+    if body.get("tools"):
+        # 原生函数调用：还没有工具结果时按比例发起工具调用
+        has_tool_result = any(m.get("role") == "tool" for m in messages)
+        if not has_tool_result and random.random() < config.tool_rate:
+            question = next((m.get("content", "") for m in reversed(messages) if m.get("role") == "user"), "")
+            return {"tool_call": ("knowledge_search", json.dumps({"__arg1": question}, ensure_ascii=False))}
+        return {"text": _answer(config)}
+
+    if "Final Answer:" in prompt and "Action Input:" in prompt:
+        # ReAct：首轮按比例输出 Action，拿到 Observation 后输出最终答案
+        scratchpad = prompt.rsplit("Thought:", 1)[-1]
+        if "Observation:" not in scratchpad and random.random() < config.tool_rate:
+            match = _QUESTION.findall(prompt)
+            question = match[-1].strip() if match else "脑机接口"
+            text = f"我需要查询知识库\nAction: knowledge_search\nAction Input: {question}"
+            return {"text": list(text)}
+        return {"text": list("我现在知道最终答案了\nFinal Answer: ") + _answer(config)}
+
+    return {"text": _answer(config)}
+
+
+def create_router(config: FakeLLMConfig) -> APIRouter:
+    """OpenAI 兼容接口路由"""
+    router = APIRouter()
+    prefix_cache = _PrefixCache()
+
+    def usage_for(prompt: str, completion_tokens: int) -> Dict[str, Any]:
+        prompt_tokens = max(1, len(prompt) // 2)
+        return {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+            "prompt_tokens_details": {"cached_tokens": prefix_cache.cached_tokens(prompt, prompt_tokens)},
+        }
+
+    @router.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        model = body.get("model", "fake-model")
+        plan = _plan_response(body, config)
+        prompt = _prompt_text(body.get("messages", []))
+        created = int(time.time())
+
+        if not body.get("stream"):
+            await asyncio.sleep(config.ttft_ms / 1000)
+            message: Dict[str, Any] = {"role": "assistant", "content": None}
+            if "tool_call" in plan:
+                name, arguments = plan["tool_call"]
+                message["tool_calls"] = [{
+                    "id": "call_fake", "type": "function",
+                    "function": {"name": name, "arguments": arguments},
+                }]
+                finish_reason, completion_tokens = "tool_calls", 16
+            else:
+                message["content"] = "".join(plan["text"])
+                finish_reason, completion_tokens = "stop", len(plan["text"])
+            return JSONResponse({
+                "id": "chatcmpl-fake", "object": "chat.completion", "created": created, "model": model,
+                "choices": [{"index": 0, "message": message, "finish_reason": finish_reason}],
+                "usage": usage_for(prompt, completion_tokens),
+            })
+
+        include_usage = (body.get("stream_options") or {}).get("include_usage", False)
+
+        def chunk(delta: Dict[str, Any], finish_reason: Optional[str] = None) -> str:
+            return "data: " + json.dumps({
+                "id": "chatcmpl-fake", "object": "chat.completion.chunk", "created": created, "model": model,
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+            }, ensure_ascii=False) + "\n\n"
+
+        async def stream():
+            await asyncio.sleep(config.ttft_ms / 1000)
+            if "tool_call" in plan:
+                name, arguments = plan["tool_call"]
+                yield chunk({"role": "assistant", "content": None, "tool_calls": [{
+                    "index": 0, "id": "call_fake", "type": "function",
+                    "function": {"name": name, "arguments": arguments},
+                }]})
+                yield chunk({}, "tool_calls")
+                completion_tokens = 16
+            else:
+                tokens = plan["text"]
+                for i, token in enumerate(tokens):
+                    if i and config.token_ms > 0:
+                        await asyncio.sleep(config.token_ms / 1000)
+                    yield chunk({"role": "assistant", "content": token} if i == 0 else {"content": token})
+                yield chunk({}, "stop")
+                completion_tokens = len(tokens)
+            if include_usage:
+                yield "data: " + json.dumps({
+                    "id": "chatcmpl-fake", "object": "chat.completion.chunk", "created": created, "model": model,
+                    "choices": [], "usage": usage_for(prompt, completion_tokens),
+                }) + "\n\n"
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(stream(), media_type="text/event-stream")
+
+    @router.get("/v1/models")
+    async def models():
+        return JSONResponse({"object": "list", "data": [
+            {"id": "fake-model", "object": "model", "created": 0, "owned_by": "benchmark"},
+        ]})
+
+    @router.post("/v1/embeddings")
+    async def embeddings(request: Request):
+        body = await request.json()
+        inputs = body.get("input", [])
+        if not isinstance(inputs, list) or (inputs and isinstance(inputs[0], int)):
+            inputs = [inputs]
+        await asyncio.sleep(config.embed_ms / 1000)
+
+        data = []
+        for i, item in enumerate(inputs):
+            seed = int.from_bytes(hashlib.sha256(repr(item).encode("utf-8")).digest()[:8], "little")
+            vector = np.random.default_rng(seed).standard_normal(config.embed_dim).astype(np.float32)
+            vector /= np.linalg.norm(vector)
+            if body.get("encoding_format") == "base64":
+                embedding: Any = base64.b64encode(vector.tobytes()).decode("ascii")
+            else:
+                embedding = vector.tolist()
+            data.append({"object": "embedding", "index": i, "embedding": embedding})
+
+        return JSONResponse({
+            "object": "list", "data": data, "model": body.get("model", "fake-embedding"),
+            "usage": {"prompt_tokens": len(inputs) * 8, "total_tokens": len(inputs) * 8},
+        })
+
+    return router
+
+
+def create_app(config: FakeLLMConfig) -> FastAPI:
+    """桩服务应用：OpenAI 兼容接口 + 搜索桩"""
+    from stub_search import create_router as create_search_router
+
+    random.seed(config.seed)
+    app = FastAPI(title="Fake OpenAI / SerpAPI")
+    app.include_router(create_router(config))
+    app.include_router(create_search_router(config.search_ms))
+    return app
+
+
+def add_config_arguments(parser: argparse.ArgumentParser):
+    """把 FakeLLMConfig 的字段注册为命令行参数"""
+    defaults = FakeLLMConfig()
+    parser.add_argument("--ttft-ms", type=float, default=defaults.ttft_ms, help="首 token 延迟（毫秒）")
+    parser.add_argument("--token-ms", type=float, default=defaults.token_ms, help="token 间隔（毫秒）")
+    parser.add_argument("--tokens", type=int, default=defaults.tokens, help="每个回答的 token 数")
+    parser.add_argument("--tool-rate", type=float, default=defaults.tool_rate, help="调用知识库工具的比例")
+    parser.add_argument("--embed-ms", type=float, default=defaults.embed_ms, help="嵌入请求延迟（毫秒）")
+    parser.add_argument("--search-ms", type=float, default=defaults.search_ms, help="搜索桩延迟（毫秒）")
+    parser.add_argument("--seed", type=int, default=defaults.seed)
+
+
+def config_from_args(args: argparse.Namespace) -> FakeLLMConfig:
+    return FakeLLMConfig(
+        ttft_ms=args.ttft_ms,
+        token_ms=args.token_ms,
+        tokens=args.tokens,
+        tool_rate=args.tool_rate,
+        embed_ms=args.embed_ms,
+        search_ms=args.search_ms,
+        seed=args.seed,
+    )
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="本地 OpenAI 兼容桩服务")
+    parser.add_argument("--port", type=int, default=9100)
+    add_config_arguments(parser)
+    args = parser.parse_args()
+    uvicorn.run(create_app(config_from_args(args)), host="127.0.0.1", port=args.port, log_level="warning")
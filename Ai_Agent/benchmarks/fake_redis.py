@@ -0,0 +1,360 @@
+"""进程内 Redis 替身 - 实现会话记忆用到的 RESP2 命令子集，用于压测
+
+支持: PING ECHO SELECT CLIENT GET SET(NX/EX/PX) DEL EXISTS EXPIRE INCR INCRBY
+      LPUSH RPUSH LTRIM LRANGE LLEN MULTI EXEC DISCARD WATCH UNWATCH
+      PUBLISH SUBSCRIBE UNSUBSCRIBE PSUBSCRIBE PUNSUBSCRIBE FLUSHDB FLUSHALL
+
+用法（单独启动）:
+    python benchmarks/fake_redis.py --port 6390
+"""
+from typing import Any, Dict, List, Optional, Set
+import argparse
+import asyncio
+import time
+
+
+class _Error(str):
+    """RESP 错误回复"""
+
+
+class _Status(str):
+    """RESP 简单字符串回复"""
+
+
+OK = _Status("OK")
+QUEUED = _Status("QUEUED")
+
+
+def _encode(value: Any) -> bytes:
+    if isinstance(value, _Error):
+        return b"-" + value.encode() + b"\r\n"
+    if isinstance(value, _Status):
+        return b"+" + value.encode() + b"\r\n"
+    if value is None:
+        return b"$-1\r\n"
+    if isinstance(value, bool):
+        return b":%d\r\n" % int(value)
+    if isinstance(value, int):
+        return b":%d\r\n" % value
+    if isinstance(value, (list, tuple)):
+        return b"*%d\r\n" % len(value) + b"".join(_encode(item) for item in value)
+    if isinstance(value, str):
+        value = value.encode()
+    return b"$%d\r\n" % len(value) + value + b"\r\n"
+
+
+class _Connection:
+    def __init__(self, writer: asyncio.StreamWriter):
+        self.writer = writer
+        self.transaction: Optional[List[List[bytes]]] = None
+        # WATCH 的键 -> WATCH 时的写入序号
+        self.watched: Dict[bytes, int] = {}
+        self.channels: Set[bytes] = set()
+        self.patterns: Set[bytes] = set()
+
+    def send(self, value: Any):
+        self.writer.write(_encode(value))
+
+
+class FakeRedisServer:
+    """单线程的内存 Redis 替身（所有命令在事件循环中串行执行，天然原子）"""
+
+    def __init__(self):
+        self.data: Dict[bytes, Any] = {}
+        self.expires: Dict[bytes, float] = {}
+        self.subscribers: Dict[bytes, Set[_Connection]] = {}
+        # 写入序号：每个键最近一次被修改时的序号，FLUSHDB 修改全部键
+        self._writes = 0
+        self._modified: Dict[bytes, int] = {}
+        self._flushed = 0
+        self.commands = 0
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._connections: Set[_Connection] = set()
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> int:
+        """启动监听，返回实际端口"""
+        self._server = await asyncio.start_server(self._handle, host, port)
+        return self._server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        if self._server is not None:
+            self._server.close()
+            for conn in list(self._connections):
+                conn.writer.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    async def _read_command(self, reader: asyncio.StreamReader) -> Optional[List[bytes]]:
+        line = await reader.readline()
+        if not line:
+            return None
+        if not line.startswith(b"*"):
+            return line.strip().split()
+        args = []
+        for _ in range(int(line[1:])):
+            header = await reader.readline()
+            length = int(header[1:])
+            payload = await reader.readexactly(length + 2)
+            args.append(payload[:-2])
+        return args
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        conn = _Connection(writer)
+        self._connections.add(conn)
+        try:
+            while True:
+                args = await self._read_command(reader)
+                if args is None:
+                    break
+                if not args:
+                    continue
+                self._dispatch(conn, args)
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.CancelledError):
+            pass
+        finally:
+            self._connections.discard(conn)
+            for channel in conn.channels:
+                self.subscribers.get(channel, set()).discard(conn)
+            writer.close()
+
+    def _dispatch(self, conn: _Connection, args: List[bytes]):
+        self.commands += 1
+        name = args[0].upper().decode()
+
+        if conn.transaction is not None and name not in ("EXEC", "DISCARD", "MULTI", "WATCH"):
+            conn.transaction.append(args)
+            conn.send(QUEUED)
+            return
+
+        if name == "MULTI":
+            conn.transaction = []
+            conn.send(OK)
+        elif name == "EXEC":
+            queued, conn.transaction = conn.transaction or [], None
+            watched, conn.watched = conn.watched, {}
+            if any(self._modified_since(key, seen) for key, seen in watched.items()):
+                # 被 WATCH 的键已被修改，事务不执行
+                conn.send(None)
+            else:
+                conn.send([self._execute(conn, cmd) for cmd in queued])
+        elif name == "DISCARD":
+            conn.transaction = None
+            conn.watched = {}
+            conn.send(OK)
+        elif name == "WATCH":
+            if conn.transaction is not None:
+                conn.send(_Error("ERR WATCH inside MULTI is not allowed"))
+            else:
+                for key in args[1:]:
+                    conn.watched.setdefault(key, self._writes)
+                conn.send(OK)
+        elif name == "UNWATCH":
+            conn.watched = {}
+            conn.send(OK)
+        elif name in ("SUBSCRIBE", "PSUBSCRIBE"):
+            targets = conn.channels if name == "SUBSCRIBE" else conn.patterns
+            for channel in args[1:]:
+                targets.add(channel)
+                if name == "SUBSCRIBE":
+                    self.subscribers.setdefault(channel, set()).add(conn)
+                conn.send([name.lower(), channel, len(conn.channels) + len(conn.patterns)])
+        elif name in ("UNSUBSCRIBE", "PUNSUBSCRIBE"):
+            targets = conn.channels if name == "UNSUBSCRIBE" else conn.patterns
+            channels = args[1:] or list(targets)
+            if not channels:
+                conn.send([name.lower(), None, 0])
+            for channel in channels:
+                targets.discard(channel)
+                self.subscribers.get(channel, set()).discard(conn)
+                conn.send([name.lower(), channel, len(conn.channels) + len(conn.patterns)])
+        elif name == "PING" and (conn.channels or conn.patterns):
+            conn.send([b"pong", args[1] if len(args) > 1 else b""])
+        else:
+            conn.send(self._execute(conn, args))
+
+    def _modified_since(self, key: bytes, seen: int) -> bool:
+        return max(self._flushed, self._modified.get(key, 0)) > seen
+
+    def _touch(self, key: bytes):
+        self._writes += 1
+        self._modified[key] = self._writes
+
+    def _alive(self, key: bytes) -> bool:
+        expires_at = self.expires.get(key)
+        if expires_at is not None and expires_at <= time.monotonic():
+            self.data.pop(key, None)
+            self.expires.pop(key, None)
+        return key in self.data
+
+    def _list(self, key: bytes) -> List[bytes]:
+        if not self._alive(key):
+            self.data[key] = []
+        value = self.data[key]
+        if not isinstance(value, list):
+            raise TypeError
+        return value
+
+    def _execute(self, conn: _Connection, args: List[bytes]) -> Any:
+        name = args[0].upper().decode()
+        try:
+            handler = getattr(self, f"_cmd_{name.lower()}", None)
+            if handler is None:
+                return _Error(f"ERR unknown command '{name}'")
+            return handler(*args[1:])
+        except TypeError:
+            return _Error("WRONGTYPE Operation against a key holding the wrong kind of value")
+        except (ValueError, IndexError):
+            return _Error("ERR syntax error")
+
+    # ---- 连接与服务器 ----
+    def _cmd_ping(self, *args):
+        return args[0] if args else _Status("PONG")
+
+    def _cmd_echo(self, message):
+        return message
+
+    def _cmd_select(self, db):
+        return OK
+
+    def _cmd_client(self, *args):
+        return OK
+
+    def _cmd_flushdb(self, *args):
+        self._writes += 1
+        self._flushed = self._writes
+        self._modified.clear()
+        self.data.clear()
+        self.expires.clear()
+        return OK
+
+    _cmd_flushall = _cmd_flushdb
+
+    # ---- 字符串 ----
+    def _cmd_get(self, key):
+        if not self._alive(key):
+            return None
+        value = self.data[key]
+        if isinstance(value, list):
+            raise TypeError
+        return value
+
+    def _cmd_set(self, key, value, *options):
+        options = [opt.upper() for opt in options]
+        ttl = None
+        nx = xx = False
+        i = 0
+        while i < len(options):
+            opt = options[i]
+            if opt == b"NX":
+                nx = True
+            elif opt == b"XX":
+                xx = True
+            elif opt in (b"EX", b"PX"):
+                amount = float(options[i + 1])
+                ttl = amount if opt == b"EX" else amount / 1000
+                i += 1
+            else:
+                raise ValueError
+            i += 1
+        exists = self._alive(key)
+        if (nx and exists) or (xx and not exists):
+            return None
+        self.data[key] = value
+        self._touch(key)
+        self.expires.pop(key, None)
+        if ttl is not None:
+            self.expires[key] = time.monotonic() + ttl
+        return OK
+
+    def _cmd_incr(self, key):
+        return self._cmd_incrby(key, b"1")
+
+    def _cmd_incrby(self, key, amount):
+        value = int(self._cmd_get(key) or 0) + int(amount)
+        self.data[key] = str(value).encode()
+        self._touch(key)
+        return value
+
+    def _cmd_del(self, *keys):
+        removed = 0
+        for key in keys:
+            if self._alive(key):
+                removed += 1
+                del self.data[key]
+                self.expires.pop(key, None)
+                self._touch(key)
+        return removed
+
+    def _cmd_exists(self, *keys):
+        return sum(1 for key in keys if self._alive(key))
+
+    def _cmd_expire(self, key, seconds):
+        if not self._alive(key):
+            return 0
+        self.expires[key] = time.monotonic() + int(seconds)
+        self._touch(key)
+        return 1
+
+    # ---- 列表 ----
+    def _cmd_lpush(self, key, *values):
+        items = self._list(key)
+        for value in values:
+            items.insert(0, value)
+        self._touch(key)
+        return len(items)
+
+    def _cmd_rpush(self, key, *values):
+        items = self._list(key)
+        items.extend(values)
+        self._touch(key)
+        return len(items)
+
+    @staticmethod
+    def _range(length: int, start: int, stop: int):
+        if start < 0:
+            start = max(length + start, 0)
+        if stop < 0:
+            stop = length + stop
+        return start, min(stop, length - 1)
+
+    def _cmd_lrange(self, key, start, stop):
+        if not self._alive(key):
+            return []
+        items = self._list(key)
+        start, stop = self._range(len(items), int(start), int(stop))
+        return items[start:stop + 1] if start <= stop else []
+
+    def _cmd_ltrim(self, key, start, stop):
+        if not self._alive(key):
+            return OK
+        items = self._list(key)
+        start, stop = self._range(len(items), int(start), int(stop))
+        items[:] = items[start:stop + 1] if start <= stop else []
+        self._touch(key)
+        if not items:
+            del self.data[key]
+        return OK
+
+    def _cmd_llen(self, key):
+        return len(self._list(key)) if self._alive(key) else 0
+
+    # ---- 发布订阅 ----
+    def _cmd_publish(self, channel, message):
+        receivers = list(self.subscribers.get(channel, ()))
+        for conn in receivers:
+            conn.send([b"message", channel, message])
+        return len(receivers)
+
+
+async def _main(port: int):
+    server = FakeRedisServer()
+    actual = await server.start(port=port)
+    print(f"Fake Redis listening on 127.0.0.1:{actual}")
+    await asyncio.Event().wait()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="进程内 Redis 替身")
+    parser.add_argument("--port", type=int, default=6390)
+    asyncio.run(_main(parser.parse_args().port))
@@ -0,0 +1,445 @@
+"""/ws/chat 端到端压测
+
+启动本地桩服务（OpenAI 兼容接口 + SerpAPI 搜索桩）和进程内 Redis 替身，
+以子进程方式启动 server.py 并指向这些桩，然后用 N 个并发 WebSocket 会话驱动对话。
+
+报告（JSON）:
+- 首 token 时间（TTFT）与单轮延迟的 p50/p95/p99
+- 每轮输出速率（tokens/sec，桩服务每个 token 是一个汉字）
+- 服务端事件循环延迟（空闲基线之上的 /api 探测往返时间）
+- 服务进程 RSS 基线、峰值与每会话内存
+
+用法:
+    python benchmarks/load_test.py --sessions 50 --turns 5 --output results/run.json
+    python benchmarks/load_test.py --sessions 200 --ttft-ms 500 --token-ms 30 --server-env AGENT_MODE=tools
+"""
+from typing import Any, Dict, List, Optional
+import argparse
+import asyncio
+import json
+import os
+import platform
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import httpx
+import websockets
+
+from fake_openai import FakeLLMConfig, add_config_arguments, config_from_args, create_app
+from fake_redis import FakeRedisServer
+
+
+SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+DEFAULT_QUESTIONS = [
+    "脑机接口中常用的 P300 范式是什么原理？",
+    "知识库里关于电极阻抗的要求是怎样的？",
+    "SSVEP 和运动想象两种范式各有什么优缺点？",
+    "最近有哪些脑机接口的新闻？",
+    "EEG 信号预处理一般包括哪些步骤？",
+]
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def percentiles(values: List[float]) -> Dict[str, Optional[float]]:
+    """p50/p95/p99（最近秩法），单位与输入一致"""
+    if not values:
+        return {"p50": None, "p95": None, "p99": None, "mean": None, "max": None}
+    ordered = sorted(values)
+
+    def rank(q: float) -> float:
+        return round(ordered[min(len(ordered) - 1, int(q / 100 * len(ordered)))], 4)
+
+    return {
+        "p50": rank(50),
+        "p95": rank(95),
+        "p99": rank(99),
+        "mean": round(statistics.mean(ordered), 4),
+        "max": round(ordered[-1], 4),
+    }
+
+
+class StubServices:
+    """在后台线程（独立事件循环）中运行桩服务和 Redis 替身，避免与压测客户端争用事件循环"""
+
+    def __init__(self, config: FakeLLMConfig):
+        self.config = config
+        self.http_port = _free_port()
+        self.redis_port = 0
+        self.redis: Optional[FakeRedisServer] = None
+        self._uvicorn = None
+        self._ready = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self._thread.start()
+        if not self._ready.wait(timeout=30):
+            raise RuntimeError("stub services failed to start")
+
+    def stop(self):
+        if self._uvicorn is not None:
+            self._uvicorn.should_exit = True
+        self._thread.join(timeout=10)
+
+    def _run(self):
+        asyncio.run(self._serve())
+
+    async def _serve(self):
+        import uvicorn
+
+        self.redis = FakeRedisServer()
+        self.redis_port = await self.redis.start()
+        config = uvicorn.Config(
+            create_app(self.config), host="127.0.0.1", port=self.http_port, log_level="warning"
+        )
+        self._uvicorn = uvicorn.Server(config)
+        serve = asyncio.create_task(self._uvicorn.serve())
+        while not self._uvicorn.started:
+            await asyncio.sleep(0.05)
+        self._ready.set()
+        await serve
+        await self.redis.stop()
+
+
+class ServerProcess:
+    """以子进程方式运行 server.py（uvicorn），环境变量指向本地桩"""
+
+    def __init__(self, port: int, env: Dict[str, str], log_path: str):
+        self.port = port
+        self.env = env
+        self.log_path = log_path
+        self.process: Optional[subprocess.Popen] = None
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self.port}"
+
+    def start(self):
+        self._log = open(self.log_path, "w", encoding="utf-8")
+        self.process = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "server:app", "--host", "127.0.0.1",
+             "--port", str(self.port), "--log-level", "warning"],
+            cwd=SERVER_DIR,
+            env={**os.environ, **self.env},
+            stdout=self._log,
+            stderr=subprocess.STDOUT,
+        )
+
+    async def wait_ready(self, timeout: float = 120.0, path: str = "/api") -> float:
+        """等待 path 返回 200，返回从调用开始的耗时（秒）"""
+        start = time.perf_counter()
+        async with httpx.AsyncClient() as client:
+            while time.perf_counter() - start < timeout:
+                if self.process.poll() is not None:
+                    raise RuntimeError(f"server exited with code {self.process.returncode}, see {self.log_path}")
+                try:
+                    response = await client.get(f"{self.base_url}{path}", timeout=1.0)
+                    if response.status_code == 200:
+                        return time.perf_counter() - start
+                except httpx.HTTPError:
+                    pass
+                await asyncio.sleep(0.2)
+        raise TimeoutError(f"server not ready after {timeout}s, see {self.log_path}")
+
+    def rss_bytes(self) -> Optional[int]:
+        """读取服务进程常驻内存（Linux /proc，其他平台尝试 psutil）"""
+        if self.process is None:
+            return None
+        try:
+            with open(f"/proc/{self.process.pid}/status") as f:
+                for line in f:
+                    if line.startswith("VmRSS:"):
+                        return int(line.split()[1]) * 1024
+        except OSError:
+            pass
+        try:
+            import psutil
+            return psutil.Process(self.process.pid).memory_info().rss
+        except Exception:
+            return None
+
+    def stop(self):
+        if self.process and self.process.poll() is None:
+            self.process.terminate()
+            try:
+                self.process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+        self._log.close()
+
+
+class Monitor:
+    """压测期间的服务端采样：事件循环延迟探测与 RSS"""
+
+    def __init__(self, server: ServerProcess, interval: float = 0.1):
+        self.server = server
+        self.interval = interval
+        self.probe_ms: List[float] = []
+        self.rss: List[int] = []
+        self.baseline_probe_ms = 0.0
+        self._task: Optional[asyncio.Task] = None
+
+    async def calibrate(self, samples: int = 20):
+        """空闲时的探测往返时间作为基线"""
+        async with httpx.AsyncClient() as client:
+            timings = []
+            for _ in range(samples):
+                start = time.perf_counter()
+                await client.get(f"{self.server.base_url}/api")
+                timings.append((time.perf_counter() - start) * 1000)
+                await asyncio.sleep(0.02)
+        self.baseline_probe_ms = min(timings)
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+    async def _run(self):
+        async with httpx.AsyncClient() as client:
+            while True:
+                start = time.perf_counter()
+                try:
+                    await client.get(f"{self.server.base_url}/api", timeout=10.0)
+                    self.probe_ms.append((time.perf_counter() - start) * 1000)
+                except httpx.HTTPError:
+                    pass
+                rss = self.server.rss_bytes()
+                if rss is not None:
+                    self.rss.append(rss)
+                await asyncio.sleep(self.interval)
+
+    def loop_lag_ms(self) -> List[float]:
+        return [max(0.0, value - self.baseline_probe_ms) for value in self.probe_ms]
+
+
+async def run_session(
+    ws_url: str,
+    index: int,
+    turns: int,
+    questions: List[str],
+    no_cache: bool,
+    think_time: float,
+    results: List[Dict[str, Any]],
+):
+    """一个 WebSocket 会话，依次发送 turns 个问题"""
+    session_id = f"bench_{index}"
+    try:
+        async with websockets.connect(ws_url, max_size=None, open_timeout=30) as ws:
+            for turn in range(turns):
+                request_id = f"s{index}t{turn}"
+                question = questions[(index + turn) % len(questions)]
+                record: Dict[str, Any] = {"session": index, "turn": turn, "error": None}
+                chars = 0
+                first = last = None
+                start = time.perf_counter()
+                await ws.send(json.dumps({
+                    "type": "query",
+                    "request_id": request_id,
+                    "query": question,
+                    "session_id": session_id,
+                    "no_cache": no_cache,
+                }, ensure_ascii=False))
+                while True:
+                    event = json.loads(await ws.recv())
+                    if event.get("request_id") != request_id:
+                        continue
+                    now = time.perf_counter()
+                    if event["type"] == "content":
+                        if first is None:
+                            first = now
+                        last = now
+                        chars += len(event.get("content", ""))
+                    elif event["type"] == "complete":
+                        record["usage"] = event.get("usage")
+                        record["route"] = event.get("route")
+                        break
+                    elif event["type"] in ("error", "cancelled"):
+                        record["error"] = event.get("message", event["type"])
+                        break
+                end = time.perf_counter()
+                record["latency"] = end - start
+                record["ttft"] = first - start if first is not None else None
+                record["tokens"] = chars
+                streaming = (last - first) if first is not None and last is not None else 0
+                record["tokens_per_sec"] = chars / streaming if streaming > 0 else None
+                results.append(record)
+                if think_time > 0:
+                    await asyncio.sleep(think_time)
+    except Exception as e:
+        results.append({"session": index, "turn": None, "error": f"connection: {e}"})
+
+
+async def upload_knowledge(base_url: str, path: str, timeout: float = 300.0):
+    """上传知识库文件并等待入库完成"""
+    async with httpx.AsyncClient(timeout=60.0) as client:
+        with open(path, "rb") as f:
+            response = await client.post(
+                f"{base_url}/knowledge/upload_file",
+                files={"file": (os.path.basename(path), f)}
+            )
+        response.raise_for_status()
+        job_id = response.json()["job_id"]
+        start = time.perf_counter()
+        while time.perf_counter() - start < timeout:
+            job = (await client.get(f"{base_url}/knowledge/jobs/{job_id}")).json()
+            if job.get("status") in ("completed", "failed"):
+                return job
+            await asyncio.sleep(0.5)
+        raise TimeoutError("knowledge ingestion timed out")
+
+
+def stub_server_env(stubs: StubServices, workdir: str) -> Dict[str, str]:
+    """让 server.py 指向本地桩服务的环境变量"""
+    stub_url = f"http://127.0.0.1:{stubs.http_port}"
+    return {
+        "OPENAI_API_KEY": "sk-fake",
+        "OPENAI_API_BASE": f"{stub_url}/v1",
+        "REDIS_HOST": "127.0.0.1",
+        "REDIS_PORT": str(stubs.redis_port),
+        "REDIS_DB": "0",
+        "SERPAPI_KEY": "fake",
+        "SERPAPI_ENDPOINT": f"{stub_url}/search.json",
+        # 内存模式 Qdrant，不受本地 .env 的持久化配置影响
+        "QDRANT_URL": "",
+        "QDRANT_PATH": "",
+        "DOCUMENT_REGISTRY_PATH": "",
+        "EMBEDDING_CACHE_PATH": os.path.join(workdir, "embeddings.sqlite"),
+        "ROUTER_MODEL": "",
+        "SUMMARY_MODEL": "",
+    }
+
+
+def parse_env_overrides(pairs: List[str]) -> Dict[str, str]:
+    env = {}
+    for pair in pairs:
+        key, _, value = pair.partition("=")
+        env[key] = value
+    return env
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="/ws/chat 端到端压测")
+    parser.add_argument("--sessions", type=int, default=20, help="并发 WebSocket 会话数")
+    parser.add_argument("--turns", type=int, default=3, help="每个会话的对话轮数")
+    parser.add_argument("--ramp-up", type=float, default=2.0, help="所有会话在该秒数内逐步建立")
+    parser.add_argument("--think-time", type=float, default=0.0, help="每轮之间的间隔（秒）")
+    parser.add_argument("--questions", help="问题文件（每行一个）")
+    parser.add_argument("--kb-file", help="压测前上传到知识库的文件")
+    parser.add_argument("--allow-cache", action="store_true", help="允许回答缓存命中（默认每个请求带 no_cache）")
+    parser.add_argument("--server-env", action="append", default=[], metavar="KEY=VALUE",
+                        help="传给 server.py 的额外环境变量，可重复")
+    parser.add_argument("--output", help="结果 JSON 输出路径（默认打印到标准输出）")
+    add_config_arguments(parser)
+    args = parser.parse_args()
+
+    questions = DEFAULT_QUESTIONS
+    if args.questions:
+        with open(args.questions, encoding="utf-8") as f:
+            questions = [line.strip() for line in f if line.strip()]
+
+    llm_config = config_from_args(args)
+    stubs = StubServices(llm_config)
+    stubs.start()
+
+    workdir = tempfile.mkdtemp(prefix="bci_bench_")
+    env = {**stub_server_env(stubs, workdir), **parse_env_overrides(args.server_env)}
+    server = ServerProcess(_free_port(), env, os.path.join(workdir, "server.log"))
+    server.start()
+
+    try:
+        startup_seconds = await server.wait_ready()
+        ingestion = await upload_knowledge(server.base_url, args.kb_file) if args.kb_file else None
+
+        monitor = Monitor(server)
+        await monitor.calibrate()
+        baseline_rss = server.rss_bytes()
+        monitor.start()
+
+        ws_url = f"ws://127.0.0.1:{server.port}/ws/chat"
+        results: List[Dict[str, Any]] = []
+        tasks = []
+        started = time.perf_counter()
+        for index in range(args.sessions):
+            tasks.append(asyncio.create_task(run_session(
+                ws_url, index, args.turns, questions, not args.allow_cache, args.think_time, results
+            )))
+            if args.ramp_up > 0 and args.sessions > 1:
+                await asyncio.sleep(args.ramp_up / args.sessions)
+        await asyncio.gather(*tasks)
+        duration = time.perf_counter() - started
+        await monitor.stop()
+    finally:
+        server.stop()
+        stubs.stop()
+
+    ok = [r for r in results if not r["error"]]
+    peak_rss = max(monitor.rss) if monitor.rss else None
+    report = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "host": {"python": platform.python_version(), "platform": platform.platform(), "cpus": os.cpu_count()},
+        "config": {
+            "sessions": args.sessions,
+            "turns": args.turns,
+            "ramp_up": args.ramp_up,
+            "think_time": args.think_time,
+            "allow_cache": args.allow_cache,
+            "fake_llm": vars(llm_config),
+            "server_env": parse_env_overrides(args.server_env),
+        },
+        "startup_seconds": round(startup_seconds, 3),
+        "ingestion": ingestion,
+        "summary": {
+            "turns_total": len(results),
+            "turns_ok": len(ok),
+            "errors": len(results) - len(ok),
+            "duration_seconds": round(duration, 3),
+            "throughput_turns_per_sec": round(len(ok) / duration, 3) if duration > 0 else None,
+            "ttft_seconds": percentiles([r["ttft"] for r in ok if r.get("ttft") is not None]),
+            "latency_seconds": percentiles([r["latency"] for r in ok]),
+            "tokens_per_sec": percentiles([r["tokens_per_sec"] for r in ok if r.get("tokens_per_sec")]),
+            "event_loop_lag_ms": percentiles(monitor.loop_lag_ms()),
+            "probe_baseline_ms": round(monitor.baseline_probe_ms, 3),
+            "memory": {
+                "baseline_rss_bytes": baseline_rss,
+                "peak_rss_bytes": peak_rss,
+                "per_session_bytes": (peak_rss - baseline_rss) // args.sessions
+                if peak_rss and baseline_rss and args.sessions else None,
+            },
+            "routes": {
+                route: sum(1 for r in ok if r.get("route") == route)
+                for route in sorted({r.get("route") for r in ok if r.get("route")})
+            },
+        },
+        "errors_sample": [r["error"] for r in results if r["error"]][:20],
+        "server_log": server.log_path,
+    }
+
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text)
+        print(f"Saved to {args.output}")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,163 @@
+"""启动耗时基准
+
+测量:
+- 导入 server 模块的耗时（重型依赖延迟导入）与导入完整依赖栈的耗时，以及 -X importtime 中最慢的顶层模块
+- 启动 uvicorn 子进程到 /api 可访问、到 /ready 返回 200 的耗时，以及 /ready 报告的各组件创建与预热耗时
+- 就绪后第一轮与第二轮对话的首 token 时间（对比是否预热）
+
+依赖的 OpenAI / Redis / SerpAPI 都由本地桩提供（见 load_test.py）。
+
+用法:
+    python benchmarks/startup_time.py --runs 3 --output results/startup.json
+"""
+from typing import Any, Dict, List
+import argparse
+import asyncio
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+from fake_openai import add_config_arguments, config_from_args
+from load_test import (
+    SERVER_DIR, DEFAULT_QUESTIONS, StubServices, ServerProcess,
+    _free_port, percentiles, parse_env_overrides, run_session, stub_server_env,
+)
+
+
+def measure_import(statement: str, env: Dict[str, str], top: int = 15) -> Dict[str, Any]:
+    """在新解释器中执行 import 语句，返回墙钟耗时和 -X importtime 中累计耗时最长的顶层模块"""
+    start = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", statement],
+        cwd=SERVER_DIR,
+        env={**os.environ, **env},
+        capture_output=True,
+        text=True,
+    )
+    wall = time.perf_counter() - start
+    if result.returncode != 0:
+        return {"statement": statement, "error": result.stderr.strip().splitlines()[-1:]}
+
+    modules = []
+    for line in result.stderr.splitlines():
+        # 格式: "import time: <self us> | <cumulative us> | <缩进表示嵌套层级的模块名>"
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative_us, name = line[len("import time:"):].split("|", 2)
+        if name.startswith("  "):
+            continue
+        modules.append((name.strip(), int(cumulative_us) / 1e6))
+    modules.sort(key=lambda item: item[1], reverse=True)
+    return {
+        "statement": statement,
+        "wall_seconds": round(wall, 3),
+        "top_modules": [{"module": name, "cumulative_seconds": round(sec, 4)} for name, sec in modules[:top]],
+    }
+
+
+async def measure_startup(env: Dict[str, str], log_path: str) -> Dict[str, Any]:
+    """启动一次服务，测量到可访问、到就绪的耗时与就绪后前两轮对话的首 token 时间"""
+    server = ServerProcess(_free_port(), env, log_path)
+    spawned = time.perf_counter()
+    server.start()
+    try:
+        await server.wait_ready(path="/api")
+        listening = time.perf_counter() - spawned
+        await server.wait_ready(path="/ready")
+        ready = time.perf_counter() - spawned
+        async with httpx.AsyncClient() as client:
+            state = (await client.get(f"{server.base_url}/ready")).json()
+
+        turns: List[Dict[str, Any]] = []
+        await run_session(
+            f"ws://127.0.0.1:{server.port}/ws/chat", 0, 2, DEFAULT_QUESTIONS,
+            no_cache=True, think_time=0.0, results=turns
+        )
+        return {
+            "listening_seconds": round(listening, 3),
+            "ready_seconds": round(ready, 3),
+            "server_state": state,
+            "rss_bytes": server.rss_bytes(),
+            "first_turn_ttft": turns[0].get("ttft") if turns else None,
+            "second_turn_ttft": turns[1].get("ttft") if len(turns) > 1 else None,
+            "errors": [turn["error"] for turn in turns if turn.get("error")],
+        }
+    finally:
+        server.stop()
+
+
+def summarize(runs: List[Dict[str, Any]]) -> Dict[str, Any]:
+    ok = [run for run in runs if not run["errors"]]
+    return {
+        "listening_seconds": percentiles([run["listening_seconds"] for run in runs]),
+        "ready_seconds": percentiles([run["ready_seconds"] for run in runs]),
+        "import_seconds": percentiles([
+            run["server_state"]["import_seconds"] for run in runs
+            if run["server_state"].get("import_seconds") is not None
+        ]),
+        "startup_seconds": percentiles([
+            run["server_state"]["startup_seconds"] for run in runs
+            if run["server_state"].get("startup_seconds") is not None
+        ]),
+        "first_turn_ttft": percentiles([run["first_turn_ttft"] for run in ok if run["first_turn_ttft"]]),
+        "second_turn_ttft": percentiles([run["second_turn_ttft"] for run in ok if run["second_turn_ttft"]]),
+    }
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="启动耗时基准")
+    parser.add_argument("--runs", type=int, default=3, help="每种配置启动的次数")
+    parser.add_argument("--server-env", action="append", default=[], metavar="KEY=VALUE",
+                        help="传给 server.py 的额外环境变量，可重复")
+    parser.add_argument("--output", help="结果 JSON 输出路径（默认打印到标准输出）")
+    add_config_arguments(parser)
+    args = parser.parse_args()
+
+    stubs = StubServices(config_from_args(args))
+    stubs.start()
+    workdir = tempfile.mkdtemp(prefix="bci_startup_")
+    env = {**stub_server_env(stubs, workdir), **parse_env_overrides(args.server_env)}
+
+    try:
+        imports = [
+            measure_import("import server", env),
+            measure_import("import server, agent, tools.rag, memory", env),
+        ]
+
+        modes = {}
+        for name, mode_env in (("cold", {"WARMUP": "false"}), ("warmup", {"WARMUP": "true"})):
+            runs = []
+            for run in range(args.runs):
+                log_path = os.path.join(workdir, f"server_{name}_{run}.log")
+                runs.append(await measure_startup({**env, **mode_env}, log_path))
+            modes[name] = {"summary": summarize(runs), "runs": runs}
+    finally:
+        stubs.stop()
+
+    report = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "host": {"python": platform.python_version(), "platform": platform.platform(), "cpus": os.cpu_count()},
+        "config": {"runs": args.runs, "server_env": parse_env_overrides(args.server_env)},
+        "imports": imports,
+        "modes": modes,
+        "logs": workdir,
+    }
+
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text)
+        print(f"Saved to {args.output}")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,35 @@
+"""SerpAPI 搜索桩 - 以固定延迟返回 organic_results 格式的假结果
+
+通过 SERPAPI_ENDPOINT 指向 http://127.0.0.1:<port>/search.json 使用。
+"""
+import asyncio
+
+from fastapi import APIRouter
+
+
+def create_router(latency_ms: float = 150.0) -> APIRouter:
+    """
+    创建搜索桩路由
+
+    Args:
+        latency_ms: 每次搜索的响应延迟（毫秒）
+    """
+    router = APIRouter()
+
+    @router.get("/search.json")
+    async def search(q: str = "", num: int = 5):
+        await asyncio.sleep(latency_ms / 1000)
+        return {
+            "search_metadata": {"status": "Success"},
+            "organic_results": [
+                {
+                    "position": i + 1,
+                    "title": f"{q} - 结果 {i + 1}",
+                    "link": f"https://example.com/{i + 1}",
+                    "snippet": f"关于“{q}”的第 {i + 1} 条摘要：脑机接口领域的相关介绍与最新进展。",
+                }
+                for i in range(num)
+            ],
+        }
+
+    return router
@@ -1,5 +1,32 @@
 """会话记忆模块"""
-from .session_memory import ChatMemory, create_session_memory
-from .memory_adapter import create_langchain_memory, save_conversation_to_redis
+from .session_memory import (
+    ChatMemory,
+    AsyncChatMemory,
+    create_session_memory,
+    create_async_session_memory,
+    close_redis_pools,
+    get_memory_mode,
+    get_session_cache,
+    start_session_cache,
+    warm_up_redis,
+)
+from .session_cache import SessionCache
+from .memory_adapter import (
+    create_langchain_memory,
+    acreate_langchain_memory,
+    save_conversation_to_redis,
+    asave_conversation_to_redis,
+    fold_conversation,
+    afold_conversation,
+)
+from .summary import ConversationSummarizer, count_tokens
 
-__all__ = ["ChatMemory", "create_session_memory", "create_langchain_memory", "save_conversation_to_redis"]
+__all__ = [
+    "ChatMemory", "AsyncChatMemory",
+    "create_session_memory", "create_async_session_memory", "close_redis_pools", "get_memory_mode",
+    "SessionCache", "get_session_cache", "start_session_cache", "warm_up_redis",
+    "create_langchain_memory", "acreate_langchain_memory",
+    "save_conversation_to_redis", "asave_conversation_to_redis",
+    "fold_conversation", "afold_conversation",
+    "ConversationSummarizer", "count_tokens",
+]
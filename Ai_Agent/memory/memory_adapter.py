@@ -1,30 +1,81 @@
 """LangChain Memory 适配器 - 桥接 Redis ChatMemory 和 LangChain Memory"""
 from langchain.memory import ConversationBufferMemory
 from langchain_core.messages import HumanMessage, AIMessage
-from typing import Optional
-from .session_memory import ChatMemory
+from typing import Optional, List, Dict
+from .session_memory import ChatMemory, AsyncChatMemory
+from .summary import ConversationSummarizer, split_by_budget, USER_PREFIX, ASSISTANT_PREFIX
 
 
-def create_langchain_memory(chat_memory: ChatMemory) -> ConversationBufferMemory:
+class CompactBufferMemory(ConversationBufferMemory):
+    """以 "用户: ..." / "助手: ..." 紧凑文本渲染历史，可在前面附带早期对话摘要"""
+
+    summary: str = ""
+
+    @property
+    def buffer_as_str(self) -> str:
+        text = super().buffer_as_str
+        if self.summary:
+            return f"早期对话摘要: {self.summary}\n{text}" if text else f"早期对话摘要: {self.summary}"
+        return text
+
+
+def create_langchain_memory(
+    chat_memory: ChatMemory,
+    token_budget: Optional[int] = None
+) -> ConversationBufferMemory:
     """
     从 Redis ChatMemory 创建 LangChain ConversationBufferMemory
 
     Args:
         chat_memory: Redis 会话记忆实例
+        token_budget: 原文历史的 token 预算（None 表示不限，即 window 模式）
+
+    Returns:
+        填充了历史记录的 ConversationBufferMemory
+    """
+    # 从 Redis 加载历史记录
+    if token_budget is None:
+        return _build_buffer_memory(chat_memory.get_history())
+    history, summary, _ = chat_memory.get_snapshot()
+    history = history[split_by_budget(history, token_budget):]
+    return _build_buffer_memory(history, summary)
+
+
+async def acreate_langchain_memory(
+    chat_memory: AsyncChatMemory,
+    token_budget: Optional[int] = None
+) -> ConversationBufferMemory:
+    """
+    从异步 Redis ChatMemory 创建 LangChain ConversationBufferMemory
+
+    Args:
+        chat_memory: 异步 Redis 会话记忆实例
+        token_budget: 原文历史的 token 预算（None 表示不限，即 window 模式）
 
     Returns:
         填充了历史记录的 ConversationBufferMemory
     """
+    if token_budget is None:
+        return _build_buffer_memory(await chat_memory.get_history())
+    # 历史和摘要取自同一快照，缓存未命中时也只访问一次 Redis
+    history, summary, _ = await chat_memory.get_snapshot()
+    # 尚未折叠进摘要的超预算消息不放进 prompt
+    history = history[split_by_budget(history, token_budget):]
+    return _build_buffer_memory(history, summary)
+
+
+def _build_buffer_memory(history: List[Dict], summary: str = "") -> ConversationBufferMemory:
+    """用历史消息填充 ConversationBufferMemory"""
     # 创建 LangChain Memory
-    memory = ConversationBufferMemory(
+    memory = CompactBufferMemory(
         memory_key="chat_history",
-        return_messages=True,
-        output_key="output"
+        return_messages=False,
+        human_prefix=USER_PREFIX,
+        ai_prefix=ASSISTANT_PREFIX,
+        output_key="output",
+        summary=summary
     )
 
-    # 从 Redis 加载历史记录
-    history = chat_memory.get_history()
-
     # 填充到 LangChain Memory
     for msg in history:
         if msg["role"] == "user":
@@ -48,5 +99,78 @@ def save_conversation_to_redis(
         user_message: 用户消息
         assistant_message: 助手回复
     """
-    chat_memory.add_message("user", user_message)
-    chat_memory.add_message("assistant", assistant_message)
+    chat_memory.add_turn(user_message, assistant_message)
+
+
+async def asave_conversation_to_redis(
+    chat_memory: AsyncChatMemory,
+    user_message: str,
+    assistant_message: str
+):
+    """
+    异步保存对话到 Redis
+
+    Args:
+        chat_memory: 异步 Redis 会话记忆实例
+        user_message: 用户消息
+        assistant_message: 助手回复
+    """
+    await chat_memory.add_turn(user_message, assistant_message)
+
+
+def fold_conversation(
+    chat_memory: ChatMemory,
+    summarizer: ConversationSummarizer,
+    token_budget: int
+) -> bool:
+    """
+    把超出 token 预算的早期对话折叠进滚动摘要
+
+    Args:
+        chat_memory: Redis 会话记忆实例
+        summarizer: 摘要生成器
+        token_budget: 原文历史的 token 预算
+
+    Returns:
+        是否执行了折叠（快照之后会话有新写入则返回 False）
+    """
+    history, summary, version = chat_memory.get_snapshot()
+    split = split_by_budget(history, token_budget)
+    if split == 0 or not chat_memory.try_lock_summary():
+        return False
+    try:
+        summary = summarizer.summarize(summary, history[:split])
+    except Exception:
+        chat_memory.release_summary_lock()
+        raise
+    return chat_memory.fold(split, summary, version)
+
+
+async def afold_conversation(
+    chat_memory: AsyncChatMemory,
+    summarizer: ConversationSummarizer,
+    token_budget: int
+) -> bool:
+    """
+    异步把超出 token 预算的早期对话折叠进滚动摘要（在回答发送完成后调用）
+
+    Args:
+        chat_memory: 异步 Redis 会话记忆实例
+        summarizer: 摘要生成器
+        token_budget: 原文历史的 token 预算
+
+    Returns:
+        是否执行了折叠（快照之后会话有新写入则返回 False）
+    """
+    history, summary, version = await chat_memory.get_snapshot()
+    split = split_by_budget(history, token_budget)
+    # 其他 worker 正在折叠同一会话时跳过，下一轮再处理
+    if split == 0 or not await chat_memory.try_lock_summary():
+        return False
+    try:
+        summary = await summarizer.asummarize(summary, history[:split])
+    except BaseException:
+        await chat_memory.release_summary_lock()
+        raise
+    # 生成摘要期间会话有新写入（或已被折叠过）时放弃，下一轮按新快照重新折叠
+    return await chat_memory.fold(split, summary, version)
@@ -0,0 +1,206 @@
+"""进程内会话缓存 - 最近活跃会话的历史与摘要，写穿透，多 worker 通过 Redis pub/sub 失效"""
+from typing import Any, Callable, Dict, List, Optional
+from collections import OrderedDict
+import asyncio
+import json
+import logging
+import time
+import uuid
+
+
+logger = logging.getLogger(__name__)
+
+
+INVALIDATION_CHANNEL = "chat_session_invalidate"
+
+
+def encode_invalidation(session_id: str, worker_id: Optional[str] = None) -> str:
+    """
+    构造会话失效消息
+
+    Args:
+        session_id: 会话ID
+        worker_id: 发送方 worker（该 worker 自己已更新缓存，收到后忽略）；None 表示所有 worker 都失效
+    """
+    return json.dumps({"worker": worker_id, "session_id": session_id})
+
+
+class _Entry:
+    __slots__ = ("version", "history", "summary", "expires_at")
+
+    def __init__(self, version: int, history: List[Dict], summary: str, expires_at: float):
+        self.version = version
+        self.history = history
+        self.summary = summary
+        self.expires_at = expires_at
+
+
+class SessionCache:
+    """最近活跃会话的 LRU 缓存
+
+    - 每个会话在 Redis 中有一个版本号（chat_version:{session_id}），与写入在同一个 MULTI 中 INCR
+    - 本 worker 写入后，如果新版本号正好是缓存版本 + 1，直接更新缓存，否则丢弃
+    - 其他 worker 写入时通过 pub/sub 广播失效消息，收到后丢弃缓存
+    - 读取 Redis 前记下时间戳，期间该会话收到过失效消息则不缓存读到的快照
+    - 订阅断开期间不提供缓存读取，重连后清空缓存；TTL 兜底限制陈旧时间
+    """
+
+    def __init__(self, max_sessions: int = 1024, ttl: float = 300.0):
+        """
+        初始化会话缓存
+
+        Args:
+            max_sessions: 最多缓存的会话数
+            ttl: 缓存条目有效期（秒）
+        """
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self.worker_id = uuid.uuid4().hex
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        # 逻辑时钟：每次失效 +1，记录各会话最近一次失效的时刻
+        self._tick = 0
+        self._invalidated_at: "OrderedDict[str, int]" = OrderedDict()
+        # 被淘汰出 _invalidated_at 的记录中最大的时刻（保守判断）
+        self._floor = 0
+        self._subscribed = False
+        self._listener: Optional[asyncio.Task] = None
+
+    @property
+    def active(self) -> bool:
+        """订阅正常时才使用缓存"""
+        return self.max_sessions > 0 and self._subscribed
+
+    def get(self, session_id: str) -> Optional[_Entry]:
+        """读取缓存条目（未命中、过期或订阅断开时返回 None）"""
+        if not self.active:
+            return None
+        entry = self._entries.get(session_id)
+        if entry is None or entry.expires_at < time.monotonic():
+            if entry is not None:
+                del self._entries[session_id]
+            self.misses += 1
+            return None
+        self._entries.move_to_end(session_id)
+        self.hits += 1
+        return entry
+
+    def begin_load(self) -> int:
+        """开始从 Redis 读取快照前调用，返回的时刻传给 put()"""
+        return self._tick
+
+    def put(self, session_id: str, since: int, version: int, history: List[Dict], summary: str):
+        """
+        写入从 Redis 加载的快照
+
+        Args:
+            session_id: 会话ID
+            since: begin_load() 的返回值；此后该会话被失效过则丢弃快照
+            version: 快照的版本号
+            history: 历史消息
+            summary: 滚动摘要
+        """
+        if not self.active or max(self._floor, self._invalidated_at.get(session_id, 0)) > since:
+            return
+        self._entries[session_id] = _Entry(version, history, summary, time.monotonic() + self.ttl)
+        self._entries.move_to_end(session_id)
+        while len(self._entries) > self.max_sessions:
+            self._entries.popitem(last=False)
+
+    def apply(self, session_id: str, version: int, update: Callable[[_Entry], None]):
+        """
+        本 worker 写入 Redis 后同步更新缓存
+
+        Args:
+            session_id: 会话ID
+            version: 写入后 Redis 返回的新版本号
+            update: 修改缓存条目的函数
+        """
+        entry = self._entries.get(session_id)
+        if entry is None:
+            return
+        if entry.version != version - 1:
+            # 中间有其他 worker 的写入（失效消息可能还没到），不能增量更新
+            del self._entries[session_id]
+            return
+        update(entry)
+        entry.version = version
+        entry.expires_at = time.monotonic() + self.ttl
+        self._entries.move_to_end(session_id)
+
+    def invalidate(self, session_id: str):
+        """丢弃某个会话的缓存"""
+        self._tick += 1
+        self._invalidated_at[session_id] = self._tick
+        self._invalidated_at.move_to_end(session_id)
+        while len(self._invalidated_at) > self.max_sessions * 4:
+            _, tick = self._invalidated_at.popitem(last=False)
+            self._floor = max(self._floor, tick)
+        self._entries.pop(session_id, None)
+
+    def clear(self):
+        """丢弃全部缓存（订阅断开时调用），进行中的加载也不再写入"""
+        self._tick += 1
+        self._floor = self._tick
+        self._invalidated_at.clear()
+        self._entries.clear()
+
+    def start(self, redis_client: Any):
+        """启动失效消息订阅（需在事件循环中调用）"""
+        if self.max_sessions > 0 and self._listener is None:
+            self._listener = asyncio.create_task(self._listen(redis_client))
+
+    async def stop(self):
+        """停止订阅并清空缓存"""
+        self._subscribed = False
+        if self._listener is not None:
+            self._listener.cancel()
+            try:
+                await self._listener
+            except asyncio.CancelledError:
+                pass
+            self._listener = None
+        self.clear()
+
+    async def _listen(self, redis_client: Any):
+        """订阅失效消息；断线后退避重连，重连前后的缓存一律丢弃"""
+        delay = 1.0
+        while True:
+            pubsub = redis_client.pubsub()
+            try:
+                await pubsub.subscribe(INVALIDATION_CHANNEL)
+                self.clear()
+                self._subscribed = True
+                delay = 1.0
+                async for message in pubsub.listen():
+                    if message.get("type") != "message":
+                        continue
+                    data = json.loads(message["data"])
+                    if data.get("worker") != self.worker_id:
+                        self.invalidate(data["session_id"])
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning("Session cache subscription lost: %s", e)
+            finally:
+                self._subscribed = False
+                try:
+                    await pubsub.reset()
+                except Exception:
+                    pass
+            self.clear()
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 30.0)
+
+    def get_stats(self) -> dict:
+        """获取缓存统计信息"""
+        total = self.hits + self.misses
+        return {
+            "active": self.active,
+            "sessions": len(self._entries),
+            "max_sessions": self.max_sessions,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0
+        }
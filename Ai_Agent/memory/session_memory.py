@@ -1,13 +1,103 @@
 """会话记忆模块 - 基于 Redis 的对话历史管理"""
 import redis
+import redis.asyncio as aioredis
+import asyncio
 import json
 import os
-from typing import List, Dict
+from typing import List, Dict, Optional, Tuple
 from datetime import datetime
+from .session_cache import SessionCache, INVALIDATION_CHANNEL, encode_invalidation
+
+
+# 进程级连接池（按需创建，所有会话共享）
+_redis_pool: Optional[redis.BlockingConnectionPool] = None
+_async_redis_pool: Optional[aioredis.BlockingConnectionPool] = None
+_session_cache: Optional[SessionCache] = None
+
+
+def _redis_pool_kwargs() -> Dict:
+    """从环境变量读取 Redis 连接池配置"""
+    return {
+        "host": os.getenv("REDIS_HOST", "localhost"),
+        "port": int(os.getenv("REDIS_PORT", 6379)),
+        "db": int(os.getenv("REDIS_DB", 0)),
+        "max_connections": int(os.getenv("REDIS_MAX_CONNECTIONS", 50)),
+        # 连接全部占用时等待归还的最长时间（秒），超时才抛出 ConnectionError
+        "timeout": float(os.getenv("REDIS_POOL_TIMEOUT", 5)),
+        "decode_responses": True
+    }
+
+
+def get_redis_pool() -> redis.BlockingConnectionPool:
+    """获取进程级同步 Redis 连接池（连接用尽时排队等待，而不是立即报错）"""
+    global _redis_pool
+    if _redis_pool is None:
+        _redis_pool = redis.BlockingConnectionPool(**_redis_pool_kwargs())
+    return _redis_pool
+
+
+def get_async_redis_pool() -> aioredis.BlockingConnectionPool:
+    """
+    获取进程级异步 Redis 连接池
+
+    并发请求数远大于连接数时，协程排队等待空闲连接（最多 REDIS_POOL_TIMEOUT 秒）；
+    会话缓存的失效订阅会长期占用其中一条连接。
+    """
+    global _async_redis_pool
+    if _async_redis_pool is None:
+        _async_redis_pool = aioredis.BlockingConnectionPool(**_redis_pool_kwargs())
+    return _async_redis_pool
+
+
+def get_session_cache() -> SessionCache:
+    """获取进程内会话缓存（SESSION_CACHE_SIZE=0 关闭）"""
+    global _session_cache
+    if _session_cache is None:
+        _session_cache = SessionCache(
+            max_sessions=int(os.getenv("SESSION_CACHE_SIZE", 1024)),
+            ttl=float(os.getenv("SESSION_CACHE_TTL", 300))
+        )
+    return _session_cache
+
+
+def start_session_cache():
+    """启动会话缓存的跨 worker 失效订阅（服务启动时在事件循环中调用）"""
+    get_session_cache().start(aioredis.Redis(connection_pool=get_async_redis_pool()))
+
+
+async def warm_up_redis(connections: int = 4):
+    """预先在异步连接池中建立若干连接（并发 PING，每个 PING 占用一条连接）"""
+    client = aioredis.Redis(connection_pool=get_async_redis_pool())
+    await asyncio.gather(*(client.ping() for _ in range(max(1, connections))))
+
+
+async def close_redis_pools():
+    """关闭会话缓存订阅和进程级连接池（服务关闭时调用）"""
+    global _redis_pool, _async_redis_pool
+    if _session_cache is not None:
+        await _session_cache.stop()
+    if _async_redis_pool is not None:
+        await _async_redis_pool.disconnect()
+        _async_redis_pool = None
+    if _redis_pool is not None:
+        _redis_pool.disconnect()
+        _redis_pool = None
+
+
+def _new_message(role: str, content: str) -> Dict:
+    return {
+        "role": role,
+        "content": content,
+        "timestamp": datetime.now().isoformat()
+    }
 
 
 class ChatMemory:
-    """基于 Redis 的会话记忆管理"""
+    """基于 Redis 的会话记忆管理
+
+    每次写入在同一个 MULTI 中递增会话版本号并广播失效消息，
+    保证各 worker 的进程内会话缓存不会读到旧数据。
+    """
 
     def __init__(self, session_id: str, redis_client: redis.Redis, max_history: int = 10):
         """
@@ -22,6 +112,28 @@ class ChatMemory:
         self.redis_client = redis_client
         self.max_history = max_history
         self.key = f"chat_history:{session_id}"
+        self.summary_key = f"chat_summary:{session_id}"
+        self.summary_lock_key = f"chat_summary_lock:{session_id}"
+        self.version_key = f"chat_version:{session_id}"
+
+    def _commit(self, pipe):
+        """追加版本号递增和失效广播，一次往返执行"""
+        pipe.incr(self.version_key)
+        pipe.publish(INVALIDATION_CHANNEL, encode_invalidation(self.session_id))
+        return pipe.execute()
+
+    def add_messages(self, messages: List[Dict]):
+        """
+        批量添加消息到历史记录（一次往返）
+
+        Args:
+            messages: 消息列表（按时间正序）
+        """
+        pipe = self.redis_client.pipeline(transaction=True)
+        pipe.lpush(self.key, *[json.dumps(message) for message in messages])
+        # 保持历史记录在最大长度内
+        pipe.ltrim(self.key, 0, self.max_history - 1)
+        self._commit(pipe)
 
     def add_message(self, role: str, content: str):
         """
@@ -31,14 +143,14 @@ class ChatMemory:
             role: 角色（user/assistant）
             content: 消息内容
         """
-        message = {
-            "role": role,
-            "content": content,
-            "timestamp": datetime.now().isoformat()
-        }
-        self.redis_client.lpush(self.key, json.dumps(message))
-        # 保持历史记录在最大长度内
-        self.redis_client.ltrim(self.key, 0, self.max_history - 1)
+        self.add_messages([_new_message(role, content)])
+
+    def add_turn(self, user_message: str, assistant_message: str):
+        """添加一轮问答（一次往返）"""
+        self.add_messages([
+            _new_message("user", user_message),
+            _new_message("assistant", assistant_message)
+        ])
 
     def get_history(self) -> List[Dict]:
         """
@@ -50,10 +162,250 @@ class ChatMemory:
         messages = self.redis_client.lrange(self.key, 0, -1)
         return [json.loads(msg) for msg in reversed(messages)]
 
+    def get_summary(self) -> str:
+        """获取早期对话的滚动摘要"""
+        return self.redis_client.get(self.summary_key) or ""
+
+    def get_snapshot(self) -> Tuple[List[Dict], str, int]:
+        """
+        一次往返读取同一时刻的历史、摘要和版本号
+
+        Returns:
+            (历史消息列表, 滚动摘要, 版本号)
+        """
+        pipe = self.redis_client.pipeline(transaction=True)
+        pipe.lrange(self.key, 0, -1)
+        pipe.get(self.summary_key)
+        pipe.get(self.version_key)
+        messages, summary, version = pipe.execute()
+        return [json.loads(msg) for msg in reversed(messages)], summary or "", int(version or 0)
+
+    def try_lock_summary(self, ttl: int = 120) -> bool:
+        """获取摘要更新锁，避免多个 worker 同时折叠同一会话"""
+        return bool(self.redis_client.set(self.summary_lock_key, "1", nx=True, ex=ttl))
+
+    def release_summary_lock(self):
+        """释放摘要更新锁（摘要生成失败时调用）"""
+        self.redis_client.delete(self.summary_lock_key)
+
+    def fold(self, count: int, summary: str, expected_version: int) -> bool:
+        """
+        用新摘要替换最早的 count 条消息（原子执行，并释放摘要更新锁）
+
+        WATCH 版本号，读取快照之后会话有过任何写入则放弃本次折叠。
+
+        Args:
+            count: 已折叠进摘要的最早消息数
+            summary: 新摘要
+            expected_version: 生成摘要所用快照的版本号
+
+        Returns:
+            是否写入了折叠结果
+        """
+        with self.redis_client.pipeline(transaction=True) as pipe:
+            try:
+                pipe.watch(self.version_key)
+                if int(pipe.get(self.version_key) or 0) == expected_version:
+                    pipe.multi()
+                    pipe.set(self.summary_key, summary)
+                    # 最新消息在表头，从表尾裁掉最早的消息
+                    pipe.ltrim(self.key, 0, -(count + 1))
+                    pipe.delete(self.summary_lock_key)
+                    self._commit(pipe)
+                    return True
+            except redis.WatchError:
+                pass
+        self.release_summary_lock()
+        return False
+
+
+class AsyncChatMemory:
+    """基于 redis.asyncio 的会话记忆管理，不阻塞事件循环
+
+    配合进程内 SessionCache 时：读取命中缓存不访问 Redis，
+    未命中时 get_snapshot() 一次往返读取历史、摘要和版本号
+    （分别调用 get_history() 和 get_summary() 则各自可能访问一次 Redis）；
+    写入写穿透并同步更新缓存。
+    """
+
+    def __init__(
+        self,
+        session_id: str,
+        redis_client: aioredis.Redis,
+        max_history: int = 10,
+        cache: Optional[SessionCache] = None
+    ):
+        """
+        初始化异步会话记忆
+
+        Args:
+            session_id: 会话ID
+            redis_client: 异步 Redis 客户端
+            max_history: 最大历史记录数量
+            cache: 进程内会话缓存（None 表示每次读取 Redis）
+        """
+        self.session_id = session_id
+        self.redis_client = redis_client
+        self.max_history = max_history
+        self.cache = cache
+        self.key = f"chat_history:{session_id}"
+        self.summary_key = f"chat_summary:{session_id}"
+        self.summary_lock_key = f"chat_summary_lock:{session_id}"
+        self.version_key = f"chat_version:{session_id}"
+
+    async def _commit(self, pipe) -> int:
+        """追加版本号递增和失效广播，一次往返执行，返回新版本号"""
+        worker_id = self.cache.worker_id if self.cache else None
+        pipe.incr(self.version_key)
+        pipe.publish(INVALIDATION_CHANNEL, encode_invalidation(self.session_id, worker_id))
+        results = await pipe.execute()
+        return int(results[-2])
+
+    async def _load(self) -> Tuple[List[Dict], str, int]:
+        """读取会话快照（历史、摘要、版本号一次往返），缓存启用时写入缓存"""
+        since = self.cache.begin_load() if self.cache else 0
+        pipe = self.redis_client.pipeline(transaction=True)
+        pipe.lrange(self.key, 0, -1)
+        pipe.get(self.summary_key)
+        pipe.get(self.version_key)
+        messages, summary, version = await pipe.execute()
+        history = [json.loads(msg) for msg in reversed(messages)]
+        summary = summary or ""
+        version = int(version or 0)
+        if self.cache:
+            self.cache.put(self.session_id, since, version, list(history), summary)
+        return history, summary, version
+
+    async def add_messages(self, messages: List[Dict]):
+        """
+        批量添加消息到历史记录（一次往返）
+
+        Args:
+            messages: 消息列表（按时间正序）
+        """
+        pipe = self.redis_client.pipeline(transaction=True)
+        pipe.lpush(self.key, *[json.dumps(message) for message in messages])
+        # 保持历史记录在最大长度内
+        pipe.ltrim(self.key, 0, self.max_history - 1)
+        version = await self._commit(pipe)
+
+        if self.cache:
+            def update(entry):
+                entry.history = (entry.history + messages)[-self.max_history:]
+            self.cache.apply(self.session_id, version, update)
+
+    async def add_message(self, role: str, content: str):
+        """
+        添加消息到历史记录
+
+        Args:
+            role: 角色（user/assistant）
+            content: 消息内容
+        """
+        await self.add_messages([_new_message(role, content)])
+
+    async def add_turn(self, user_message: str, assistant_message: str):
+        """添加一轮问答（一次往返）"""
+        await self.add_messages([
+            _new_message("user", user_message),
+            _new_message("assistant", assistant_message)
+        ])
+
+    async def get_history(self) -> List[Dict]:
+        """
+        获取历史记录
+
+        Returns:
+            历史消息列表
+        """
+        entry = self.cache.get(self.session_id) if self.cache else None
+        if entry is not None:
+            return list(entry.history)
+        history, _, _ = await self._load()
+        return history
+
+    async def get_summary(self) -> str:
+        """获取早期对话的滚动摘要"""
+        entry = self.cache.get(self.session_id) if self.cache else None
+        if entry is not None:
+            return entry.summary
+        _, summary, _ = await self._load()
+        return summary
+
+    async def get_snapshot(self) -> Tuple[List[Dict], str, int]:
+        """
+        读取同一时刻的历史、摘要和版本号（命中缓存不访问 Redis，未命中一次往返）
+
+        Returns:
+            (历史消息列表, 滚动摘要, 版本号)
+        """
+        entry = self.cache.get(self.session_id) if self.cache else None
+        if entry is not None:
+            return list(entry.history), entry.summary, entry.version
+        return await self._load()
+
+    async def try_lock_summary(self, ttl: int = 120) -> bool:
+        """获取摘要更新锁，避免多个 worker 同时折叠同一会话"""
+        return bool(await self.redis_client.set(self.summary_lock_key, "1", nx=True, ex=ttl))
+
+    async def release_summary_lock(self):
+        """释放摘要更新锁（摘要生成失败时调用）"""
+        await self.redis_client.delete(self.summary_lock_key)
+
+    async def fold(self, count: int, summary: str, expected_version: int) -> bool:
+        """
+        用新摘要替换最早的 count 条消息（原子执行，并释放摘要更新锁）
+
+        WATCH 版本号，读取快照之后会话有过任何写入则放弃本次折叠。
+
+        Args:
+            count: 已折叠进摘要的最早消息数
+            summary: 新摘要
+            expected_version: 生成摘要所用快照的版本号
+
+        Returns:
+            是否写入了折叠结果
+        """
+        version = None
+        async with self.redis_client.pipeline(transaction=True) as pipe:
+            try:
+                await pipe.watch(self.version_key)
+                if int(await pipe.get(self.version_key) or 0) == expected_version:
+                    pipe.multi()
+                    pipe.set(self.summary_key, summary)
+                    # 最新消息在表头，从表尾裁掉最早的消息
+                    pipe.ltrim(self.key, 0, -(count + 1))
+                    pipe.delete(self.summary_lock_key)
+                    version = await self._commit(pipe)
+            except redis.WatchError:
+                pass
+        if version is None:
+            await self.release_summary_lock()
+            return False
+
+        if self.cache:
+            def update(entry):
+                entry.history = entry.history[count:]
+                entry.summary = summary
+            self.cache.apply(self.session_id, version, update)
+        return True
+
+
+def get_memory_mode() -> str:
+    """记忆模式：window（最近 N 条原文）或 summary（token 预算 + 滚动摘要）"""
+    return os.getenv("MEMORY_MODE", "window").lower()
+
+
+def _default_max_history() -> int:
+    """summary 模式下未折叠的消息也要保留，列表上限放宽"""
+    if get_memory_mode() == "summary":
+        return int(os.getenv("MEMORY_MAX_MESSAGES", 100))
+    return 10
+
 
 def create_session_memory(session_id: str) -> ChatMemory:
     """
-    创建会话记忆实例
+    创建会话记忆实例（共享进程级连接池）
 
     Args:
         session_id: 会话ID
@@ -61,10 +413,24 @@ def create_session_memory(session_id: str) -> ChatMemory:
     Returns:
         ChatMemory 实例
     """
-    redis_client = redis.Redis(
-        host=os.getenv("REDIS_HOST", "localhost"),
-        port=int(os.getenv("REDIS_PORT", 6379)),
-        db=int(os.getenv("REDIS_DB", 0)),
-        decode_responses=True
+    redis_client = redis.Redis(connection_pool=get_redis_pool())
+    return ChatMemory(session_id, redis_client, max_history=_default_max_history())
+
+
+def create_async_session_memory(session_id: str) -> AsyncChatMemory:
+    """
+    创建异步会话记忆实例（共享进程级异步连接池和会话缓存）
+
+    Args:
+        session_id: 会话ID
+
+    Returns:
+        AsyncChatMemory 实例
+    """
+    redis_client = aioredis.Redis(connection_pool=get_async_redis_pool())
+    return AsyncChatMemory(
+        session_id,
+        redis_client,
+        max_history=_default_max_history(),
+        cache=get_session_cache()
     )
-    return ChatMemory(session_id, redis_client)
@@ -0,0 +1,131 @@
+"""对话摘要 - token 计数、紧凑渲染与滚动摘要生成"""
+from typing import Any, Dict, List, Optional
+import os
+
+try:
+    import tiktoken
+except ImportError:  # 可选依赖：未安装时按字符数估算
+    tiktoken = None
+
+
+USER_PREFIX = "用户"
+ASSISTANT_PREFIX = "助手"
+
+_encoding = None
+
+
+def _get_encoding():
+    global _encoding
+    if _encoding is None and tiktoken is not None:
+        try:
+            _encoding = tiktoken.encoding_for_model(os.getenv("OPENAI_MODEL", "gpt-3.5-turbo"))
+        except KeyError:
+            _encoding = tiktoken.get_encoding("cl100k_base")
+    return _encoding
+
+
+def count_tokens(text: str) -> int:
+    """
+    计算文本的 token 数
+
+    Args:
+        text: 文本
+
+    Returns:
+        token 数（未安装 tiktoken 时为估算值）
+    """
+    encoding = _get_encoding()
+    if encoding is not None:
+        return len(encoding.encode(text))
+    # 中文约 1 字 1 token、英文约 4 字符 1 token，取偏保守的估算
+    return len(text) // 2 + 1
+
+
+def render_message(message: Dict) -> str:
+    """渲染单条消息为紧凑的 "用户: ..." / "助手: ..." 格式"""
+    prefix = USER_PREFIX if message["role"] == "user" else ASSISTANT_PREFIX
+    return f"{prefix}: {message['content']}"
+
+
+def split_by_budget(history: List[Dict], token_budget: int) -> int:
+    """
+    按 token 预算划分历史消息
+
+    从最新消息往前累计，超出预算的更早消息需要折叠进摘要；
+    切分点对齐到用户消息，保证问答成对保留，且至少保留最近一轮。
+
+    Args:
+        history: 历史消息列表（按时间正序）
+        token_budget: 原文保留的 token 预算
+
+    Returns:
+        切分下标：history[:index] 超出预算，history[index:] 原文保留
+    """
+    used = 0
+    index = len(history)
+    while index > 0:
+        cost = count_tokens(render_message(history[index - 1]))
+        if used + cost > token_budget:
+            break
+        used += cost
+        index -= 1
+
+    # 至少保留最近一轮（最后一条用户消息及其后的回复）
+    last_user = max((i for i, msg in enumerate(history) if msg["role"] == "user"), default=0)
+    index = min(index, last_user)
+
+    # 对齐到用户消息，避免保留半轮对话
+    while index < len(history) and history[index]["role"] != "user":
+        index += 1
+    return min(index, last_user)
+
+
+class ConversationSummarizer:
+    """把超出预算的早期对话增量合并进滚动摘要"""
+
+    PROMPT = """请把下面新增的对话内容合并进已有摘要，生成一份新的简洁摘要。
+要求：保留用户的身份信息、偏好、情绪状态、关键事实和尚未解决的问题；省略寒暄和重复内容；不超过 {max_chars} 字。
+
+已有摘要：
+{summary}
+
+新增对话：
+{dialogue}
+
+新摘要："""
+
+    def __init__(self, llm: Any, max_chars: int = 300):
+        """
+        初始化摘要器
+
+        Args:
+            llm: 用于生成摘要的 LangChain Chat 模型
+            max_chars: 摘要长度上限（字）
+        """
+        self.llm = llm
+        self.max_chars = max_chars
+
+    def _build_prompt(self, summary: Optional[str], messages: List[Dict]) -> str:
+        return self.PROMPT.format(
+            max_chars=self.max_chars,
+            summary=summary or "（无）",
+            dialogue="\n".join(render_message(msg) for msg in messages)
+        )
+
+    def summarize(self, summary: Optional[str], messages: List[Dict]) -> str:
+        """
+        生成新摘要
+
+        Args:
+            summary: 已有摘要
+            messages: 需要折叠的早期消息
+
+        Returns:
+            合并后的摘要
+        """
+        return self.llm.invoke(self._build_prompt(summary, messages)).content.strip()
+
+    async def asummarize(self, summary: Optional[str], messages: List[Dict]) -> str:
+        """异步生成新摘要"""
+        result = await self.llm.ainvoke(self._build_prompt(summary, messages))
+        return result.content.strip()
@@ -0,0 +1,26 @@
+"""可观测性模块 - 阶段计时、直方图指标与请求 trace"""
+from .metrics import REGISTRY, MetricsRegistry, Counter, Gauge, Histogram
+from .tracing import (
+    span,
+    record_span,
+    start_trace,
+    RequestTrace,
+    TraceDumper,
+    STAGE_SECONDS,
+    LLM_TTFT_SECONDS,
+)
+
+__all__ = [
+    "REGISTRY",
+    "MetricsRegistry",
+    "Counter",
+    "Gauge",
+    "Histogram",
+    "span",
+    "record_span",
+    "start_trace",
+    "RequestTrace",
+    "TraceDumper",
+    "STAGE_SECONDS",
+    "LLM_TTFT_SECONDS",
+]
@@ -0,0 +1,131 @@
+"""请求阶段计时 - 每个阶段的耗时汇总到直方图，并可记录到当前请求的 trace 中
+
+用法:
+    with span("history_load"):
+        ...
+
+trace 通过 ContextVar 传递：asyncio 任务创建时复制上下文，
+请求内派生的 Agent 任务、预取任务中的阶段都会记到同一个 trace。
+"""
+from typing import Any, Dict, Iterator, List, Optional
+from contextlib import contextmanager
+from contextvars import ContextVar
+import json
+import logging
+import threading
+import time
+
+from .metrics import REGISTRY
+
+
+logger = logging.getLogger(__name__)
+
+STAGE_SECONDS = REGISTRY.histogram(
+    "chat_stage_duration_seconds",
+    "Duration of each stage of a chat turn",
+    ("stage",),
+)
+LLM_TTFT_SECONDS = REGISTRY.histogram(
+    "llm_time_to_first_token_seconds",
+    "Time from sending an LLM request to receiving the first streamed chunk",
+)
+STAGE_ERRORS = REGISTRY.counter(
+    "chat_stage_errors",
+    "Stages that raised an exception",
+    ("stage",),
+)
+
+
+class RequestTrace:
+    """单个请求的阶段记录"""
+
+    def __init__(self, request_id: str):
+        self.request_id = request_id
+        self.started = time.perf_counter()
+        self.spans: List[Dict[str, Any]] = []
+        self._lock = threading.Lock()
+
+    def add(self, stage: str, start: float, duration: float, attrs: Dict[str, Any]):
+        record = {
+            "stage": stage,
+            "start_ms": round((start - self.started) * 1000, 2),
+            "duration_ms": round(duration * 1000, 2),
+        }
+        if attrs:
+            record.update(attrs)
+        with self._lock:
+            self.spans.append(record)
+
+    def as_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            spans = sorted(self.spans, key=lambda record: record["start_ms"])
+        return {
+            "request_id": self.request_id,
+            "total_ms": round((time.perf_counter() - self.started) * 1000, 2),
+            "spans": spans,
+        }
+
+
+_current_trace: ContextVar[Optional[RequestTrace]] = ContextVar("request_trace", default=None)
+
+
+def start_trace(request_id: str) -> RequestTrace:
+    """在当前上下文中开始记录一个请求的 trace"""
+    trace = RequestTrace(request_id)
+    _current_trace.set(trace)
+    return trace
+
+
+def record_span(stage: str, start: float, duration: float, **attrs: Any):
+    """
+    记录一个已经结束的阶段（用于无法包在 with 块里的场景，如流式响应）
+
+    Args:
+        stage: 阶段名称
+        start: time.perf_counter() 起点
+        duration: 耗时（秒）
+        attrs: 附加到 trace 的属性
+    """
+    STAGE_SECONDS.observe(duration, stage=stage)
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.add(stage, start, duration, attrs)
+
+
+@contextmanager
+def span(stage: str, **attrs: Any) -> Iterator[Dict[str, Any]]:
+    """
+    计时一个阶段
+
+    Yields:
+        属性字典，块内可以继续补充（如命中情况、结果数量）
+    """
+    start = time.perf_counter()
+    try:
+        yield attrs
+    except BaseException as e:
+        # 取消不算错误，但仍记录耗时
+        if isinstance(e, Exception):
+            STAGE_ERRORS.inc(stage=stage)
+            attrs["error"] = type(e).__name__
+        else:
+            attrs["cancelled"] = True
+        raise
+    finally:
+        record_span(stage, start, time.perf_counter() - start, **attrs)
+
+
+class TraceDumper:
+    """把完成的 trace 以 JSON Lines 追加到文件（TRACE_DUMP_PATH），写入在线程中进行"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def write(self, trace: Dict[str, Any]):
+        line = json.dumps(trace, ensure_ascii=False)
+        try:
+            with self._lock, open(self.path, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+        except OSError as e:
+            logger.warning("Failed to dump trace to %s: %s", self.path, e)
@@ -1,27 +1,292 @@
+import time
+
+# 模块导入耗时（/ready 中报告）；重型依赖（LangChain、Qdrant、OpenAI）延迟到启动时导入
+_IMPORT_STARTED = time.perf_counter()
+
 from fastapi import FastAPI, UploadFile, File, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
+from fastapi.responses import JSONResponse, PlainTextResponse
+from contextlib import asynccontextmanager, suppress
 from dotenv import load_dotenv
 import os
 import tempfile
 import shutil
-from typing import Optional
+import asyncio
+import logging
+import uuid
+from typing import Any, Callable, Optional, Dict
 from datetime import datetime
-from tools.rag import RAGRetriever
-from tools import SearchTool
-from agent import LangChainAgent
-from memory import create_session_memory, create_langchain_memory, save_conversation_to_redis
+from transport import WebSocketStreamSender, InvalidFrame, receive_event
+from observability import REGISTRY, span, start_trace, TraceDumper
 
 # 加载环境变量
 load_dotenv()
 
+# 日志：LOG_LEVEL=DEBUG 时输出检索、工具调用和 Agent 推理细节
+logging.basicConfig(
+    level=os.getenv("LOG_LEVEL", "INFO").upper(),
+    format="%(asctime)s %(levelname)s %(name)s: %(message)s"
+)
+logger = logging.getLogger("server")
+
+# ========================================
+# 组件（在 lifespan 中创建，导入 server 模块本身不做任何网络连接）
+# ========================================
+rag_retriever = None
+ingestion_jobs = None
+search_tool = None
+answer_cache = None
+smart_agent = None
+memory_token_budget = None
+summarizer = None
+
+# 启动状态：各组件的创建耗时与错误、预热结果，由 /ready 返回
+startup_state: Dict[str, Any] = {
+    "status": "starting",
+    "import_seconds": None,
+    "startup_seconds": None,
+    "components": {},
+    "warmup": None,
+}
+
+# STARTUP_STRICT=true 时任何组件创建失败都中止启动，而不是降级运行
+STARTUP_STRICT = os.getenv("STARTUP_STRICT", "false").lower() == "true"
+
+
+def _create_rag_retriever():
+    """RAG 检索器"""
+    from tools.rag import RAGRetriever
+
+    return RAGRetriever(
+        collection_name=os.getenv("QDRANT_COLLECTION", "knowledge_base"),
+        chunk_size=int(os.getenv("CHUNK_SIZE", "1000")),
+        chunk_overlap=int(os.getenv("CHUNK_OVERLAP", "200")),
+        qdrant_url=os.getenv("QDRANT_URL"),
+        qdrant_path=os.getenv("QDRANT_PATH"),
+        qdrant_api_key=os.getenv("QDRANT_API_KEY"),
+        on_disk=os.getenv("QDRANT_ON_DISK", "true").lower() == "true",
+        embedding_cache_path=os.getenv("EMBEDDING_CACHE_PATH", ".cache/embeddings.sqlite"),
+        embedding_cache_size=int(os.getenv("EMBEDDING_CACHE_MAX_ENTRIES", "100000")),
+        result_cache_threshold=float(os.getenv("RESULT_CACHE_THRESHOLD", "0.95")),
+        result_cache_size=int(os.getenv("RESULT_CACHE_MAX_ENTRIES", "512")),
+        embed_batch_size=int(os.getenv("EMBED_BATCH_SIZE", "64")),
+        registry_path=os.getenv("DOCUMENT_REGISTRY_PATH"),
+        hybrid_search=os.getenv("HYBRID_SEARCH", "true").lower() == "true",
+        hybrid_candidates=int(os.getenv("HYBRID_CANDIDATES", "20")),
+        lexical_fast_path=os.getenv("LEXICAL_FAST_PATH", "true").lower() == "true",
+        fast_path_coverage=float(os.getenv("LEXICAL_FAST_PATH_COVERAGE", "0.85")),
+        mmr_enabled=os.getenv("MMR_ENABLED", "true").lower() == "true",
+        mmr_fetch_k=int(os.getenv("MMR_FETCH_K", "20")),
+        mmr_lambda=float(os.getenv("MMR_LAMBDA", "0.7")),
+        mmr_dedup_threshold=float(os.getenv("MMR_DEDUP_THRESHOLD", "0.95")),
+        parse_workers=int(os.getenv("INGEST_PARSE_WORKERS", "2")),
+        parse_pages_per_task=int(os.getenv("INGEST_PAGES_PER_TASK", "16")),
+        parse_window=int(os.getenv("INGEST_PARSE_WINDOW", "4")),
+    )
+
+
+def _create_ingestion_jobs():
+    """文档入库任务队列"""
+    from tools.ingestion_jobs import IngestionJobManager
+
+    return IngestionJobManager(
+        rag_retriever,
+        max_workers=int(os.getenv("INGEST_WORKERS", "2")),
+    )
+
+
+def _create_search_tool():
+    """搜索工具"""
+    from tools import SearchTool
+
+    return SearchTool(
+        api_key=os.getenv("SERPAPI_KEY"),
+        endpoint=os.getenv("SERPAPI_ENDPOINT"),
+        timeout=float(os.getenv("SEARCH_TIMEOUT", "10")),
+        cache_ttl=float(os.getenv("SEARCH_CACHE_TTL", "300")),
+    )
+
+
+def _create_answer_cache():
+    """回答缓存（知识库更新后自动失效）"""
+    from agent import AnswerCache
+
+    similarity = float(os.getenv("ANSWER_CACHE_SIMILARITY", "0"))
+    return AnswerCache(
+        ttl=float(os.getenv("ANSWER_CACHE_TTL", "3600")),
+        max_entries=int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "1024")),
+        similarity_threshold=similarity if similarity > 0 else None,
+    )
+
+
+def _create_agent():
+    """智能 Agent"""
+    from agent import LangChainAgent
+
+    return LangChainAgent(
+        rag_retriever=rag_retriever,
+        search_tool=search_tool,
+        answer_cache=answer_cache
+    )
+
+
+def _create_summarizer():
+    """对话摘要：summary 模式下原文历史受 token 预算限制，更早的对话折叠进滚动摘要"""
+    from langchain_openai import ChatOpenAI
+    from memory import ConversationSummarizer
+
+    return ConversationSummarizer(
+        ChatOpenAI(
+            model=os.getenv("SUMMARY_MODEL") or os.getenv("OPENAI_MODEL", "gpt-3.5-turbo"),
+            temperature=0,
+            api_key=os.getenv("OPENAI_API_KEY"),
+            base_url=os.getenv("OPENAI_API_BASE")
+        ),
+        max_chars=int(os.getenv("SUMMARY_MAX_CHARS", "300"))
+    )
+
+
+def _create_component(name: str, factory: Callable[[], Any]) -> Any:
+    """
+    创建单个组件并记录耗时
+
+    失败时记录错误（/ready 中可见）并返回 None，该功能降级关闭；
+    STARTUP_STRICT=true 时直接抛出，中止启动。
+    """
+    start = time.perf_counter()
+    try:
+        component = factory()
+    except Exception as e:
+        startup_state["components"][name] = {
+            "status": "failed",
+            "seconds": round(time.perf_counter() - start, 3),
+            "error": f"{type(e).__name__}: {e}",
+        }
+        logger.exception("%s initialization failed: %s", name, e)
+        if STARTUP_STRICT:
+            raise
+        return None
+    startup_state["components"][name] = {"status": "ready", "seconds": round(time.perf_counter() - start, 3)}
+    logger.info("%s initialized in %.2fs", name, time.perf_counter() - start)
+    return component
+
+
+def initialize_components():
+    """按依赖顺序创建所有组件（在工作线程中执行，构造函数里的同步网络调用不阻塞事件循环）"""
+    global rag_retriever, ingestion_jobs, search_tool, answer_cache, smart_agent
+    global memory_token_budget, summarizer
+    from memory import get_memory_mode
+
+    rag_retriever = _create_component("rag_retriever", _create_rag_retriever)
+    if rag_retriever:
+        ingestion_jobs = _create_component("ingestion_jobs", _create_ingestion_jobs)
+    search_tool = _create_component("search_tool", _create_search_tool)
+    if os.getenv("ANSWER_CACHE_ENABLED", "true").lower() == "true":
+        answer_cache = _create_component("answer_cache", _create_answer_cache)
+    smart_agent = _create_component("agent", _create_agent)
+
+    if get_memory_mode() == "summary":
+        summarizer = _create_component("summarizer", _create_summarizer)
+        if summarizer:
+            memory_token_budget = int(os.getenv("MEMORY_TOKEN_BUDGET", "1500"))
+            logger.info("Summary memory enabled (token budget: %d)", memory_token_budget)
+
+
+async def _warm_up_step(name: str, warm_up: Callable[[], Any]) -> Dict[str, Any]:
+    start = time.perf_counter()
+    try:
+        await warm_up()
+        return {"status": "ok", "seconds": round(time.perf_counter() - start, 3)}
+    except Exception as e:
+        logger.warning("Warm-up of %s failed: %s", name, e)
+        return {"status": "failed", "seconds": round(time.perf_counter() - start, 3), "error": str(e)}
+
+
+async def warm_up():
+    """
+    预热：预先建立 LLM / 嵌入 / Redis 连接并访问一次向量索引
+
+    只是尽力而为，失败不影响服务，结果记录在 /ready 中。
+    """
+    from memory import warm_up_redis
+
+    steps = {"redis": lambda: warm_up_redis(int(os.getenv("WARMUP_REDIS_CONNECTIONS", "4")))}
+    if smart_agent:
+        steps["llm"] = smart_agent.awarm_up
+    if rag_retriever:
+        steps["rag"] = rag_retriever.awarm_up
+
+    start = time.perf_counter()
+    try:
+        results = await asyncio.wait_for(
+            asyncio.gather(*(_warm_up_step(name, step) for name, step in steps.items())),
+            timeout=float(os.getenv("WARMUP_TIMEOUT", "30"))
+        )
+        startup_state["warmup"] = dict(zip(steps, results))
+    except asyncio.TimeoutError:
+        startup_state["warmup"] = {"error": "timeout"}
+        logger.warning("Warm-up timed out")
+    startup_state["warmup_seconds"] = round(time.perf_counter() - start, 3)
+    startup_state["status"] = _readiness()
+
+
+def _readiness() -> str:
+    """ready: 全部组件可用；degraded: 可选组件失败但对话可用；failed: Agent 不可用"""
+    if not smart_agent:
+        return "failed"
+    if any(component["status"] == "failed" for component in startup_state["components"].values()):
+        return "degraded"
+    return "ready"
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """启动时创建组件、启动会话缓存订阅并（可选）后台预热；关闭时释放所有连接"""
+    from memory import start_session_cache, close_redis_pools
+
+    start = time.perf_counter()
+    await asyncio.to_thread(initialize_components)
+    # 启动会话缓存的跨 worker 失效订阅
+    start_session_cache()
+    startup_state["startup_seconds"] = round(time.perf_counter() - start, 3)
+
+    # 预热在后台进行，完成前 /ready 返回 503，/api 等接口照常服务
+    warmup_task = None
+    if os.getenv("WARMUP", "false").lower() == "true":
+        startup_state["status"] = "warming_up"
+        warmup_task = asyncio.create_task(warm_up())
+    else:
+        startup_state["status"] = _readiness()
+    logger.info("Startup finished in %.2fs (%s)", startup_state["startup_seconds"], startup_state["status"])
+
+    try:
+        yield
+    finally:
+        # 关闭 Redis、搜索、Qdrant 连接池和入库线程池
+        # 预热可能仍在使用 Redis 与 Qdrant 连接，等它真正退出后再关闭连接池
+        if warmup_task and not warmup_task.done():
+            warmup_task.cancel()
+            with suppress(asyncio.CancelledError):
+                await warmup_task
+        await close_redis_pools()
+        if search_tool:
+            await search_tool.aclose()
+        # 先等进行中的入库任务结束，再关闭它们用到的解析进程池
+        if ingestion_jobs:
+            # 等待可能持续很久，放到线程中，避免阻塞事件循环上其他连接的关闭
+            await asyncio.to_thread(ingestion_jobs.shutdown)
+        if rag_retriever:
+            await rag_retriever.aclose()
+
 # ========================================
 # FastAPI 应用
 # ========================================
 app = FastAPI(
     title="BCI Assistant API",
     description="基于 OpenAI 的脑机接口智能助手 API",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # CORS 中间件
@@ -33,36 +298,32 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# ========================================
-# 初始化组件
-# ========================================
-# RAG 检索器
-try:
-    rag_retriever = RAGRetriever(
-        collection_name=os.getenv("QDRANT_COLLECTION", "knowledge_base"),
-        chunk_size=int(os.getenv("CHUNK_SIZE", "1000")),
-        chunk_overlap=int(os.getenv("CHUNK_OVERLAP", "200")),
-    )
-    print("[INFO] RAG retriever initialized successfully")
-except Exception as e:
-    print(f"[WARNING] RAG retriever initialization failed: {e}")
-    rag_retriever = None
-
-# 搜索工具
-try:
-    search_tool = SearchTool(api_key=os.getenv("SERPAPI_KEY"))
-    print("[INFO] Search tool initialized successfully")
-except Exception as e:
-    print(f"[WARNING] Search tool initialization failed: {e}")
-    search_tool = None
-
-# 智能 Agent
-smart_agent = None
-try:
-    smart_agent = LangChainAgent(rag_retriever=rag_retriever, search_tool=search_tool)
-    print("[INFO] LangChain Agent initialized successfully")
-except Exception as e:
-    print(f"[WARNING] LangChain Agent initialization failed: {e}")
+# 回答完成后执行的后台任务（保持引用，避免被垃圾回收）
+background_tasks = set()
+
+# 对话指标（各阶段耗时由 observability.span 记录），通过 /metrics 导出
+TURN_SECONDS = REGISTRY.histogram(
+    "chat_turn_duration_seconds", "End-to-end duration of a chat turn", ("route",)
+)
+TURN_TTFT_SECONDS = REGISTRY.histogram(
+    "chat_time_to_first_token_seconds", "Time from receiving a query to sending its first content", ("route",)
+)
+TURNS = REGISTRY.counter("chat_turns", "Chat turns by outcome", ("status",))
+INFLIGHT_REQUESTS = REGISTRY.gauge("chat_inflight_requests", "Chat requests currently being processed")
+
+# 每个请求的阶段 trace 追加写入 JSON Lines 文件（为空表示不落盘）
+trace_dumper = TraceDumper(os.getenv("TRACE_DUMP_PATH")) if os.getenv("TRACE_DUMP_PATH") else None
+
+
+async def fold_session_history(redis_memory):
+    """把超出预算的早期对话折叠进摘要，失败只记录日志（下一轮会重试）"""
+    from memory import afold_conversation
+
+    try:
+        if await afold_conversation(redis_memory, summarizer, memory_token_budget):
+            logger.debug("Folded history of %s into summary", redis_memory.session_id)
+    except Exception as e:
+        logger.warning("History summarization failed: %s", e)
 
 # ========================================
 # API 端点
@@ -76,110 +337,303 @@ def read_root():
         "docs": "/docs"
     }
 
+@app.get("/ready")
+def readiness():
+    """就绪探针：组件创建（及可选预热）完成且 Agent 可用时返回 200，否则 503"""
+    code = 200 if startup_state["status"] in ("ready", "degraded") else 503
+    return JSONResponse(startup_state, status_code=code)
+
+@app.get("/metrics")
+def metrics():
+    """Prometheus 格式的指标（各阶段耗时直方图、首 token 时间、请求计数）"""
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
 @app.websocket("/ws/chat")
 async def websocket_chat(websocket: WebSocket):
     """
-    WebSocket 智能对话接口 - 流式输出
+    WebSocket 智能对话接口 - 流式输出，单连接多路并发
 
     消息格式:
-    发送: {"query": "用户问题", "session_id": "会话ID（可选）"}
-    接收: {"type": "content|done|error", "content": "内容", ...}
+    发送: {"type": "query", "request_id": "请求ID（可选）", "query": "用户问题", "session_id": "会话ID（可选）",
+           "no_cache": false, "trace": false}
+          {"type": "cancel", "request_id": "请求ID"}
+    接收: {"type": "content|done|complete|error|cancelled", "request_id": "请求ID", "content": "内容", ...}
+          {"type": "trace", "request_id": "请求ID", "trace": {...}}（请求带 trace: true 时，在回答保存后发送）
+
+    每个连接最多同时处理 WS_MAX_INFLIGHT 个请求；连接断开时取消所有进行中的请求
+    （同时中断上游 LLM 流式请求）。
+    连续的 content 会按时间窗口/字节数合并成一帧发送。
+    连接时带 ?encoding=msgpack 可改用 msgpack 二进制帧（收发均可）。
     """
     await websocket.accept()
+    sender = WebSocketStreamSender(
+        websocket,
+        encoding=websocket.query_params.get("encoding", "json"),
+        flush_interval=float(os.getenv("WS_FLUSH_INTERVAL_MS", "30")) / 1000,
+        flush_bytes=int(os.getenv("WS_FLUSH_BYTES", "1024")),
+        max_pending_bytes=int(os.getenv("WS_MAX_PENDING_BYTES", "262144")),
+    )
+    max_inflight = int(os.getenv("WS_MAX_INFLIGHT", "4"))
+    inflight: Dict[str, asyncio.Task] = {}
+
+    async def handle_query(request_id: str, query: str, session_id: str, use_cache: bool, want_trace: bool):
+        """处理单个请求，所有事件带上 request_id"""
+        from memory import create_async_session_memory, acreate_langchain_memory, asave_conversation_to_redis
+
+        # 本请求及其派生任务中的各阶段都记到这个 trace
+        trace = start_trace(request_id)
+        INFLIGHT_REQUESTS.inc()
+        status = "error"
+        route = None
+        first_content = None
+        try:
+            # 创建 Redis 记忆实例（共享异步连接池）
+            redis_memory = create_async_session_memory(session_id)
+
+            # 创建 LangChain Memory（从 Redis 异步加载历史）
+            with span("history_load"):
+                langchain_memory = await acreate_langchain_memory(redis_memory, memory_token_budget)
+
+            response_parts = []
+            failed = False
+            stream = smart_agent.chat_stream(query, memory=langchain_memory, use_cache=use_cache)
+            try:
+                async for chunk_data in stream:
+                    kind = chunk_data.get("type")
+                    # 收集完整回答
+                    if kind == "content":
+                        if first_content is None:
+                            first_content = time.perf_counter()
+                        response_parts.append(chunk_data.get("content", ""))
+                    elif kind == "complete":
+                        route = "cache" if chunk_data.get("cached") else chunk_data.get("route")
+                    elif kind == "error":
+                        failed = True
+
+                    # 发送到 WebSocket（content 合并发送，客户端过慢时在此等待）
+                    await sender.send({**chunk_data, "request_id": request_id})
+            finally:
+                # 被取消时显式关闭生成器，立即取消 Agent 任务和上游 HTTP 流
+                await stream.aclose()
+
+            # 保存对话到 Redis
+            full_response = "".join(response_parts)
+            if full_response:
+                with span("history_save"):
+                    await asave_conversation_to_redis(redis_memory, query, full_response)
+
+                # 回答已发出，摘要在后台生成，不影响本次和连接上的其他请求
+                if summarizer:
+                    task = asyncio.create_task(fold_session_history(redis_memory))
+                    background_tasks.add(task)
+                    task.add_done_callback(background_tasks.discard)
+
+            status = "error" if failed else "ok"
+            if want_trace:
+                await sender.send({"type": "trace", "request_id": request_id, "trace": trace.as_dict()})
+
+        except asyncio.CancelledError:
+            status = "cancelled"
+            logger.debug("Request %s cancelled", request_id)
+            raise
+        except WebSocketDisconnect:
+            pass
+        except Exception as e:
+            logger.exception("Stream error: %s", e)
+            try:
+                await sender.send({"type": "error", "request_id": request_id, "message": str(e)})
+            except WebSocketDisconnect:
+                pass
+        finally:
+            inflight.pop(request_id, None)
+            INFLIGHT_REQUESTS.dec()
+            TURNS.inc(status=status)
+            if status == "ok":
+                labels = {"route": route or "unknown"}
+                TURN_SECONDS.observe(time.perf_counter() - trace.started, **labels)
+                if first_content is not None:
+                    TURN_TTFT_SECONDS.observe(first_content - trace.started, **labels)
+            if trace_dumper:
+                # 写文件放到线程池，不阻塞事件循环（被取消时也照常落盘）
+                asyncio.get_running_loop().run_in_executor(
+                    None, trace_dumper.write, {**trace.as_dict(), "route": route, "status": status}
+                )
 
     try:
         while True:
-            # 接收客户端消息
-            data = await websocket.receive_json()
+            # 接收客户端消息（请求在后台任务中处理，这里随时可以收到 cancel）
+            try:
+                data = await receive_event(websocket)
+            except InvalidFrame as e:
+                # 坏帧只影响这一条消息，不能拖垮同一连接上其他进行中的请求
+                await sender.send({"type": "error", "message": str(e)})
+                continue
+
+            if data.get("type") == "cancel":
+                if not data.get("request_id"):
+                    await sender.send({"type": "error", "message": "cancel 缺少 request_id"})
+                    continue
+                request_id = str(data["request_id"])
+                task = inflight.get(request_id)
+                if task is None:
+                    await sender.send({"type": "error", "request_id": request_id, "message": "请求不存在或已结束"})
+                    continue
+                task.cancel()
+                await sender.send({"type": "cancelled", "request_id": request_id})
+                continue
+
+            request_id = str(data.get("request_id") or uuid.uuid4().hex)
+
             query = data.get("query", "")
             session_id = data.get("session_id")
 
-            if not query:
-                await websocket.send_json({"type": "error", "message": "查询不能为空"})
+            if not query or not isinstance(query, str):
+                await sender.send({"type": "error", "request_id": request_id, "message": "查询不能为空"})
                 continue
 
             if not smart_agent:
-                await websocket.send_json({"type": "error", "message": "Agent 功能未启用"})
+                await sender.send({"type": "error", "request_id": request_id, "message": "Agent 功能未启用"})
+                continue
+
+            if request_id in inflight:
+                await sender.send({"type": "error", "request_id": request_id, "message": "request_id 重复"})
                 continue
 
-            print(f"[DEBUG] WebSocket chat called with query: {query}")
+            if len(inflight) >= max_inflight:
+                await sender.send({
+                    "type": "error",
+                    "request_id": request_id,
+                    "message": f"并发请求数超过上限 {max_inflight}"
+                })
+                continue
+
+            logger.debug("WebSocket chat called with query: %s", query)
 
             # 生成 session_id
             if not session_id:
                 session_id = f"session_{int(datetime.now().timestamp() * 1000)}"
 
-            # 创建 Redis 记忆实例
-            redis_memory = create_session_memory(session_id)
-
-            # 创建 LangChain Memory（从 Redis 加载历史）
-            langchain_memory = create_langchain_memory(redis_memory)
-
-            try:
-                full_response = ""
-                async for chunk_data in smart_agent.chat_stream(query, memory=langchain_memory):
-                    # 收集完整回答
-                    if chunk_data.get("type") == "content":
-                        full_response += chunk_data.get("content", "")
-
-                    # 发送到 WebSocket
-                    await websocket.send_json(chunk_data)
-
-                # 保存对话到 Redis
-                if full_response:
-                    save_conversation_to_redis(redis_memory, query, full_response)
-
-            except Exception as e:
-                print(f"[ERROR] Stream error: {str(e)}")
-                import traceback
-                traceback.print_exc()
-                await websocket.send_json({"type": "error", "message": str(e)})
+            inflight[request_id] = asyncio.create_task(
+                handle_query(
+                    request_id, query, session_id,
+                    use_cache=not data.get("no_cache", False),
+                    want_trace=bool(data.get("trace", False))
+                )
+            )
 
     except WebSocketDisconnect:
-        print("[INFO] WebSocket disconnected")
+        logger.debug("WebSocket disconnected")
     except Exception as e:
-        print(f"[ERROR] WebSocket error: {str(e)}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("WebSocket error: %s", e)
+    finally:
+        # 断开连接：取消所有进行中的请求，不再等待 LLM 输出
+        tasks = list(inflight.values())
+        for task in tasks:
+            task.cancel()
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+        await sender.aclose()
 
 @app.post("/knowledge/upload_file")
 async def upload_file(file: UploadFile = File(...)):
     """
-    上传文件到知识库
+    上传文件到知识库（后台入库）
 
     支持格式: PDF, TXT, MD
+    文件落盘后立即返回 job_id，解析/嵌入/写入在工作线程池中执行，
+    通过 /knowledge/jobs/{job_id} 查询状态或 /ws/knowledge/jobs/{job_id} 订阅进度。
     """
-    if not rag_retriever:
+    if not ingestion_jobs:
         return {"error": "RAG功能未启用"}
 
+    file_ext = os.path.splitext(file.filename)[1].lower()
+    if file_ext not in ['.pdf', '.txt', '.md']:
+        return {"error": f"不支持的文件类型: {file_ext}"}
+
     try:
-        # 创建临时文件
-        with tempfile.NamedTemporaryFile(delete=False, suffix=os.path.splitext(file.filename)[1]) as tmp_file:
-            shutil.copyfileobj(file.file, tmp_file)
-            tmp_path = tmp_file.name
+        # 创建临时文件（复制放到线程中，避免大文件阻塞事件循环）
+        def save_upload() -> str:
+            with tempfile.NamedTemporaryFile(delete=False, suffix=file_ext) as tmp_file:
+                shutil.copyfileobj(file.file, tmp_file)
+                return tmp_file.name
+
+        tmp_path = await asyncio.to_thread(save_upload)
+        job = ingestion_jobs.submit(tmp_path, file.filename)
+
+        return {
+            "message": f"文件 {file.filename} 已加入入库队列",
+            "filename": file.filename,
+            "job_id": job["job_id"],
+            "status": job["status"]
+        }
+    except Exception as e:
+        logger.exception("Upload file error: %s", e)
+        return {"error": str(e)}
+
+@app.get("/knowledge/jobs/{job_id}")
+def get_ingestion_job(job_id: str):
+    """查询入库任务状态"""
+    if not ingestion_jobs:
+        return {"error": "RAG功能未启用"}
 
-        # 根据文件类型处理
-        file_ext = os.path.splitext(file.filename)[1].lower()
+    job = ingestion_jobs.get(job_id)
+    if not job:
+        return {"error": f"任务不存在: {job_id}"}
+    return job
 
-        if file_ext == '.pdf':
-            count = rag_retriever.add_pdf(tmp_path)
-        elif file_ext in ['.txt', '.md']:
-            count = rag_retriever.add_text_file(tmp_path)
-        else:
-            os.unlink(tmp_path)
-            return {"error": f"不支持的文件类型: {file_ext}"}
+@app.websocket("/ws/knowledge/jobs/{job_id}")
+async def websocket_ingestion_progress(websocket: WebSocket, job_id: str):
+    """
+    WebSocket 入库进度推送
+
+    接收: {"type": "status|progress", "job_id": "...", "stage": "parsed|split|embedded|indexed", ...}
+    任务结束（completed/failed）后服务端关闭连接
+    """
+    await websocket.accept()
 
-        # 删除临时文件
-        os.unlink(tmp_path)
+    if not ingestion_jobs:
+        await websocket.send_json({"type": "error", "message": "RAG功能未启用"})
+        await websocket.close()
+        return
 
+    queue = ingestion_jobs.subscribe(job_id)
+    try:
+        while True:
+            event = await queue.get()
+            if event is None:
+                break
+            await websocket.send_json(event)
+        await websocket.close()
+    except WebSocketDisconnect:
+        pass
+    finally:
+        ingestion_jobs.unsubscribe(job_id, queue)
+
+@app.get("/knowledge/documents")
+def list_documents():
+    """列出知识库中的文档"""
+    if not rag_retriever:
+        return {"error": "RAG功能未启用"}
+
+    return {"documents": rag_retriever.list_documents()}
+
+@app.delete("/knowledge/documents/{doc_id}")
+def delete_document(doc_id: str):
+    """删除文档及其全部向量"""
+    if not rag_retriever:
+        return {"error": "RAG功能未启用"}
+
+    try:
+        doc = rag_retriever.delete_document(doc_id)
+        if not doc:
+            return {"error": f"文档不存在: {doc_id}"}
         return {
-            "message": f"文件 {file.filename} 已添加到知识库",
-            "filename": file.filename,
-            "chunks_added": count
+            "message": f"文档 {doc['filename']} 已从知识库删除",
+            "doc_id": doc_id,
+            "chunks_removed": doc["chunk_count"]
         }
     except Exception as e:
-        print(f"[ERROR] Upload file error: {str(e)}")
-        import traceback
-        traceback.print_exc()
+        logger.error("Delete document error: %s", e)
         return {"error": str(e)}
 
 @app.get("/knowledge/info")
@@ -190,6 +644,8 @@ def get_knowledge_info():
 
     try:
         info = rag_retriever.get_collection_info()
+        if answer_cache:
+            info["answer_cache"] = answer_cache.get_stats()
         return info
     except Exception as e:
         return {"error": str(e)}
@@ -200,10 +656,18 @@ def get_knowledge_info():
 frontend_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), "frontend")
 if os.path.exists(frontend_path):
     app.mount("/", StaticFiles(directory=frontend_path, html=True), name="frontend")
-    print(f"[INFO] Frontend mounted at http://localhost:8000/")
+    logger.info("Frontend mounted at http://localhost:8000/")
 else:
-    print(f"[WARNING] Frontend directory not found at {frontend_path}")
+    logger.warning("Frontend directory not found at %s", frontend_path)
+
+startup_state["import_seconds"] = round(time.perf_counter() - _IMPORT_STARTED, 3)
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
+    uvicorn.run(
+        app,
+        host="0.0.0.0",
+        port=8000,
+        # 浏览器会自动协商 permessage-deflate，压缩合并后的文本帧
+        ws_per_message_deflate=os.getenv("WS_PER_MESSAGE_DEFLATE", "true").lower() == "true",
+    )
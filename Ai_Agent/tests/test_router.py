@@ -0,0 +1,57 @@
+"""查询路由测试"""
+import asyncio
+
+import pytest
+
+pytest.importorskip("langchain")
+
+from agent.router import QueryRouter, ROUTE_AGENT, ROUTE_DIRECT
+
+
+class _Reply:
+    def __init__(self, content):
+        self.content = content
+
+
+class _FakeClassifier:
+    """按给定内容回复的分类模型"""
+
+    def __init__(self, content):
+        self.content = content
+
+    async def ainvoke(self, prompt):
+        return _Reply(self.content)
+
+
+def _classify(content):
+    router = QueryRouter(classifier_llm=_FakeClassifier(content))
+    # 不命中任何规则，交给分类模型
+    return asyncio.run(router.aroute("脑电是什么")), router.stats
+
+
+@pytest.mark.parametrize("content", ["DIRECT", "DIR", "D", " direct.", "**DI"])
+def test_truncated_direct_label(content):
+    """输出被 max_tokens 截断时仍识别为直答"""
+    route, stats = _classify(content)
+    assert route == ROUTE_DIRECT
+    assert stats["classified"] == 1
+
+
+@pytest.mark.parametrize("content", ["TOOL", "TO", "T", "tool\n"])
+def test_truncated_tool_label(content):
+    route, _ = _classify(content)
+    assert route == ROUTE_AGENT
+
+
+@pytest.mark.parametrize("content", ["", "不确定", "MAYBE"])
+def test_unknown_label_falls_back_to_agent(content):
+    """无法识别的输出保守地走 Agent，不计入分类次数"""
+    route, stats = _classify(content)
+    assert route == ROUTE_AGENT
+    assert stats["classified"] == 0
+
+
+def test_rules_skip_classifier():
+    router = QueryRouter(classifier_llm=_FakeClassifier("DIRECT"))
+    assert asyncio.run(router.aroute("帮我搜索一下最新新闻")) == ROUTE_AGENT
+    assert router.stats["classified"] == 0
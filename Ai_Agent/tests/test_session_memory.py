@@ -0,0 +1,92 @@
+"""会话记忆测试（需要本地 Redis，连接不上时跳过）"""
+import asyncio
+import os
+
+import pytest
+
+redis = pytest.importorskip("redis")
+pytest.importorskip("langchain")
+
+from memory import session_memory
+
+
+@pytest.fixture
+def small_pool(monkeypatch):
+    """最多 2 条连接的进程级连接池"""
+    monkeypatch.setenv("REDIS_MAX_CONNECTIONS", "2")
+    monkeypatch.setenv("REDIS_POOL_TIMEOUT", "0.5")
+    monkeypatch.setattr(session_memory, "_redis_pool", None)
+    monkeypatch.setattr(session_memory, "_async_redis_pool", None)
+    try:
+        redis.Redis(
+            host=os.getenv("REDIS_HOST", "localhost"),
+            port=int(os.getenv("REDIS_PORT", 6379)),
+            socket_connect_timeout=0.5,
+        ).ping()
+    except redis.exceptions.ConnectionError:
+        pytest.skip("Redis is not available")
+    yield
+    asyncio.run(session_memory.close_redis_pools())
+
+
+def test_async_pool_queues_beyond_max_connections(small_pool):
+    """并发数超过连接池上限时排队等待，而不是抛出 Too many connections"""
+    async def run():
+        client = redis.asyncio.Redis(connection_pool=session_memory.get_async_redis_pool())
+        results = await asyncio.gather(*(client.ping() for _ in range(50)))
+        await session_memory.get_async_redis_pool().disconnect()
+        return results
+
+    assert all(asyncio.run(run()))
+
+
+def test_async_pool_times_out_when_exhausted(small_pool):
+    """连接一直不归还时，等待 REDIS_POOL_TIMEOUT 后报错"""
+    async def run():
+        pool = session_memory.get_async_redis_pool()
+        held = [await pool.get_connection("PING") for _ in range(2)]
+        try:
+            with pytest.raises(redis.exceptions.ConnectionError):
+                await pool.get_connection("PING")
+        finally:
+            for connection in held:
+                await pool.release(connection)
+            await pool.disconnect()
+
+    asyncio.run(run())
+
+
+def test_sync_pool_queues_beyond_max_connections(small_pool):
+    """同步连接池在线程并发超过上限时同样排队"""
+    from concurrent.futures import ThreadPoolExecutor
+
+    client = redis.Redis(connection_pool=session_memory.get_redis_pool())
+    with ThreadPoolExecutor(max_workers=10) as executor:
+        assert all(executor.map(lambda _: client.ping(), range(50)))
+
+
+def test_fold_skipped_when_version_changed(small_pool):
+    """快照之后会话有新写入时放弃折叠，不覆盖新数据"""
+    async def run():
+        client = redis.asyncio.Redis(connection_pool=session_memory.get_async_redis_pool())
+        memory = session_memory.AsyncChatMemory("test-fold-race", client, max_history=10)
+        await client.delete(memory.key, memory.summary_key, memory.summary_lock_key, memory.version_key)
+        try:
+            await memory.add_turn("q1", "a1")
+            _, _, version = await memory.get_snapshot()
+            assert await memory.try_lock_summary()
+            await memory.add_turn("q2", "a2")
+            assert not await memory.fold(2, "stale summary", version)
+            assert await memory.get_summary() == ""
+            assert len(await memory.get_history()) == 4
+            # 放弃折叠时释放锁，下一轮可以重新折叠
+            history, _, version = await memory.get_snapshot()
+            assert await memory.try_lock_summary()
+            assert await memory.fold(2, "summary", version)
+            assert await memory.get_summary() == "summary"
+            assert [m["content"] for m in await memory.get_history()] == ["q2", "a2"]
+        finally:
+            await client.delete(memory.key, memory.summary_key, memory.summary_lock_key, memory.version_key)
+            await session_memory.get_async_redis_pool().disconnect()
+
+    asyncio.run(run())
@@ -1,5 +1,5 @@
 """工具模块"""
-from .search import SearchTool
+from .search import SearchTool, SearchError
 from .tool_factory import create_rag_tool, create_search_tool
 
-__all__ = ["SearchTool", "create_rag_tool", "create_search_tool"]
+__all__ = ["SearchTool", "SearchError", "create_rag_tool", "create_search_tool"]
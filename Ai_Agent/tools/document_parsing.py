@@ -0,0 +1,128 @@
+"""文档解析流水线 - PDF 按页区间在进程池中解析并分块，片段按页序流式产出
+
+解析（pypdf 文本抽取）和分块都是纯 CPU 计算，放到子进程中可以绕开 GIL；
+同时在途的页区间数有上限，内存占用由窗口大小而不是文档大小决定。
+"""
+from typing import Deque, Dict, Iterator, List, Optional, Tuple
+from collections import deque
+from concurrent.futures import Executor, Future, ProcessPoolExecutor
+import multiprocessing
+
+
+# (片段文本, 元数据)；跨进程传递时比 Document 对象更轻
+Chunk = Tuple[str, dict]
+
+# 工作进程内按 (chunk_size, chunk_overlap) 复用分割器
+_splitters: Dict[Tuple[int, int], object] = {}
+
+
+def _get_splitter(chunk_size: int, chunk_overlap: int):
+    from langchain.text_splitter import RecursiveCharacterTextSplitter
+
+    key = (chunk_size, chunk_overlap)
+    splitter = _splitters.get(key)
+    if splitter is None:
+        splitter = _splitters[key] = RecursiveCharacterTextSplitter(
+            chunk_size=chunk_size,
+            chunk_overlap=chunk_overlap
+        )
+    return splitter
+
+
+def count_pdf_pages(path: str) -> int:
+    """PDF 页数（只读取页树，不抽取文本）"""
+    from pypdf import PdfReader
+
+    return len(PdfReader(path).pages)
+
+
+def parse_pdf_range(path: str, start: int, end: int, chunk_size: int, chunk_overlap: int) -> List[Chunk]:
+    """
+    解析 [start, end) 页并逐页分块（在工作进程中执行）
+
+    与 PyPDFLoader + split_documents 的结果一致：每页单独分块，元数据为 {"source", "page"}。
+    """
+    from pypdf import PdfReader
+
+    reader = PdfReader(path)
+    splitter = _get_splitter(chunk_size, chunk_overlap)
+    chunks = []
+    for page_number in range(start, min(end, len(reader.pages))):
+        text = reader.pages[page_number].extract_text()
+        for piece in splitter.split_text(text):
+            chunks.append((piece, {"source": path, "page": page_number}))
+    return chunks
+
+
+def create_parse_pool(workers: int) -> Optional[ProcessPoolExecutor]:
+    """
+    创建解析进程池
+
+    Args:
+        workers: 进程数，0 表示在调用线程中解析
+
+    Returns:
+        进程池或 None
+    """
+    if workers <= 0:
+        return None
+    # spawn：服务进程中有事件循环和线程池，fork 可能把其他线程持有的锁带进子进程
+    return ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+
+
+def iter_pdf_chunks(
+    path: str,
+    chunk_size: int,
+    chunk_overlap: int,
+    executor: Optional[Executor] = None,
+    pages_per_task: int = 16,
+    window: int = 4
+) -> Iterator[Tuple[int, int, List[Chunk]]]:
+    """
+    按页区间解析 PDF，按页序产出片段
+
+    最多 window 个页区间同时在途；取走一个区间的结果后立即提交下一个，
+    调用方嵌入当前片段时后面的页仍在解析。
+
+    Args:
+        path: PDF 文件路径
+        chunk_size: 分块大小
+        chunk_overlap: 分块重叠
+        executor: 解析进程池，None 时在当前线程中逐区间解析
+        pages_per_task: 每个任务解析的页数
+        window: 在途页区间数上限
+
+    Yields:
+        (已解析页数, 总页数, 该区间的片段列表)
+    """
+    total = count_pdf_pages(path)
+    pages_per_task = max(1, pages_per_task)
+    ranges = [(start, min(start + pages_per_task, total)) for start in range(0, total, pages_per_task)]
+
+    # 单个区间的小文档不值得跨进程传输
+    if executor is None or len(ranges) <= 1:
+        for start, end in ranges:
+            yield end, total, parse_pdf_range(path, start, end, chunk_size, chunk_overlap)
+        return
+
+    remaining = iter(ranges)
+    pending: Deque[Tuple[int, Future]] = deque()
+
+    def submit_next():
+        page_range = next(remaining, None)
+        if page_range is not None:
+            start, end = page_range
+            pending.append((end, executor.submit(parse_pdf_range, path, start, end, chunk_size, chunk_overlap)))
+
+    try:
+        for _ in range(max(1, window)):
+            submit_next()
+        while pending:
+            end, future = pending.popleft()
+            chunks = future.result()
+            submit_next()
+            yield end, total, chunks
+    finally:
+        # 调用方出错或提前停止时，取消还没开始的区间
+        for _, future in pending:
+            future.cancel()
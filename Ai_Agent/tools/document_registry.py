@@ -0,0 +1,194 @@
+"""文档登记表 - 增量维护知识库中的文档、片段与向量数量"""
+from typing import Dict, List, Optional, Set, Any, Iterator, Tuple
+from contextlib import contextmanager
+from datetime import datetime
+import json
+import logging
+import os
+import threading
+
+try:
+    import fcntl
+except ImportError:  # Windows：没有 flock，只能单进程使用持久化登记表
+    fcntl = None
+
+
+logger = logging.getLogger(__name__)
+
+
+class DocumentRegistry:
+    """知识库文档登记表
+
+    入库和删除时增量更新，空判断和统计信息无需访问 Qdrant 或嵌入 API。
+    配置 path 时持久化为 JSON 文件，多个 worker 共享：文件被其他 worker 替换后自动重新加载，
+    写入时持有文件锁（path + ".lock"），"重新加载-修改-写回"在进程间互斥，不会丢失并发写入。
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        """
+        初始化文档登记表
+
+        Args:
+            path: JSON 持久化路径（为空则只保存在内存中）
+        """
+        self.path = path
+        self._docs: Dict[str, Dict[str, Any]] = {}
+        self._total_chunks = 0
+        # 已加载文件的 (inode, 修改时间 ns)；os.replace 写入新文件，inode 也会变化
+        self._stamp: Optional[Tuple[int, int]] = None
+        # 每次内容变化递增，供词法索引等派生结构判断是否需要同步
+        self.generation = 0
+        self._lock = threading.Lock()
+        self._load()
+
+    def _load(self):
+        """从 JSON 文件加载"""
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            stamp = self._file_stamp()
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            self._docs = data.get("documents", {})
+            self._total_chunks = sum(doc["chunk_count"] for doc in self._docs.values())
+            self._stamp = stamp
+            self.generation += 1
+        except Exception as e:
+            logger.warning("Failed to load document registry %s: %s", self.path, e)
+
+    def _file_stamp(self) -> Tuple[int, int]:
+        stat = os.stat(self.path)
+        return stat.st_ino, stat.st_mtime_ns
+
+    def _refresh(self):
+        """其他进程写入过登记表时重新加载"""
+        if not self.path:
+            return
+        try:
+            stamp = self._file_stamp()
+        except OSError:
+            return
+        if stamp != self._stamp:
+            self._load()
+
+    @contextmanager
+    def _write_lock(self) -> Iterator[None]:
+        """进程内锁 + 跨进程文件锁；持锁期间先重新加载，保证在最新内容上修改"""
+        with self._lock:
+            if not self.path or fcntl is None:
+                self._refresh()
+                yield
+                return
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with open(f"{self.path}.lock", "a") as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    self._refresh()
+                    yield
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _save(self):
+        """原子写入 JSON 文件"""
+        if not self.path:
+            return
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"documents": self._docs}, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+        self._stamp = self._file_stamp()
+
+    def get_chunk_ids(self, doc_id: str) -> Set[str]:
+        """获取文档已登记的片段 ID"""
+        with self._lock:
+            self._refresh()
+            doc = self._docs.get(doc_id)
+            return set(doc["chunk_ids"]) if doc else set()
+
+    def all_chunk_ids(self) -> Set[str]:
+        """获取所有已登记的片段 ID"""
+        with self._lock:
+            self._refresh()
+            return {chunk_id for doc in self._docs.values() for chunk_id in doc["chunk_ids"]}
+
+    def get_generation(self) -> int:
+        """获取当前内容版本（会先检查其他进程的写入）"""
+        with self._lock:
+            self._refresh()
+            return self.generation
+
+    def set_document(self, doc_id: str, filename: str, chunk_ids: List[str]):
+        """登记或更新文档的片段列表"""
+        with self._write_lock():
+            old = self._docs.get(doc_id)
+            if old:
+                self._total_chunks -= old["chunk_count"]
+            if chunk_ids:
+                self._docs[doc_id] = {
+                    "doc_id": doc_id,
+                    "filename": filename,
+                    "chunk_ids": list(chunk_ids),
+                    "chunk_count": len(chunk_ids),
+                    "updated_at": datetime.now().isoformat()
+                }
+                self._total_chunks += len(chunk_ids)
+            else:
+                self._docs.pop(doc_id, None)
+            self.generation += 1
+            self._save()
+
+    def remove_document(self, doc_id: str) -> Optional[Dict[str, Any]]:
+        """移除文档登记，返回被移除的文档信息"""
+        with self._write_lock():
+            doc = self._docs.pop(doc_id, None)
+            if doc:
+                self._total_chunks -= doc["chunk_count"]
+                self.generation += 1
+                self._save()
+            return doc
+
+    def get_document(self, doc_id: str) -> Optional[Dict[str, Any]]:
+        """获取文档信息（不含片段 ID 列表）"""
+        with self._lock:
+            self._refresh()
+            doc = self._docs.get(doc_id)
+            return self._public(doc) if doc else None
+
+    def list_documents(self) -> List[Dict[str, Any]]:
+        """列出所有文档（不含片段 ID 列表）"""
+        with self._lock:
+            self._refresh()
+            return [self._public(doc) for doc in self._docs.values()]
+
+    def rebuild(self, documents: Dict[str, Dict[str, Any]]):
+        """用从向量库扫描得到的结果整体重建登记表"""
+        with self._write_lock():
+            self._docs = documents
+            self._total_chunks = sum(doc["chunk_count"] for doc in documents.values())
+            self.generation += 1
+            self._save()
+
+    def is_empty(self) -> bool:
+        """知识库是否为空"""
+        with self._lock:
+            self._refresh()
+            return self._total_chunks == 0
+
+    def get_stats(self) -> Dict[str, int]:
+        """获取统计信息（每个片段对应一个向量）"""
+        with self._lock:
+            self._refresh()
+            return {
+                "documents_count": len(self._docs),
+                "chunks_count": self._total_chunks,
+                "vectors_count": self._total_chunks
+            }
+
+    @staticmethod
+    def _public(doc: Dict[str, Any]) -> Dict[str, Any]:
+        return {k: v for k, v in doc.items() if k != "chunk_ids"}
@@ -0,0 +1,199 @@
+"""Embedding 缓存 - 基于内容哈希的磁盘 LRU 缓存，避免重复嵌入相同文本"""
+from typing import List, Dict, Optional
+from array import array
+from langchain_core.embeddings import Embeddings
+import asyncio
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+
+class CachedEmbeddings(Embeddings):
+    """在任意 Embeddings 前加一层 SQLite 磁盘缓存
+
+    - 键为 sha256(模型名 + 文本)，模型变更后自动失效
+    - 按最近访问时间做容量受限的 LRU 淘汰
+    - 记录命中/未命中次数
+    """
+
+    # SQLite 单条语句的参数数量上限为 999
+    _BATCH = 500
+
+    def __init__(
+        self,
+        underlying: Embeddings,
+        cache_path: str,
+        max_entries: int = 100000,
+        model_name: Optional[str] = None,
+    ):
+        """
+        初始化 Embedding 缓存
+
+        Args:
+            underlying: 实际执行嵌入的 Embeddings 实例
+            cache_path: SQLite 缓存文件路径
+            max_entries: 最大缓存条目数
+            model_name: 模型名称（默认从 underlying.model 读取）
+        """
+        self.underlying = underlying
+        self.max_entries = max_entries
+        self.model_name = model_name or getattr(underlying, "model", "") or ""
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        cache_dir = os.path.dirname(cache_path)
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+        self._conn = sqlite3.connect(cache_path, check_same_thread=False)
+        # WAL 允许多个 worker 进程并发读同一个缓存文件
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            "key TEXT PRIMARY KEY, vector BLOB NOT NULL, last_access REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_last_access ON embeddings(last_access)")
+        self._conn.commit()
+        self._size = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    def _key(self, text: str) -> str:
+        """计算缓存键"""
+        return hashlib.sha256(f"{self.model_name}\x00{text}".encode("utf-8")).hexdigest()
+
+    def _lookup(self, keys: List[str]) -> Dict[str, List[float]]:
+        """批量读取缓存并刷新访问时间"""
+        found = {}
+        now = time.time()
+        with self._lock:
+            for i in range(0, len(keys), self._BATCH):
+                batch = keys[i:i + self._BATCH]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", batch
+                ).fetchall()
+                for key, blob in rows:
+                    found[key] = array("f", blob).tolist()
+                if rows:
+                    self._conn.execute(
+                        f"UPDATE embeddings SET last_access = ? WHERE key IN ({placeholders})",
+                        [now, *batch]
+                    )
+            self._conn.commit()
+        return found
+
+    def _store(self, items: Dict[str, List[float]]):
+        """写入缓存并按 LRU 淘汰超出容量的条目"""
+        if not items:
+            return
+        now = time.time()
+        keys = list(items)
+        with self._lock:
+            # 条目数增量维护：只统计本批中已存在的键（主键查找），不对整表 COUNT(*)
+            existing = 0
+            for i in range(0, len(keys), self._BATCH):
+                batch = keys[i:i + self._BATCH]
+                placeholders = ",".join("?" * len(batch))
+                existing += self._conn.execute(
+                    f"SELECT COUNT(*) FROM embeddings WHERE key IN ({placeholders})", batch
+                ).fetchone()[0]
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, vector, last_access) VALUES (?, ?, ?)",
+                [(key, array("f", vector).tobytes(), now) for key, vector in items.items()]
+            )
+            self._size += len(keys) - existing
+            if self._size > self.max_entries:
+                # 其他 worker 进程也会写入同一文件，淘汰前校准一次真实条目数
+                self._size = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+            overflow = self._size - self.max_entries
+            if overflow > 0:
+                self._conn.execute(
+                    "DELETE FROM embeddings WHERE key IN ("
+                    "SELECT key FROM embeddings ORDER BY last_access ASC LIMIT ?)",
+                    (overflow,)
+                )
+                self._size -= overflow
+            self._conn.commit()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """嵌入文档列表，只对未命中缓存的文本调用底层模型"""
+        keys = [self._key(text) for text in texts]
+        cached = self._lookup(list(set(keys)))
+
+        # 同一批次内重复的文本只嵌入一次
+        missing: Dict[str, str] = {}
+        for key, text in zip(keys, texts):
+            if key not in cached and key not in missing:
+                missing[key] = text
+
+        self.hits += len(texts) - len(missing)
+        self.misses += len(missing)
+
+        if missing:
+            vectors = self.underlying.embed_documents(list(missing.values()))
+            new_items = dict(zip(missing.keys(), vectors))
+            self._store(new_items)
+            cached.update(new_items)
+
+        return [cached[key] for key in keys]
+
+    def embed_query(self, text: str) -> List[float]:
+        """嵌入查询文本（命中缓存时不调用 API）"""
+        key = self._key(text)
+        cached = self._lookup([key])
+        if key in cached:
+            self.hits += 1
+            return cached[key]
+
+        self.misses += 1
+        vector = self.underlying.embed_query(text)
+        self._store({key: vector})
+        return vector
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        """异步嵌入文档列表（SQLite 读写放到线程中，未命中部分异步调用底层模型）"""
+        keys = [self._key(text) for text in texts]
+        cached = await asyncio.to_thread(self._lookup, list(set(keys)))
+
+        missing: Dict[str, str] = {}
+        for key, text in zip(keys, texts):
+            if key not in cached and key not in missing:
+                missing[key] = text
+
+        self.hits += len(texts) - len(missing)
+        self.misses += len(missing)
+
+        if missing:
+            vectors = await self.underlying.aembed_documents(list(missing.values()))
+            new_items = dict(zip(missing.keys(), vectors))
+            await asyncio.to_thread(self._store, new_items)
+            cached.update(new_items)
+
+        return [cached[key] for key in keys]
+
+    async def aembed_query(self, text: str) -> List[float]:
+        """异步嵌入查询文本（命中时会更新访问时间并提交，SQLite 操作不放在事件循环上）"""
+        key = self._key(text)
+        cached = await asyncio.to_thread(self._lookup, [key])
+        if key in cached:
+            self.hits += 1
+            return cached[key]
+
+        self.misses += 1
+        vector = await self.underlying.aembed_query(text)
+        await asyncio.to_thread(self._store, {key: vector})
+        return vector
+
+    def get_stats(self) -> dict:
+        """获取缓存统计信息"""
+        total = self.hits + self.misses
+        return {
+            "model": self.model_name,
+            "entries": self._size,
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0
+        }
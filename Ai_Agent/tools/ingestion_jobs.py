@@ -0,0 +1,182 @@
+"""文档入库任务队列 - 在工作线程池中执行解析、嵌入和写入，不阻塞事件循环"""
+from typing import Dict, List, Optional, Any
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+import asyncio
+import logging
+import os
+import threading
+import uuid
+
+
+logger = logging.getLogger(__name__)
+
+
+class IngestionJobManager:
+    """文档入库任务管理器
+
+    上传接口只负责落盘并提交任务，立即返回 job_id；
+    解析、分块、嵌入、写入都在线程池中执行，进度事件推送给订阅者。
+    """
+
+    # 任务的终止状态
+    FINISHED = ("completed", "failed")
+
+    def __init__(self, rag_retriever, max_workers: int = 2, max_jobs: int = 200):
+        """
+        初始化任务管理器
+
+        Args:
+            rag_retriever: RAG 检索器实例
+            max_workers: 并发入库任务数
+            max_jobs: 保留的历史任务数量
+        """
+        self.rag_retriever = rag_retriever
+        self.max_jobs = max_jobs
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="ingest")
+        self._jobs: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._subscribers: Dict[str, List[asyncio.Queue]] = {}
+        self._lock = threading.Lock()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def submit(self, file_path: str, filename: str) -> Dict[str, Any]:
+        """
+        提交入库任务（需在事件循环中调用）
+
+        Args:
+            file_path: 已落盘的临时文件路径，任务结束后删除
+            filename: 原始文件名
+
+        Returns:
+            任务状态字典
+        """
+        self._loop = asyncio.get_running_loop()
+        job_id = uuid.uuid4().hex
+        job = {
+            "job_id": job_id,
+            "filename": filename,
+            "status": "queued",
+            "progress": {},
+            "result": None,
+            "error": None,
+            "created_at": datetime.now().isoformat(),
+            "finished_at": None
+        }
+        with self._lock:
+            self._jobs[job_id] = job
+            self._evict()
+        self.executor.submit(self._run, job_id, file_path)
+        return dict(job)
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """获取任务状态快照"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job else None
+
+    def subscribe(self, job_id: str) -> asyncio.Queue:
+        """订阅任务进度事件；任务结束后队列收到 None"""
+        queue: asyncio.Queue = asyncio.Queue()
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or job["status"] in self.FINISHED:
+                if job is not None:
+                    queue.put_nowait(self._status_event(job))
+                queue.put_nowait(None)
+                return queue
+            self._subscribers.setdefault(job_id, []).append(queue)
+            queue.put_nowait(self._status_event(job))
+        return queue
+
+    def unsubscribe(self, job_id: str, queue: asyncio.Queue):
+        """取消订阅"""
+        with self._lock:
+            queues = self._subscribers.get(job_id, [])
+            if queue in queues:
+                queues.remove(queue)
+
+    def shutdown(self):
+        """关闭线程池（等待进行中的任务完成）"""
+        self.executor.shutdown(wait=True)
+
+    @staticmethod
+    def _status_event(job: Dict[str, Any]) -> Dict[str, Any]:
+        return {
+            "type": "status",
+            "job_id": job["job_id"],
+            "status": job["status"],
+            "progress": dict(job["progress"]),
+            "result": job["result"],
+            "error": job["error"]
+        }
+
+    def _evict(self):
+        """淘汰最早的已结束任务"""
+        while len(self._jobs) > self.max_jobs:
+            for job_id, job in self._jobs.items():
+                if job["status"] in self.FINISHED:
+                    del self._jobs[job_id]
+                    break
+            else:
+                return
+
+    def _publish(self, job_id: str, event: Optional[Dict[str, Any]]):
+        """从工作线程把事件投递到事件循环中的订阅队列"""
+        with self._lock:
+            queues = list(self._subscribers.get(job_id, []))
+            if event is None:
+                self._subscribers.pop(job_id, None)
+        if not queues or self._loop is None:
+            return
+        for queue in queues:
+            self._loop.call_soon_threadsafe(queue.put_nowait, event)
+
+    def _update(self, job_id: str, **fields):
+        with self._lock:
+            self._jobs[job_id].update(fields)
+            event = self._status_event(self._jobs[job_id])
+        self._publish(job_id, event)
+
+    def _run(self, job_id: str, file_path: str):
+        """在工作线程中执行入库"""
+        job = self.get(job_id)
+        filename = job["filename"]
+        self._update(job_id, status="running")
+
+        def on_progress(event: dict):
+            with self._lock:
+                self._jobs[job_id]["progress"].update(
+                    {k: v for k, v in event.items() if k != "stage"}
+                )
+            self._publish(job_id, {"type": "progress", "job_id": job_id, **event})
+
+        try:
+            file_ext = os.path.splitext(filename)[1].lower()
+            if file_ext == '.pdf':
+                stats = self.rag_retriever.add_pdf(file_path, source_name=filename, progress_callback=on_progress)
+            else:
+                stats = self.rag_retriever.add_text_file(file_path, source_name=filename, progress_callback=on_progress)
+
+            self._update(
+                job_id,
+                status="completed",
+                result={
+                    "message": f"文件 {filename} 已添加到知识库",
+                    "filename": filename,
+                    "chunks_total": stats["chunks_total"],
+                    "chunks_added": stats["added"],
+                    "chunks_unchanged": stats["unchanged"],
+                    "chunks_removed": stats["removed"]
+                },
+                finished_at=datetime.now().isoformat()
+            )
+        except Exception as e:
+            logger.exception("Ingestion job %s failed: %s", job_id, e)
+            self._update(job_id, status="failed", error=str(e), finished_at=datetime.now().isoformat())
+        finally:
+            try:
+                os.unlink(file_path)
+            except OSError:
+                pass
+            self._publish(job_id, None)
@@ -0,0 +1,165 @@
+"""词法索引 - 本地 BM25 倒排索引，与向量库在入库时同步维护"""
+from typing import Dict, List, Optional, Tuple, Any
+from collections import Counter
+import math
+import re
+import threading
+
+
+# 英文/数字词（保留型号、电极名里的 - . _，如 EEG-64、Fp1、v2.1）与连续的中日韩字符
+_TOKEN_RE = re.compile("[a-z0-9]+(?:[-._][a-z0-9]+)*|[\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff]+")
+_CJK_RE = re.compile("[\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff]")
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    分词：英文数字按词切分（复合词同时保留各部分），中文按字符二元组切分
+
+    Args:
+        text: 输入文本
+
+    Returns:
+        词项列表
+    """
+    tokens = []
+    for match in _TOKEN_RE.findall(text.lower()):
+        if _CJK_RE.match(match):
+            if len(match) == 1:
+                tokens.append(match)
+            else:
+                tokens.extend(match[i:i + 2] for i in range(len(match) - 1))
+        else:
+            tokens.append(match)
+            parts = re.split(r"[-._]", match)
+            if len(parts) > 1:
+                tokens.extend(part for part in parts if part)
+    return tokens
+
+
+class BM25Index:
+    """内存 BM25 倒排索引
+
+    以 Qdrant 点 ID 为文档键，同时保存片段文本和元数据，
+    词法快速路径命中时无需访问向量库即可返回结果。
+    """
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        """
+        初始化 BM25 索引
+
+        Args:
+            k1: 词频饱和参数
+            b: 长度归一化参数
+        """
+        self.k1 = k1
+        self.b = b
+        self._postings: Dict[str, Dict[str, int]] = {}
+        self._doc_len: Dict[str, int] = {}
+        self._docs: Dict[str, Tuple[str, Dict[str, Any]]] = {}
+        self._total_len = 0
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._doc_len)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._doc_len
+
+    def keys(self) -> List[str]:
+        """所有已索引的文档键"""
+        with self._lock:
+            return list(self._doc_len.keys())
+
+    def add(self, key: str, text: str, metadata: Optional[Dict[str, Any]] = None):
+        """添加或替换一个片段"""
+        terms = Counter(tokenize(text))
+        with self._lock:
+            self._remove_locked(key)
+            for term, tf in terms.items():
+                self._postings.setdefault(term, {})[key] = tf
+            length = sum(terms.values())
+            self._doc_len[key] = length
+            self._total_len += length
+            self._docs[key] = (text, metadata or {})
+
+    def remove(self, key: str):
+        """移除一个片段"""
+        with self._lock:
+            self._remove_locked(key)
+
+    def _remove_locked(self, key: str):
+        if key not in self._doc_len:
+            return
+        text, _ = self._docs.pop(key)
+        for term in set(tokenize(text)):
+            postings = self._postings.get(term)
+            if postings is not None:
+                postings.pop(key, None)
+                if not postings:
+                    del self._postings[term]
+        self._total_len -= self._doc_len.pop(key)
+
+    def get(self, key: str) -> Optional[Tuple[str, Dict[str, Any]]]:
+        """获取片段文本和元数据"""
+        return self._docs.get(key)
+
+    def _idf(self, df: int, n: int) -> float:
+        return math.log(1 + (n - df + 0.5) / (df + 0.5))
+
+    def search(self, query: str, top_n: int = 10) -> Tuple[List[Tuple[str, float]], float]:
+        """
+        BM25 检索
+
+        Args:
+            query: 查询文本
+            top_n: 返回数量
+
+        Returns:
+            ([(文档键, 分数), ...], 第一名对查询词 IDF 的覆盖率 0~1)
+        """
+        terms = list(dict.fromkeys(tokenize(query)))
+        with self._lock:
+            n = len(self._doc_len)
+            if n == 0 or not terms:
+                return [], 0.0
+            avg_len = self._total_len / n
+
+            # 未出现在词表中的词按 df=0 计入总 IDF，用于衡量覆盖率
+            idfs = {term: self._idf(len(self._postings.get(term, ())), n) for term in terms}
+            scores: Dict[str, float] = {}
+            for term in terms:
+                postings = self._postings.get(term)
+                if not postings:
+                    continue
+                idf = idfs[term]
+                for key, tf in postings.items():
+                    norm = self.k1 * (1 - self.b + self.b * self._doc_len[key] / avg_len)
+                    scores[key] = scores.get(key, 0.0) + idf * tf * (self.k1 + 1) / (tf + norm)
+
+            if not scores:
+                return [], 0.0
+
+            ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:top_n]
+            top_key = ranked[0][0]
+            matched_idf = sum(idf for term, idf in idfs.items() if top_key in self._postings.get(term, ()))
+            total_idf = sum(idfs.values())
+            coverage = matched_idf / total_idf if total_idf > 0 else 0.0
+            return ranked, coverage
+
+
+def reciprocal_rank_fusion(rankings: List[List[str]], k: int = 60) -> List[Tuple[str, float]]:
+    """
+    倒数排名融合
+
+    Args:
+        rankings: 多路检索结果（按相关度排序的文档键列表）
+        k: 平滑常数
+
+    Returns:
+        按融合分数排序的 [(文档键, 分数), ...]
+    """
+    scores: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, key in enumerate(ranking, 1):
+            scores[key] = scores.get(key, 0.0) + 1.0 / (k + rank)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
@@ -0,0 +1,15 @@
+"""OpenAI 客户端连接预热 - Agent 的 LLM 与 RAG 的嵌入接口共用"""
+from typing import Any
+
+
+async def open_connection(resource: Any):
+    """通过 openai 客户端资源（如 chat.completions、embeddings）所属的客户端请求一次 /models，建立连接池中的连接"""
+    client = getattr(resource, "_client", None)
+    if client is None:
+        return
+    try:
+        await client.models.list()
+    except Exception as e:
+        # 兼容接口不一定实现 /models；收到 HTTP 响应说明连接已经建立
+        if getattr(e, "status_code", None) is None:
+            raise
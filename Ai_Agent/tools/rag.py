@@ -1,13 +1,59 @@
 """RAG 模块 - 使用 LangChain 内置组件实现文档检索"""
-from typing import List, Optional
-from langchain_community.document_loaders import PyPDFLoader, TextLoader
+from typing import List, Optional, Callable, Dict, Iterable, Tuple
+from langchain_community.document_loaders import TextLoader
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain_community.vectorstores import Qdrant
 from langchain_openai import OpenAIEmbeddings
 from langchain_core.documents import Document
-from qdrant_client import QdrantClient
-from qdrant_client.models import Distance, VectorParams
+from qdrant_client import QdrantClient, AsyncQdrantClient
+from qdrant_client.http.exceptions import UnexpectedResponse
+from qdrant_client.models import (
+    Distance, VectorParams, OptimizersConfigDiff, PointStruct, PointIdsList,
+    Filter, FieldCondition, MatchValue, PayloadSchemaType, FilterSelector,
+)
+from contextlib import nullcontext
+import asyncio
+import hashlib
+import logging
 import os
+import threading
+import time
+import uuid
+import numpy as np
+from .embedding_cache import CachedEmbeddings
+from .retrieval_cache import SemanticResultCache
+from .document_registry import DocumentRegistry
+from .lexical_index import BM25Index, reciprocal_rank_fusion
+from .rerank import mmr_select
+from .document_parsing import create_parse_pool, iter_pdf_chunks
+from .openai_connection import open_connection
+from observability import span, record_span
+
+
+logger = logging.getLogger(__name__)
+
+
+# 片段 ID 的命名空间，保证同一文档同一内容在任何进程中得到相同的 ID
+_CHUNK_NAMESPACE = uuid.UUID("6f1c8a52-3c1e-4f5e-9d1a-2b7e4c0d9a11")
+
+
+def make_doc_id(source_name: str) -> str:
+    """由文档名称得到稳定的文档 ID"""
+    return hashlib.sha256(source_name.encode("utf-8")).hexdigest()[:16]
+
+
+def make_chunk_id(doc_id: str, chunk_hash: str) -> str:
+    """由文档 ID 和片段内容哈希得到稳定的 Qdrant 点 ID"""
+    return str(uuid.uuid5(_CHUNK_NAMESPACE, f"{doc_id}:{chunk_hash}"))
+
+
+def _report(progress_callback: Optional[Callable[[dict], None]], event: dict):
+    """上报进度事件（回调异常不影响入库）"""
+    if progress_callback:
+        try:
+            progress_callback(event)
+        except Exception as e:
+            logger.warning("Progress callback failed: %s", e)
 
 
 class RAGRetriever:
@@ -18,9 +64,74 @@ class RAGRetriever:
         collection_name: str = "knowledge_base",
         chunk_size: int = 1000,
         chunk_overlap: int = 200,
+        qdrant_url: Optional[str] = None,
+        qdrant_path: Optional[str] = None,
+        qdrant_api_key: Optional[str] = None,
+        on_disk: bool = True,
+        embedding_cache_path: Optional[str] = None,
+        embedding_cache_size: int = 100000,
+        result_cache_threshold: float = 0.95,
+        result_cache_size: int = 512,
+        embed_batch_size: int = 64,
+        registry_path: Optional[str] = None,
+        hybrid_search: bool = True,
+        hybrid_candidates: int = 20,
+        rrf_k: int = 60,
+        lexical_fast_path: bool = True,
+        fast_path_coverage: float = 0.85,
+        fast_path_margin: float = 1.2,
+        mmr_enabled: bool = True,
+        mmr_fetch_k: int = 20,
+        mmr_lambda: float = 0.7,
+        mmr_dedup_threshold: float = 0.95,
+        parse_workers: int = 0,
+        parse_pages_per_task: int = 16,
+        parse_window: int = 4,
     ):
-        """初始化 RAG 检索器"""
+        """
+        初始化 RAG 检索器
+
+        Args:
+            collection_name: 集合名称
+            chunk_size: 分块大小
+            chunk_overlap: 分块重叠
+            qdrant_url: Qdrant 服务地址（多 worker 共享同一索引时使用）
+            qdrant_path: 本地持久化目录（单进程使用，重启后保留数据）
+            qdrant_api_key: Qdrant 服务 API Key
+            on_disk: 服务模式下向量段使用 mmap 存储在磁盘上
+            embedding_cache_path: Embedding 磁盘缓存路径（为空则不缓存）
+            embedding_cache_size: Embedding 缓存最大条目数
+            result_cache_threshold: 检索结果缓存命中的余弦相似度阈值
+            result_cache_size: 检索结果缓存最大条目数（0 表示关闭）
+            embed_batch_size: 入库时每批嵌入与写入的片段数
+            registry_path: 文档登记表 JSON 路径（为空则只保存在内存中；服务模式下必须是各 worker 共享的路径）
+            hybrid_search: 是否启用 BM25 + 向量混合检索
+            hybrid_candidates: 混合检索时每路召回的候选数
+            rrf_k: 倒数排名融合的平滑常数
+            lexical_fast_path: 词法检索足够确定时跳过嵌入与向量检索
+            fast_path_coverage: 快速路径要求第一名覆盖的查询词 IDF 比例
+            fast_path_margin: 快速路径要求第一名与第二名的分数比
+            mmr_enabled: 是否对候选做 MMR 多样化重排
+            mmr_fetch_k: MMR 前多取的候选数 N
+            mmr_lambda: MMR 相关度权重（1 为纯相关度，0 为纯多样性）
+            mmr_dedup_threshold: 近重复片段的余弦相似度阈值
+            parse_workers: PDF 解析进程数（0 表示在入库线程中解析）
+            parse_pages_per_task: 每个解析任务的页数
+            parse_window: 同时在途的页区间数上限（决定入库时的内存峰值）
+        """
         self.collection_name = collection_name
+        self.embed_batch_size = embed_batch_size
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self._doc_locks: Dict[str, threading.Lock] = {}
+        self._doc_locks_guard = threading.Lock()
+
+        # PDF 解析进程池在第一次入库时才创建
+        self.parse_workers = parse_workers
+        self.parse_pages_per_task = parse_pages_per_task
+        self.parse_window = parse_window
+        self._parse_pool = None
+        self._parse_pool_lock = threading.Lock()
 
         # 使用 LangChain 的文本分割器
         self.text_splitter = RecursiveCharacterTextSplitter(
@@ -34,18 +145,76 @@ class RAGRetriever:
             openai_api_base=os.getenv("OPENAI_API_BASE")
         )
 
-        # 创建 Qdrant 客户端（内存模式）
-        self.client = QdrantClient(location=":memory:")
+        # 内容哈希缓存：重复上传和重复查询不再调用嵌入 API
+        self.embedding_cache = None
+        if embedding_cache_path:
+            self.embedding_cache = CachedEmbeddings(
+                self.embeddings,
+                cache_path=embedding_cache_path,
+                max_entries=embedding_cache_size,
+            )
+            self.embeddings = self.embedding_cache
 
-        # 创建集合
-        try:
-            self.client.create_collection(
-                collection_name=collection_name,
-                vectors_config=VectorParams(size=1536, distance=Distance.COSINE),
+        self.result_cache = None
+        if result_cache_size > 0:
+            self.result_cache = SemanticResultCache(
+                threshold=result_cache_threshold,
+                max_entries=result_cache_size,
             )
-            print(f"[INFO] Created collection: {collection_name}")
-        except Exception as e:
-            print(f"[INFO] Collection {collection_name} already exists or error: {e}")
+
+        # 创建 Qdrant 客户端：服务模式 > 本地持久化模式 > 内存模式
+        # 本地/内存模式在进程内做暴力检索，异步路径把同步客户端的调用放到线程中；
+        # 本地客户端不是线程安全的，检索与入库线程的读写用锁串行化
+        self.async_client = None
+        self._local_client_lock = None if qdrant_url else threading.Lock()
+        if qdrant_url:
+            # 登记表决定空判断、缓存版本和删除；只存在进程内时各 worker 互相看不到对方的入库与删除
+            if not registry_path:
+                raise ValueError(
+                    "qdrant_url requires a shared registry_path (DOCUMENT_REGISTRY_PATH) "
+                    "so that all workers see the same documents"
+                )
+            self.storage_mode = "server"
+            self.client = QdrantClient(url=qdrant_url, api_key=qdrant_api_key)
+            # 检索热路径使用异步客户端，在事件循环上直接等待网络 I/O
+            self.async_client = AsyncQdrantClient(url=qdrant_url, api_key=qdrant_api_key)
+        elif qdrant_path:
+            # 本地模式会对目录加文件锁，只能被一个进程打开；多 worker 请使用 qdrant_url
+            self.storage_mode = "local"
+            os.makedirs(qdrant_path, exist_ok=True)
+            self.client = QdrantClient(path=qdrant_path)
+        else:
+            self.storage_mode = "memory"
+            self.client = QdrantClient(location=":memory:")
+
+        self.registry = DocumentRegistry(registry_path)
+
+        # 本地 BM25 索引，入库时与向量库同步维护
+        self.lexical_index = BM25Index() if hybrid_search else None
+        self.hybrid_candidates = hybrid_candidates
+        self.rrf_k = rrf_k
+        self.lexical_fast_path = lexical_fast_path
+        self.fast_path_coverage = fast_path_coverage
+        self.fast_path_margin = fast_path_margin
+        self._lexical_generation = -1
+        self._lexical_lock = threading.Lock()
+
+        # 先多取后重排：MMR 多样化 + 近重复去重
+        self.mmr_enabled = mmr_enabled
+        self.mmr_fetch_k = mmr_fetch_k
+        self.mmr_lambda = mmr_lambda
+        self.mmr_dedup_threshold = mmr_dedup_threshold
+        self._timings = {"searches": 0, "qdrant_ms": 0.0, "rerank_ms": 0.0}
+        self._timing_lock = threading.Lock()
+
+        # 已存在的集合直接复用，避免重启后重新嵌入
+        existing = {c.name for c in self.client.get_collections().collections}
+        if collection_name in existing:
+            logger.info("Reopened existing collection: %s (%s)", collection_name, self.storage_mode)
+            if self.registry.is_empty():
+                self._rebuild_registry()
+        else:
+            self._create_collection(on_disk)
 
         # 创建 LangChain Qdrant vectorstore
         self.vectorstore = Qdrant(
@@ -54,91 +223,743 @@ class RAGRetriever:
             embeddings=self.embeddings,
         )
 
-    def add_pdf(self, pdf_path: str) -> int:
-        """添加 PDF 文件"""
-        print(f"[DEBUG] Adding PDF: {pdf_path}")
-        loader = PyPDFLoader(pdf_path)
-        documents = loader.load()
-        print(f"[DEBUG] Loaded {len(documents)} pages from PDF")
-        chunks = self.text_splitter.split_documents(documents)
-        print(f"[DEBUG] Split into {len(chunks)} chunks")
-        self.vectorstore.add_documents(chunks)
-        print(f"[DEBUG] Added {len(chunks)} chunks to vectorstore")
+    async def awarm_up(self):
+        """
+        预热：建立嵌入接口与 Qdrant 的连接并访问一次索引
+
+        知识库非空时执行一次检索，让 mmap 向量段和 HNSW 图进入页缓存，并补齐词法索引。
+        """
+        embeddings = self.embedding_cache.underlying if self.embedding_cache else self.embeddings
+        await open_connection(getattr(embeddings, "async_client", None))
+
+        if self.async_client is not None:
+            await self.async_client.get_collection(self.collection_name)
+        else:
+            await asyncio.to_thread(self.client.get_collection, self.collection_name)
+
+        if self.has_documents():
+            probe = np.random.default_rng(0).standard_normal(1536).astype(np.float32)
+            probe /= np.linalg.norm(probe)
+            await self._avector_search(probe.tolist(), limit=1)
+            if self.lexical_index:
+                await asyncio.to_thread(self._sync_lexical_index)
+
+    async def aclose(self):
+        """关闭异步 Qdrant 客户端和解析进程池"""
+        if self.async_client is not None:
+            await self.async_client.close()
+        if self._parse_pool is not None:
+            self._parse_pool.shutdown(wait=False, cancel_futures=True)
+            self._parse_pool = None
+
+    def _client_guard(self):
+        """本地/内存模式下串行访问 Qdrant 客户端，服务模式不加锁"""
+        return self._local_client_lock or nullcontext()
+
+    def _get_parse_pool(self):
+        """按需创建解析进程池（parse_workers=0 时返回 None）"""
+        if self.parse_workers <= 0:
+            return None
+        with self._parse_pool_lock:
+            if self._parse_pool is None:
+                self._parse_pool = create_parse_pool(self.parse_workers)
+            return self._parse_pool
+
+    def _create_collection(self, on_disk: bool):
+        """创建集合；服务模式下向量与 HNSW 索引均放到磁盘并通过 mmap 访问"""
+        use_disk = on_disk and self.storage_mode == "server"
+        try:
+            self.client.create_collection(
+                collection_name=self.collection_name,
+                vectors_config=VectorParams(size=1536, distance=Distance.COSINE, on_disk=use_disk),
+                optimizers_config=OptimizersConfigDiff(memmap_threshold=20000) if use_disk else None,
+                on_disk_payload=use_disk,
+            )
+            logger.info("Created collection: %s (%s)", self.collection_name, self.storage_mode)
+            if self.storage_mode == "server":
+                # 增量入库和按文档删除都按 doc_id 过滤
+                self.client.create_payload_index(
+                    collection_name=self.collection_name,
+                    field_name="metadata.doc_id",
+                    field_schema=PayloadSchemaType.KEYWORD,
+                )
+        except UnexpectedResponse as e:
+            # 多个 worker 同时启动时可能出现并发创建（409 / "already exists"），以已存在的集合为准；
+            # 其他错误（认证、网络、配置）照常抛出
+            existing = {c.name for c in self.client.get_collections().collections}
+            if self.collection_name not in existing:
+                raise
+            logger.info("Collection %s was created concurrently (HTTP %s)", self.collection_name, e.status_code)
 
-        # 验证添加成功
-        info = self.get_collection_info()
-        print(f"[DEBUG] After adding PDF, collection has {info.get('vectors_count', 0)} vectors")
+    def add_pdf(
+        self,
+        pdf_path: str,
+        source_name: Optional[str] = None,
+        progress_callback: Optional[Callable[[dict], None]] = None
+    ) -> Dict[str, int]:
+        """
+        添加 PDF 文件（重复上传同名文件时增量更新）
+
+        Args:
+            pdf_path: 文件路径
+            source_name: 文档名称（默认使用文件名）
+            progress_callback: 进度回调，接收 {"stage": ..., ...} 事件
+
+        Returns:
+            入库统计 {"chunks_total", "added", "unchanged", "removed"}
+        """
+        logger.debug("Adding PDF: %s", pdf_path)
 
-        return len(chunks)
+        # 页区间在进程池中解析并分块，片段按页序流式交给嵌入，不等整份文档解析完
+        def chunks():
+            for pages_parsed, pages_total, parsed in iter_pdf_chunks(
+                pdf_path,
+                self.chunk_size,
+                self.chunk_overlap,
+                executor=self._get_parse_pool(),
+                pages_per_task=self.parse_pages_per_task,
+                window=self.parse_window
+            ):
+                _report(progress_callback, {
+                    "stage": "parsed",
+                    "pages_parsed": pages_parsed,
+                    "pages_total": pages_total
+                })
+                for text, metadata in parsed:
+                    yield Document(page_content=text, metadata=metadata)
 
-    def add_text_file(self, file_path: str) -> int:
-        """添加文本文件"""
-        print(f"[DEBUG] Adding text file: {file_path}")
+        return self._add_chunks(chunks(), source_name or os.path.basename(pdf_path), progress_callback)
+
+    def add_text_file(
+        self,
+        file_path: str,
+        source_name: Optional[str] = None,
+        progress_callback: Optional[Callable[[dict], None]] = None
+    ) -> Dict[str, int]:
+        """
+        添加文本文件（重复上传同名文件时增量更新）
+
+        Args:
+            file_path: 文件路径
+            source_name: 文档名称（默认使用文件名）
+            progress_callback: 进度回调，接收 {"stage": ..., ...} 事件
+
+        Returns:
+            入库统计 {"chunks_total", "added", "unchanged", "removed"}
+        """
+        logger.debug("Adding text file: %s", file_path)
         loader = TextLoader(file_path)
         documents = loader.load()
-        print(f"[DEBUG] Loaded {len(documents)} documents from text file")
+        logger.debug("Loaded %d documents from text file", len(documents))
+        _report(progress_callback, {"stage": "parsed", "pages_parsed": len(documents), "pages_total": len(documents)})
         chunks = self.text_splitter.split_documents(documents)
-        print(f"[DEBUG] Split into {len(chunks)} chunks")
-        self.vectorstore.add_documents(chunks)
-        print(f"[DEBUG] Added {len(chunks)} chunks to vectorstore")
+        return self._add_chunks(chunks, source_name or os.path.basename(file_path), progress_callback)
+
+    def _add_chunks(
+        self,
+        chunks: Iterable[Document],
+        source_name: str,
+        progress_callback: Optional[Callable[[dict], None]] = None
+    ) -> Dict[str, int]:
+        """
+        增量入库：按稳定 ID 对比已有片段，只嵌入和写入新增片段，删除已消失的片段
+
+        Args:
+            chunks: 已分块的片段（可以是边解析边产出的迭代器）
+
+        Returns:
+            {"chunks_total", "added", "unchanged", "removed"}
+        """
+        doc_id = make_doc_id(source_name)
+        with self._doc_lock(doc_id):
+            return self._sync_document(doc_id, chunks, source_name, progress_callback)
+
+    def _doc_lock(self, doc_id: str) -> threading.Lock:
+        """同一文档的并发入库串行执行，避免 ID 对比结果互相覆盖"""
+        with self._doc_locks_guard:
+            return self._doc_locks.setdefault(doc_id, threading.Lock())
+
+    def _sync_document(
+        self,
+        doc_id: str,
+        chunks: Iterable[Document],
+        source_name: str,
+        progress_callback: Optional[Callable[[dict], None]] = None
+    ) -> Dict[str, int]:
+        """
+        对比并同步单个文档的片段
+
+        片段边产出边处理：每凑满一批新片段就嵌入并写入，内存中只保留当前批次和片段 ID；
+        中途失败时删除本次已写入的新片段，保持向量库与登记表一致。
+        """
+        existing_ids = self.registry.get_chunk_ids(doc_id)
+        # 本次版本的片段 ID（保持顺序）；相同内容的片段得到相同 ID，文档内重复片段只保留一份
+        new_ids: Dict[str, None] = {}
+        added_ids: List[str] = []
+        batch: List[Tuple[str, Document]] = []
+        unchanged = 0
+
+        def report_split(**extra):
+            # chunks_total 为目前发现的待写入片段数，随解析推进累加
+            _report(progress_callback, {
+                "stage": "split",
+                "chunks_total": len(added_ids) + len(batch),
+                "chunks_unchanged": unchanged,
+                **extra
+            })
+
+        try:
+            for chunk in chunks:
+                chunk.metadata["source"] = source_name
+                chunk_hash = hashlib.sha256(chunk.page_content.encode("utf-8")).hexdigest()
+                point_id = make_chunk_id(doc_id, chunk_hash)
+                if point_id in new_ids:
+                    continue
+                new_ids[point_id] = None
+                if point_id in existing_ids:
+                    unchanged += 1
+                    continue
+
+                chunk.metadata["doc_id"] = doc_id
+                chunk.metadata["chunk_hash"] = chunk_hash
+                batch.append((point_id, chunk))
+                if len(batch) >= self.embed_batch_size:
+                    report_split()
+                    self._index_batch(batch, added_ids, progress_callback, parsing_done=False)
+                    batch = []
+
+            removed_ids = [point_id for point_id in existing_ids if point_id not in new_ids]
+            report_split(chunks_removed=len(removed_ids))
+            if batch:
+                self._index_batch(batch, added_ids, progress_callback, parsing_done=True)
+        except BaseException:
+            # 解析或嵌入中途失败：撤回本次写入的新片段（登记表尚未更新）
+            if added_ids:
+                self._delete_points(added_ids)
+            raise
+
+        indexed = len(added_ids)
+        logger.debug("Split into %d chunks: %d new, %d unchanged, %d removed",
+                     len(new_ids), indexed, unchanged, len(removed_ids))
+
+        # 新片段写入完成后再删除旧片段，避免检索出现空窗
+        if removed_ids:
+            self._delete_points(removed_ids)
+
+        logger.debug("Added %d chunks, removed %d chunks for %s", indexed, len(removed_ids), source_name)
+        self.registry.set_document(doc_id, source_name, list(new_ids))
+        if indexed or removed_ids:
+            self._mark_updated()
+
+        return {
+            "chunks_total": len(new_ids),
+            "added": indexed,
+            "unchanged": unchanged,
+            "removed": len(removed_ids)
+        }
+
+    def _index_batch(
+        self,
+        batch: List[Tuple[str, Document]],
+        added_ids: List[str],
+        progress_callback: Optional[Callable[[dict], None]] = None,
+        parsing_done: bool = False
+    ):
+        """
+        嵌入并写入一批新片段，写入成功后把 ID 追加到 added_ids
+
+        解析仍在进行时待写入片段总数未知，进度事件不带 chunks_total；
+        解析完成后的最后一批才带上总数。
+        """
+        done = len(added_ids) + len(batch)
+        extra = {"chunks_total": done} if parsing_done else {}
+        vectors = self.embeddings.embed_documents([chunk.page_content for _, chunk in batch])
+        _report(progress_callback, {
+            "stage": "embedded",
+            "chunks_embedded": done,
+            **extra
+        })
+
+        with self._client_guard():
+            self.client.upsert(
+                collection_name=self.collection_name,
+                points=[
+                    PointStruct(
+                        id=point_id,
+                        vector=vector,
+                        # 与 LangChain Qdrant 的 payload 结构保持一致
+                        payload={"page_content": chunk.page_content, "metadata": chunk.metadata}
+                    )
+                    for (point_id, chunk), vector in zip(batch, vectors)
+                ]
+            )
+        added_ids.extend(point_id for point_id, _ in batch)
+        if self.lexical_index:
+            for point_id, chunk in batch:
+                self.lexical_index.add(point_id, chunk.page_content, chunk.metadata)
+        _report(progress_callback, {
+            "stage": "indexed",
+            "chunks_indexed": done,
+            **extra
+        })
+
+    def _delete_points(self, point_ids: List[str]):
+        """从向量库和词法索引中删除片段"""
+        with self._client_guard():
+            self.client.delete(
+                collection_name=self.collection_name,
+                points_selector=PointIdsList(points=point_ids)
+            )
+        if self.lexical_index:
+            for point_id in point_ids:
+                self.lexical_index.remove(point_id)
+
+    @staticmethod
+    def _doc_filter(doc_id: str) -> Filter:
+        return Filter(must=[FieldCondition(key="metadata.doc_id", match=MatchValue(value=doc_id))])
+
+    def _rebuild_registry(self):
+        """扫描集合重建文档登记表（登记表缺失但集合已有数据时使用）"""
+        documents: Dict[str, dict] = {}
+        offset = None
+        while True:
+            points, offset = self.client.scroll(
+                collection_name=self.collection_name,
+                limit=1000,
+                offset=offset,
+                with_payload=["metadata.doc_id", "metadata.source"],
+                with_vectors=False
+            )
+            for point in points:
+                metadata = (point.payload or {}).get("metadata", {})
+                doc_id = metadata.get("doc_id")
+                if not doc_id:
+                    continue
+                doc = documents.setdefault(doc_id, {
+                    "doc_id": doc_id,
+                    "filename": metadata.get("source", ""),
+                    "chunk_ids": [],
+                    "chunk_count": 0,
+                    "updated_at": None
+                })
+                doc["chunk_ids"].append(str(point.id))
+                doc["chunk_count"] += 1
+            if offset is None:
+                break
+        self.registry.rebuild(documents)
+        logger.info("Rebuilt document registry: %d documents", len(documents))
 
-        # 验证添加成功
-        info = self.get_collection_info()
-        print(f"[DEBUG] After adding text file, collection has {info.get('vectors_count', 0)} vectors")
+    @property
+    def version(self) -> int:
+        """知识库版本号：登记表每次变化（包括其他 worker 的写入）都会递增，用于让各类缓存失效"""
+        return self.registry.get_generation()
 
-        return len(chunks)
+    def _mark_updated(self):
+        """集合内容变化：清空检索结果缓存"""
+        if self.result_cache:
+            self.result_cache.invalidate()
+
+    def embed_query(self, query: str) -> List[float]:
+        """嵌入查询文本（经过 Embedding 缓存）"""
+        with span("embedding"):
+            return self.embeddings.embed_query(query)
+
+    async def aembed_query(self, query: str) -> List[float]:
+        """异步嵌入查询文本（经过 Embedding 缓存）"""
+        with span("embedding"):
+            return await self.embeddings.aembed_query(query)
 
     def search(self, query: str, k: int = 3) -> List[Document]:
-        """搜索相关文档"""
-        return self.vectorstore.similarity_search(query, k=k)
+        """搜索相关文档（词法快速路径 > 混合检索）"""
+        documents = self.lexical_search(query, k=k)
+        if documents is not None:
+            return documents
+        return self.search_by_vector(self.embed_query(query), k=k, query=query)
+
+    def _fetch_n(self, k: int, hybrid: bool) -> int:
+        """先多取后重排时每路召回的候选数"""
+        return max(
+            k,
+            self.hybrid_candidates if hybrid else k,
+            self.mmr_fetch_k if self.mmr_enabled else k
+        )
+
+    def search_by_vector(self, vector: List[float], k: int = 3, query: Optional[str] = None) -> List[Document]:
+        """
+        使用已计算好的查询向量搜索相关文档
+
+        先多取 N 个候选（向量 + BM25 融合），再用 MMR 批量去重并选出 k 个多样化片段。
+
+        Args:
+            vector: 查询向量
+            k: 返回数量
+            query: 原始查询文本，提供时与 BM25 结果做倒数排名融合
+
+        Returns:
+            文档列表
+        """
+        hybrid = bool(query and self.lexical_index)
+        fetch_n = self._fetch_n(k, hybrid)
+
+        start = time.perf_counter()
+        hits = self._vector_search(vector, fetch_n, with_vectors=self.mmr_enabled)
+        qdrant_ms = (time.perf_counter() - start) * 1000
+        record_span("qdrant_query", start, qdrant_ms / 1000, hits=len(hits))
+
+        if hybrid:
+            self._sync_lexical_index()
+        candidates = self._fuse_candidates(hits, query if hybrid else None, fetch_n)
+        fetched = self._retrieve_vectors(self._missing_vector_ids(candidates))
+        return self._select(candidates, k, fetched, qdrant_ms)
+
+    async def asearch_by_vector(
+        self,
+        vector: List[float],
+        k: int = 3,
+        query: Optional[str] = None
+    ) -> List[Document]:
+        """search_by_vector 的异步版本（服务模式下使用异步 Qdrant 客户端）"""
+        hybrid = bool(query and self.lexical_index)
+        fetch_n = self._fetch_n(k, hybrid)
+
+        start = time.perf_counter()
+        hits = await self._avector_search(vector, fetch_n, with_vectors=self.mmr_enabled)
+        qdrant_ms = (time.perf_counter() - start) * 1000
+        record_span("qdrant_query", start, qdrant_ms / 1000, hits=len(hits))
+
+        if hybrid and self.registry.get_generation() != self._lexical_generation:
+            # 仅在其他 worker 改动过知识库时才需要补齐，放到线程中避免阻塞事件循环
+            await asyncio.to_thread(self._sync_lexical_index)
+        candidates = self._fuse_candidates(hits, query if hybrid else None, fetch_n)
+        fetched = await self._aretrieve_vectors(self._missing_vector_ids(candidates))
+        return self._select(candidates, k, fetched, qdrant_ms)
+
+    def _fuse_candidates(self, hits: List[tuple], query: Optional[str], fetch_n: int) -> List[tuple]:
+        """与 BM25 结果做倒数排名融合，返回 (点 ID, 文档, 分数, 向量) 候选列表"""
+        if query:
+            lexical, _ = self.lexical_index.search(query, top_n=fetch_n)
+            fused = reciprocal_rank_fusion(
+                [[point_id for point_id, *_ in hits], [key for key, _ in lexical]],
+                k=self.rrf_k
+            )[:fetch_n]
+        else:
+            fused = [(point_id, score) for point_id, _, score, _ in hits]
+
+        by_id = {point_id: (doc, point_vector) for point_id, doc, _, point_vector in hits}
+        candidates = []
+        for point_id, score in fused:
+            doc, point_vector = by_id.get(point_id, (None, None))
+            doc = doc or self._lexical_document(point_id)
+            if doc:
+                candidates.append((point_id, doc, score, point_vector))
+        return candidates
+
+    def _missing_vector_ids(self, candidates: List[tuple]) -> List[str]:
+        """只从词法索引召回的候选没有向量，MMR 前需要批量补齐"""
+        if not self.mmr_enabled or len(candidates) <= 1:
+            return []
+        return [point_id for point_id, _, _, point_vector in candidates if point_vector is None]
+
+    def _retrieve_vectors(self, point_ids: List[str]) -> Dict[str, List[float]]:
+        if not point_ids:
+            return {}
+        with self._client_guard():
+            points = self.client.retrieve(
+                collection_name=self.collection_name,
+                ids=point_ids,
+                with_payload=False,
+                with_vectors=True
+            )
+        return {str(point.id): point.vector for point in points}
+
+    async def _aretrieve_vectors(self, point_ids: List[str]) -> Dict[str, List[float]]:
+        if not point_ids:
+            return {}
+        if self.async_client is None:
+            return await asyncio.to_thread(self._retrieve_vectors, point_ids)
+        points = await self.async_client.retrieve(
+            collection_name=self.collection_name,
+            ids=point_ids,
+            with_payload=False,
+            with_vectors=True
+        )
+        return {str(point.id): point.vector for point in points}
+
+    def _select(
+        self,
+        candidates: List[tuple],
+        k: int,
+        fetched: Dict[str, List[float]],
+        qdrant_ms: float
+    ) -> List[Document]:
+        """选出最终的 k 个片段并记录耗时"""
+        if not self.mmr_enabled or len(candidates) <= 1:
+            self._record_timing(qdrant_ms, 0.0)
+            return [doc for _, doc, _, _ in candidates[:k]]
+
+        start = time.perf_counter()
+        documents = self._mmr_rerank(candidates, k, fetched)
+        rerank_ms = (time.perf_counter() - start) * 1000
+        record_span("rerank", start, rerank_ms / 1000, candidates=len(candidates))
+        self._record_timing(qdrant_ms, rerank_ms)
+        logger.debug("Retrieval timing: qdrant %.1fms, mmr %.1fms (%d -> %d chunks)",
+                     qdrant_ms, rerank_ms, len(candidates), len(documents))
+        return documents
+
+    def _mmr_rerank(self, candidates: List[tuple], k: int, fetched: Dict[str, List[float]]) -> List[Document]:
+        """对候选做 MMR 多样化与近重复去重"""
+        candidates = [
+            (point_id, doc, score, point_vector if point_vector is not None else fetched.get(point_id))
+            for point_id, doc, score, point_vector in candidates
+        ]
+        candidates = [candidate for candidate in candidates if candidate[3] is not None]
+        if not candidates:
+            return []
+
+        # 相关度统一归一化到 [0, 1]（余弦分数或 RRF 分数）
+        relevance = np.array([score for _, _, score, _ in candidates], dtype=np.float32)
+        spread = relevance.max() - relevance.min()
+        relevance = (relevance - relevance.min()) / spread if spread > 0 else np.ones_like(relevance)
+
+        selected = mmr_select(
+            relevance,
+            np.array([point_vector for _, _, _, point_vector in candidates], dtype=np.float32),
+            k=k,
+            lambda_mult=self.mmr_lambda,
+            dedup_threshold=self.mmr_dedup_threshold
+        )
+        return [candidates[i][1] for i in selected]
+
+    def _record_timing(self, qdrant_ms: float, rerank_ms: float):
+        """累计检索各阶段耗时"""
+        with self._timing_lock:
+            self._timings["searches"] += 1
+            self._timings["qdrant_ms"] += qdrant_ms
+            self._timings["rerank_ms"] += rerank_ms
+
+    def get_timing_stats(self) -> dict:
+        """获取检索平均耗时"""
+        with self._timing_lock:
+            count = self._timings["searches"]
+            return {
+                "searches": count,
+                "avg_qdrant_ms": round(self._timings["qdrant_ms"] / count, 2) if count else 0.0,
+                "avg_rerank_ms": round(self._timings["rerank_ms"] / count, 2) if count else 0.0
+            }
+
+    def lexical_search(self, query: str, k: int = 3) -> Optional[List[Document]]:
+        """
+        词法快速路径：BM25 结果足够确定时直接返回，无需嵌入查询
+
+        Returns:
+            文档列表；不够确定或未启用时返回 None
+        """
+        if not self.lexical_index or not self.lexical_fast_path:
+            return None
+        self._sync_lexical_index()
+        return self._lexical_fast_path(query, k)
+
+    async def alexical_search(self, query: str, k: int = 3) -> Optional[List[Document]]:
+        """lexical_search 的异步版本：需要补齐词法索引时放到线程中，避免阻塞事件循环"""
+        if not self.lexical_index or not self.lexical_fast_path:
+            return None
+        if self.registry.get_generation() != self._lexical_generation:
+            await asyncio.to_thread(self._sync_lexical_index)
+        return self._lexical_fast_path(query, k)
+
+    def _lexical_fast_path(self, query: str, k: int) -> Optional[List[Document]]:
+        """在已同步的词法索引上判断快速路径是否命中"""
+        ranked, coverage = self.lexical_index.search(query, top_n=max(k, 2))
+        if not ranked or coverage < self.fast_path_coverage:
+            return None
+        if len(ranked) > 1 and ranked[0][1] < ranked[1][1] * self.fast_path_margin:
+            return None
+
+        logger.debug("Lexical fast path hit (coverage %.2f) for query: %s", coverage, query)
+        documents = [self._lexical_document(key) for key, _ in ranked[:k]]
+        return [doc for doc in documents if doc]
+
+    def _vector_search(
+        self,
+        vector: List[float],
+        limit: int,
+        with_vectors: bool = False
+    ) -> List[Tuple[str, Document, float, Optional[List[float]]]]:
+        """Qdrant 向量检索，返回 (点 ID, 文档, 相似度, 向量)"""
+        with self._client_guard():
+            points = self.client.search(
+                collection_name=self.collection_name,
+                query_vector=vector,
+                limit=limit,
+                with_payload=True,
+                with_vectors=with_vectors
+            )
+        return [
+            (str(point.id), self._payload_to_document(point.payload), point.score,
+             point.vector if with_vectors else None)
+            for point in points
+        ]
+
+    async def _avector_search(
+        self,
+        vector: List[float],
+        limit: int,
+        with_vectors: bool = False
+    ) -> List[Tuple[str, Document, float, Optional[List[float]]]]:
+        """异步 Qdrant 向量检索（本地/内存模式在线程中执行，不阻塞事件循环）"""
+        if self.async_client is None:
+            return await asyncio.to_thread(self._vector_search, vector, limit, with_vectors)
+        points = await self.async_client.search(
+            collection_name=self.collection_name,
+            query_vector=vector,
+            limit=limit,
+            with_payload=True,
+            with_vectors=with_vectors
+        )
+        return [
+            (str(point.id), self._payload_to_document(point.payload), point.score,
+             point.vector if with_vectors else None)
+            for point in points
+        ]
+
+    @staticmethod
+    def _payload_to_document(payload: Optional[dict]) -> Document:
+        payload = payload or {}
+        return Document(page_content=payload.get("page_content", ""), metadata=payload.get("metadata") or {})
+
+    def _lexical_document(self, key: str) -> Optional[Document]:
+        """从词法索引中取出片段"""
+        entry = self.lexical_index.get(key) if self.lexical_index else None
+        if not entry:
+            return None
+        text, metadata = entry
+        return Document(page_content=text, metadata=metadata)
+
+    def _sync_lexical_index(self):
+        """登记表变化（包括其他 worker 的入库与删除）后补齐或清理词法索引"""
+        if not self.lexical_index:
+            return
+        generation = self.registry.get_generation()
+        if generation == self._lexical_generation:
+            return
+        with self._lexical_lock:
+            if generation == self._lexical_generation:
+                return
+            wanted = self.registry.all_chunk_ids()
+            indexed = set(self.lexical_index.keys())
+            for key in indexed - wanted:
+                self.lexical_index.remove(key)
+
+            missing = list(wanted - indexed)
+            for start in range(0, len(missing), 256):
+                with self._client_guard():
+                    points = self.client.retrieve(
+                        collection_name=self.collection_name,
+                        ids=missing[start:start + 256],
+                        with_payload=True,
+                        with_vectors=False
+                    )
+                for point in points:
+                    doc = self._payload_to_document(point.payload)
+                    self.lexical_index.add(str(point.id), doc.page_content, doc.metadata)
+            if missing:
+                logger.info("Lexical index synced: %d chunks loaded", len(missing))
+            self._lexical_generation = generation
+
+    @staticmethod
+    def _format_context(documents: List[Document]) -> str:
+        """将检索到的文档格式化为上下文文本"""
+        context_parts = [f"[文档 {i}]\n{doc.page_content}"
+                        for i, doc in enumerate(documents, 1)]
+        return "\n\n".join(context_parts)
+
+    def get_lexical_context(self, query: str, k: int = 3) -> str:
+        """词法快速路径的上下文文本；不够确定时返回空字符串"""
+        documents = self.lexical_search(query, k=k)
+        return self._format_context(documents) if documents else ""
+
+    async def aget_lexical_context(self, query: str, k: int = 3) -> str:
+        """get_lexical_context 的异步版本"""
+        documents = await self.alexical_search(query, k=k)
+        return self._format_context(documents) if documents else ""
+
+    def get_context_by_vector(self, vector: List[float], k: int = 3, query: Optional[str] = None) -> str:
+        """使用查询向量获取上下文文本（提供 query 时做混合检索）"""
+        try:
+            documents = self.search_by_vector(vector, k=k, query=query)
+            logger.debug("Vector search returned %d documents", len(documents))
+            return self._format_context(documents)
+        except Exception as e:
+            logger.exception("Search error: %s", e)
+            return ""
+
+    async def aget_context_by_vector(self, vector: List[float], k: int = 3, query: Optional[str] = None) -> str:
+        """get_context_by_vector 的异步版本"""
+        try:
+            documents = await self.asearch_by_vector(vector, k=k, query=query)
+            logger.debug("Vector search returned %d documents", len(documents))
+            return self._format_context(documents)
+        except Exception as e:
+            logger.exception("Search error: %s", e)
+            return ""
 
     def get_context(self, query: str, k: int = 3) -> str:
         """获取查询的上下文文本"""
         try:
             documents = self.search(query, k=k)
-            print(f"[DEBUG] Search returned {len(documents)} documents for query: {query}")
+            logger.debug("Search returned %d documents for query: %s", len(documents), query)
 
             if not documents:
                 return ""
 
-            context_parts = [f"[文档 {i}]\n{doc.page_content}"
-                            for i, doc in enumerate(documents, 1)]
-            return "\n\n".join(context_parts)
+            return self._format_context(documents)
         except Exception as e:
-            print(f"[ERROR] Search error: {str(e)}")
-            import traceback
-            traceback.print_exc()
+            logger.exception("Search error: %s", e)
             return ""
 
     def has_documents(self) -> bool:
-        """检查知识库是否有文档（通过实际搜索验证）"""
-        try:
-            # 尝试获取任意文档
-            results = self.vectorstore.similarity_search("test", k=1)
-            has_docs = len(results) > 0
-            print(f"[DEBUG] has_documents check: {has_docs} (found {len(results)} docs)")
-            return has_docs
-        except Exception as e:
-            print(f"[ERROR] has_documents check failed: {str(e)}")
-            return False
+        """检查知识库是否有文档（查询登记表，不访问向量库）"""
+        return not self.registry.is_empty()
 
-    def get_collection_info(self) -> dict:
-        """获取知识库信息"""
-        try:
-            collection = self.client.get_collection(self.collection_name)
-            vectors_count = collection.vectors_count if collection.vectors_count is not None else 0
+    def list_documents(self) -> List[dict]:
+        """列出知识库中的文档"""
+        return self.registry.list_documents()
 
-            print(f"[DEBUG] Collection info: {self.collection_name}, vectors_count: {vectors_count}")
+    def delete_document(self, doc_id: str) -> Optional[dict]:
+        """
+        删除文档及其全部向量（按 doc_id 过滤一次性删除）
 
-            return {
-                "collection_name": self.collection_name,
-                "vectors_count": vectors_count,
-                "points_count": collection.points_count if hasattr(collection, 'points_count') else vectors_count
-            }
-        except Exception as e:
-            print(f"[ERROR] Failed to get collection info: {str(e)}")
-            return {
-                "collection_name": self.collection_name,
-                "vectors_count": 0,
-                "points_count": 0
-            }
+        Args:
+            doc_id: 文档 ID
+
+        Returns:
+            被删除的文档信息，文档不存在时返回 None
+        """
+        with self._doc_lock(doc_id):
+            doc = self.registry.get_document(doc_id)
+            if not doc:
+                return None
+            with self._client_guard():
+                self.client.delete(
+                    collection_name=self.collection_name,
+                    points_selector=FilterSelector(filter=self._doc_filter(doc_id))
+                )
+            chunk_ids = self.registry.get_chunk_ids(doc_id)
+            self.registry.remove_document(doc_id)
+            if self.lexical_index:
+                for point_id in chunk_ids:
+                    self.lexical_index.remove(point_id)
+        self._mark_updated()
+        logger.info("Deleted document %s (%d chunks)", doc["filename"], doc["chunk_count"])
+        return doc
+
+    def get_collection_info(self) -> dict:
+        """获取知识库信息（来自登记表，不访问向量库）"""
+        return {
+            "collection_name": self.collection_name,
+            **self.registry.get_stats(),
+            "storage_mode": self.storage_mode,
+            "embedding_cache": self.embedding_cache.get_stats() if self.embedding_cache else None,
+            "result_cache": self.result_cache.get_stats() if self.result_cache else None,
+            "retrieval_timings": self.get_timing_stats()
+        }
@@ -0,0 +1,55 @@
+"""检索结果重排 - NumPy 向量化的最大边际相关性 (MMR) 多样化与去重"""
+from typing import List
+import numpy as np
+
+
+def mmr_select(
+    relevance,
+    vectors,
+    k: int,
+    lambda_mult: float = 0.7,
+    dedup_threshold: float = 0.95
+) -> List[int]:
+    """
+    最大边际相关性选择
+
+    每一轮对全部候选一次性计算 λ·相关度 − (1−λ)·与已选结果的最大相似度，
+    与已选结果相似度超过去重阈值的候选直接剔除。
+
+    Args:
+        relevance: 候选与查询的相关度，形状 (n,)
+        vectors: 候选向量，形状 (n, d)
+        k: 选择数量
+        lambda_mult: 相关度权重（1 为纯相关度，0 为纯多样性）
+        dedup_threshold: 近重复判定的余弦相似度阈值
+
+    Returns:
+        选中的候选下标（按选择顺序）
+    """
+    relevance = np.asarray(relevance, dtype=np.float32)
+    n = relevance.shape[0]
+    if n == 0 or k <= 0:
+        return []
+
+    matrix = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    matrix = matrix / np.where(norms > 0, norms, 1.0)
+    similarity = matrix @ matrix.T
+
+    max_sim = np.zeros(n, dtype=np.float32)
+    excluded = np.zeros(n, dtype=bool)
+    selected: List[int] = []
+
+    while len(selected) < min(k, n):
+        scores = lambda_mult * relevance - (1 - lambda_mult) * max_sim
+        scores[excluded] = -np.inf
+        pick = int(np.argmax(scores))
+        if not np.isfinite(scores[pick]):
+            break
+        selected.append(pick)
+        excluded[pick] = True
+        row = similarity[pick]
+        np.maximum(max_sim, row, out=max_sim)
+        excluded |= row >= dedup_threshold
+
+    return selected
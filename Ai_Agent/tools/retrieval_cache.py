@@ -0,0 +1,123 @@
+"""检索结果缓存 - 按查询向量相似度复用知识库检索结果"""
+from typing import List, Optional
+from collections import OrderedDict
+import threading
+import numpy as np
+
+
+class SemanticResultCache:
+    """语义检索结果缓存
+
+    以查询向量为键，余弦相似度超过阈值即视为同一问题，直接返回已格式化的上下文。
+    知识库版本变化（新增/删除文档）时整体失效。
+    """
+
+    def __init__(self, threshold: float = 0.95, max_entries: int = 512):
+        """
+        初始化检索结果缓存
+
+        Args:
+            threshold: 命中所需的最小余弦相似度
+            max_entries: 最大缓存条目数（LRU 淘汰）
+        """
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.version = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[int, tuple]" = OrderedDict()
+        self._next_id = 0
+        self._matrix: Optional[np.ndarray] = None
+        self._matrix_ids: List[int] = []
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _normalize(vector) -> np.ndarray:
+        vec = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(vec)
+        return vec / norm if norm > 0 else vec
+
+    def _sync_version(self, version: int):
+        """知识库版本前进时清空缓存（版本单调递增）"""
+        if version > self.version:
+            self._entries.clear()
+            self._matrix = None
+            self._matrix_ids = []
+            self.version = version
+
+    def get(self, vector, k: int, version: int) -> Optional[str]:
+        """
+        查找相似查询的缓存结果
+
+        Args:
+            vector: 查询向量
+            k: 检索数量
+            version: 当前知识库版本
+
+        Returns:
+            命中时返回上下文文本，否则返回 None
+        """
+        query = self._normalize(vector)
+        with self._lock:
+            self._sync_version(version)
+            if version != self.version or not self._entries:
+                self.misses += 1
+                return None
+
+            if self._matrix is None:
+                self._matrix_ids = list(self._entries.keys())
+                self._matrix = np.stack([self._entries[i][0] for i in self._matrix_ids])
+
+            scores = self._matrix @ query
+            # 只在相同 k 的条目中挑选
+            for idx in np.argsort(-scores):
+                if scores[idx] < self.threshold:
+                    break
+                entry_id = self._matrix_ids[idx]
+                _, entry_k, context = self._entries[entry_id]
+                if entry_k == k:
+                    self._entries.move_to_end(entry_id)
+                    self.hits += 1
+                    return context
+
+            self.misses += 1
+            return None
+
+    def put(self, vector, k: int, version: int, context: str):
+        """
+        写入检索结果
+
+        Args:
+            vector: 查询向量
+            k: 检索数量
+            version: 结果对应的知识库版本
+            context: 格式化后的上下文文本
+        """
+        with self._lock:
+            self._sync_version(version)
+            # 过期版本的检索结果不写入
+            if version != self.version:
+                return
+            self._entries[self._next_id] = (self._normalize(vector), k, context)
+            self._next_id += 1
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            self._matrix = None
+
+    def invalidate(self):
+        """清空缓存"""
+        with self._lock:
+            self._entries.clear()
+            self._matrix = None
+            self._matrix_ids = []
+
+    def get_stats(self) -> dict:
+        """获取缓存统计信息"""
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "threshold": self.threshold,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0
+        }
@@ -1,22 +1,173 @@
 """SerpAPI 搜索工具 - 提供网络搜索功能"""
-from typing import List, Dict, Optional
-from serpapi import GoogleSearch
+from typing import List, Dict, Optional, Tuple
+from collections import OrderedDict
+import asyncio
+import httpx
+import logging
 import os
+import threading
+import time
+
+
+logger = logging.getLogger(__name__)
+
+
+class SearchError(Exception):
+    """搜索请求失败
+
+    只携带状态码和错误类型：httpx 异常的文本包含完整 URL（带 api_key 查询参数），
+    不能出现在日志或返回给 LLM 的工具结果中。
+    """
+
+    def __init__(self, error_type: str, status_code: Optional[int] = None):
+        self.error_type = error_type
+        self.status_code = status_code
+        detail = f"HTTP {status_code}" if status_code is not None else error_type
+        super().__init__(f"Search request failed: {detail}")
+
+    @classmethod
+    def from_httpx(cls, error: httpx.HTTPError) -> "SearchError":
+        if isinstance(error, httpx.HTTPStatusError):
+            return cls(type(error).__name__, error.response.status_code)
+        return cls(type(error).__name__)
 
 
 class SearchTool:
-    """SerpAPI 搜索工具"""
+    """SerpAPI 搜索工具
+
+    - 同步/异步两条路径共享 keep-alive 连接池，请求带超时
+    - 格式化后的搜索结果按 TTL 缓存
+    - 并发的相同查询只向上游发起一次请求（single-flight）
+    """
 
-    def __init__(self, api_key: Optional[str] = None):
+    def __init__(
+        self,
+        api_key: Optional[str] = None,
+        endpoint: Optional[str] = None,
+        timeout: float = 10.0,
+        cache_ttl: float = 300.0,
+        cache_size: int = 1024,
+        max_connections: int = 20,
+    ):
         """
         初始化搜索工具
 
         Args:
             api_key: SerpAPI API Key，如果不提供则从环境变量读取
+            endpoint: 搜索引擎地址（可指向本地桩服务用于测试）
+            timeout: 单次请求超时（秒）
+            cache_ttl: 结果缓存有效期（秒），0 表示不缓存
+            cache_size: 结果缓存最大条目数
+            max_connections: 连接池最大连接数
         """
         self.api_key = api_key or os.getenv("SERPAPI_KEY", "")
         if not self.api_key:
-            print("[WARNING] SERPAPI_KEY not configured. Search functionality will be unavailable.")
+            logger.warning("SERPAPI_KEY not configured. Search functionality will be unavailable.")
+
+        self.endpoint = endpoint or os.getenv("SERPAPI_ENDPOINT", "https://serpapi.com/search.json")
+        self.timeout = httpx.Timeout(timeout, connect=min(timeout, 5.0))
+        self.limits = httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections)
+        self.cache_ttl = cache_ttl
+        self.cache_size = cache_size
+
+        self._client: Optional[httpx.Client] = None
+        self._async_client: Optional[httpx.AsyncClient] = None
+        self._cache: "OrderedDict[Tuple[str, int], Tuple[float, str]]" = OrderedDict()
+        self._cache_lock = threading.Lock()
+        self._inflight: Dict[Tuple[str, int], asyncio.Future] = {}
+
+    @property
+    def client(self) -> httpx.Client:
+        """共享的同步 HTTP 客户端"""
+        if self._client is None:
+            self._client = httpx.Client(timeout=self.timeout, limits=self.limits)
+        return self._client
+
+    @property
+    def async_client(self) -> httpx.AsyncClient:
+        """共享的异步 HTTP 客户端"""
+        if self._async_client is None:
+            self._async_client = httpx.AsyncClient(timeout=self.timeout, limits=self.limits)
+        return self._async_client
+
+    async def aclose(self):
+        """关闭 HTTP 连接池"""
+        if self._async_client is not None:
+            await self._async_client.aclose()
+            self._async_client = None
+        if self._client is not None:
+            self._client.close()
+            self._client = None
+
+    def _params(self, query: str, num_results: int) -> Dict:
+        if not self.api_key:
+            raise ValueError("SERPAPI_KEY not configured. Please set it in .env file.")
+        return {
+            "q": query,
+            "api_key": self.api_key,
+            "num": num_results,
+            "engine": "google",
+            "output": "json"
+        }
+
+    @staticmethod
+    def _parse_results(results: Dict, num_results: int) -> List[Dict]:
+        """提取有机搜索结果"""
+        organic_results = results.get("organic_results", [])
+
+        formatted_results = []
+        for result in organic_results[:num_results]:
+            formatted_results.append({
+                "title": result.get("title", ""),
+                "link": result.get("link", ""),
+                "snippet": result.get("snippet", ""),
+                "position": result.get("position", 0)
+            })
+        return formatted_results
+
+    @staticmethod
+    def _format_context(results: List[Dict]) -> str:
+        """格式化搜索结果为上下文文本"""
+        if not results:
+            return ""
+
+        context_parts = []
+        for i, result in enumerate(results, 1):
+            context_parts.append(
+                f"[搜索结果 {i}]\n"
+                f"标题: {result['title']}\n"
+                f"链接: {result['link']}\n"
+                f"摘要: {result['snippet']}"
+            )
+
+        return "\n\n".join(context_parts)
+
+    @staticmethod
+    def _cache_key(query: str, num_results: int) -> Tuple[str, int]:
+        return (" ".join(query.lower().split()), num_results)
+
+    def _cache_get(self, key: Tuple[str, int]) -> Optional[str]:
+        if self.cache_ttl <= 0:
+            return None
+        with self._cache_lock:
+            entry = self._cache.get(key)
+            if entry is None:
+                return None
+            expires_at, context = entry
+            if expires_at < time.monotonic():
+                del self._cache[key]
+                return None
+            self._cache.move_to_end(key)
+            return context
+
+    def _cache_put(self, key: Tuple[str, int], context: str):
+        if self.cache_ttl <= 0 or not context:
+            return
+        with self._cache_lock:
+            self._cache[key] = (time.monotonic() + self.cache_ttl, context)
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
 
     def search(self, query: str, num_results: int = 5) -> List[Dict]:
         """
@@ -28,38 +179,56 @@ class SearchTool:
 
         Returns:
             搜索结果列表
+
+        Raises:
+            SearchError: 请求失败（不含请求 URL）
         """
-        if not self.api_key:
-            raise ValueError("SERPAPI_KEY not configured. Please set it in .env file.")
+        params = self._params(query, num_results)
+        try:
+            response = self.client.get(self.endpoint, params=params)
+            response.raise_for_status()
+            formatted_results = self._parse_results(response.json(), num_results)
+            logger.debug("Found %d search results for query: %s", len(formatted_results), query)
+            return formatted_results
+
+        except httpx.HTTPError as e:
+            # 不保留原异常链：其文本和 request 中都有带 api_key 的 URL
+            error = SearchError.from_httpx(e)
+            logger.error("Search failed: %s", error)
+            raise error from None
+        except Exception as e:
+            logger.error("Search failed: %s", type(e).__name__)
+            raise
 
+    async def asearch(self, query: str, num_results: int = 5) -> List[Dict]:
+        """
+        异步执行网络搜索
+
+        Args:
+            query: 搜索查询
+            num_results: 返回结果数量
+
+        Returns:
+            搜索结果列表
+
+        Raises:
+            SearchError: 请求失败（不含请求 URL）
+        """
+        params = self._params(query, num_results)
         try:
-            params = {
-                "q": query,
-                "api_key": self.api_key,
-                "num": num_results,
-                "engine": "google"
-            }
-
-            search = GoogleSearch(params)
-            results = search.get_dict()
-
-            # 提取有机搜索结果
-            organic_results = results.get("organic_results", [])
-
-            formatted_results = []
-            for result in organic_results[:num_results]:
-                formatted_results.append({
-                    "title": result.get("title", ""),
-                    "link": result.get("link", ""),
-                    "snippet": result.get("snippet", ""),
-                    "position": result.get("position", 0)
-                })
-
-            print(f"[INFO] Found {len(formatted_results)} search results for query: {query}")
+            response = await self.async_client.get(self.endpoint, params=params)
+            response.raise_for_status()
+            formatted_results = self._parse_results(response.json(), num_results)
+            logger.debug("Found %d search results for query: %s", len(formatted_results), query)
             return formatted_results
 
+        except httpx.HTTPError as e:
+            # 不保留原异常链：其文本和 request 中都有带 api_key 的 URL
+            error = SearchError.from_httpx(e)
+            logger.error("Search failed: %s", error)
+            raise error from None
         except Exception as e:
-            print(f"[ERROR] Search failed: {str(e)}")
+            logger.error("Search failed: %s", type(e).__name__)
             raise
 
     def get_search_context(self, query: str, num_results: int = 3) -> str:
@@ -73,17 +242,46 @@ class SearchTool:
         Returns:
             合并的搜索结果文本
         """
-        results = self.search(query, num_results)
-        if not results:
-            return ""
+        key = self._cache_key(query, num_results)
+        context = self._cache_get(key)
+        if context is not None:
+            return context
 
-        context_parts = []
-        for i, result in enumerate(results, 1):
-            context_parts.append(
-                f"[搜索结果 {i}]\n"
-                f"标题: {result['title']}\n"
-                f"链接: {result['link']}\n"
-                f"摘要: {result['snippet']}"
-            )
+        context = self._format_context(self.search(query, num_results))
+        self._cache_put(key, context)
+        return context
 
-        return "\n\n".join(context_parts)
+    async def aget_search_context(self, query: str, num_results: int = 3) -> str:
+        """
+        异步获取搜索结果的上下文文本，相同查询并发时共享同一次上游请求
+
+        Args:
+            query: 搜索查询
+            num_results: 返回结果数量
+
+        Returns:
+            合并的搜索结果文本
+        """
+        key = self._cache_key(query, num_results)
+        context = self._cache_get(key)
+        if context is not None:
+            return context
+
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            # shield: 某个等待者被取消时不影响共享请求
+            return await asyncio.shield(inflight)
+
+        async def fetch() -> str:
+            try:
+                result = self._format_context(await self.asearch(query, num_results))
+                self._cache_put(key, result)
+                return result
+            finally:
+                self._inflight.pop(key, None)
+
+        task = asyncio.ensure_future(fetch())
+        # 所有等待者都被取消时，避免未读取的异常告警
+        task.add_done_callback(lambda t: t.cancelled() or t.exception())
+        self._inflight[key] = task
+        return await asyncio.shield(task)
@@ -0,0 +1,128 @@
+"""推测式预取 - 在第一次 LLM 调用的同时按原始问题检索，工具被调用时复用结果"""
+from typing import Awaitable, Callable, Dict, Optional, Set
+from contextvars import ContextVar
+import asyncio
+import logging
+import unicodedata
+from observability import span
+
+
+logger = logging.getLogger(__name__)
+
+
+def _bigrams(text: str) -> Set[str]:
+    text = "".join(unicodedata.normalize("NFKC", text).lower().split())
+    if len(text) < 2:
+        return {text} if text else set()
+    return {text[i:i + 2] for i in range(len(text) - 1)}
+
+
+def query_overlap(a: str, b: str) -> float:
+    """
+    两个查询的字符二元组重叠系数（|A∩B| / min(|A|, |B|)）
+
+    Agent 常把用户问题改写成更短的检索词，重叠系数对这种"子串式"改写更宽容。
+    """
+    grams_a, grams_b = _bigrams(a), _bigrams(b)
+    if not grams_a or not grams_b:
+        return 0.0
+    return len(grams_a & grams_b) / min(len(grams_a), len(grams_b))
+
+
+class SpeculativePrefetch:
+    """单次请求内的预取任务集合"""
+
+    def __init__(self, query: str, min_overlap: float = 0.6):
+        """
+        初始化预取
+
+        Args:
+            query: 用户原始问题
+            min_overlap: 工具查询与原始问题的最小重叠系数，达到才复用预取结果
+        """
+        self.query = query
+        self.min_overlap = min_overlap
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self._used: Set[str] = set()
+
+    def start(self, tool_name: str, fetch: Callable[[str], Awaitable[str]]):
+        """
+        启动某个工具的预取
+
+        Args:
+            tool_name: 工具名称
+            fetch: 工具的异步实现（去掉 tool_<工具名> 计时包装，单独记为 prefetch_<工具名>，
+                被取消或没用上的预取不计入工具调用的耗时分布）
+        """
+        if tool_name in self._tasks:
+            return
+        fetch = getattr(fetch, "__wrapped__", fetch)
+
+        async def run() -> str:
+            # 任务有自己的上下文副本：清除预取标记，避免工具实现等待自己
+            _current_prefetch.set(None)
+            with span(f"prefetch_{tool_name}"):
+                return await fetch(self.query)
+
+        task = asyncio.create_task(run())
+        # 预取被取消或失败时不产生未读取异常的告警
+        task.add_done_callback(lambda t: t.cancelled() or t.exception())
+        self._tasks[tool_name] = task
+
+    async def take(self, tool_name: str, query: str) -> Optional[str]:
+        """
+        工具调用时领取预取结果
+
+        Returns:
+            查询足够相似且预取成功时返回结果，否则返回 None（由工具正常执行）
+        """
+        task = self._tasks.get(tool_name)
+        if task is None or query_overlap(query, self.query) < self.min_overlap:
+            return None
+        self._used.add(tool_name)
+        try:
+            return await task
+        except asyncio.CancelledError:
+            if task.cancelled():
+                return None
+            raise
+        except Exception as e:
+            logger.warning("Speculative %s failed: %s", tool_name, e)
+            return None
+
+    def cancel_unused(self) -> Dict[str, str]:
+        """
+        取消没有被领取的预取
+
+        Returns:
+            各工具预取的结局（used / cancelled / wasted）
+        """
+        outcome = {}
+        for tool_name, task in self._tasks.items():
+            if tool_name in self._used:
+                outcome[tool_name] = "used"
+            elif not task.done():
+                task.cancel()
+                outcome[tool_name] = "cancelled"
+            else:
+                outcome[tool_name] = "wasted"
+        return outcome
+
+
+# 当前请求的预取；工具实现通过 take_prefetch 读取
+_current_prefetch: ContextVar[Optional[SpeculativePrefetch]] = ContextVar("speculative_prefetch", default=None)
+
+
+def begin_prefetch(query: str, min_overlap: float = 0.6) -> SpeculativePrefetch:
+    """在当前上下文中开始一次请求的预取"""
+    prefetch = SpeculativePrefetch(query, min_overlap)
+    _current_prefetch.set(prefetch)
+    return prefetch
+
+
+async def take_prefetch(tool_name: str, query: str) -> Optional[str]:
+    """工具实现调用：有可复用的预取结果时返回，否则返回 None"""
+    prefetch = _current_prefetch.get()
+    if prefetch is None:
+        return None
+    return await prefetch.take(tool_name, query)
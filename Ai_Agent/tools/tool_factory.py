@@ -1,7 +1,31 @@
 """LangChain 工具封装 - 将工具封装为 LangChain Tool 对象"""
 from langchain.tools import Tool
-from typing import Optional
+from typing import Callable, Optional
+import functools
+import logging
+from observability import span
 from .search import SearchTool
+from .speculation import take_prefetch
+
+
+logger = logging.getLogger(__name__)
+
+
+def _timed(tool_name: str, func: Callable, is_async: bool = False) -> Callable:
+    """为工具实现加上阶段计时（stage=tool_<工具名>）"""
+    stage = f"tool_{tool_name}"
+    if is_async:
+        @functools.wraps(func)
+        async def async_wrapper(query: str) -> str:
+            with span(stage):
+                return await func(query)
+        return async_wrapper
+
+    @functools.wraps(func)
+    def wrapper(query: str) -> str:
+        with span(stage):
+            return func(query)
+    return wrapper
 
 
 def create_rag_tool(rag_retriever) -> Optional[Tool]:
@@ -17,30 +41,86 @@ def create_rag_tool(rag_retriever) -> Optional[Tool]:
     if not rag_retriever:
         return None
 
+    empty_message = "知识库为空，没有可搜索的文档。请先上传文档。"
+    no_match_message = "未找到与查询相关的文档。知识库中有文档，但没有匹配您查询的内容。请尝试用不同的关键词搜索。"
+
     def search_knowledge(query: str) -> str:
         """从知识库中搜索相关信息"""
         try:
-            print(f"[DEBUG] Searching knowledge base for: {query}")
-
-            # 直接尝试搜索
-            context = rag_retriever.get_context(query, k=3)
+            logger.debug("Searching knowledge base for: %s", query)
+
+            # 登记表判断为空时无需嵌入和检索
+            if not rag_retriever.has_documents():
+                return empty_message
+
+            # 词法快速路径：型号、电极名、缩写等精确词命中时无需嵌入查询
+            context = rag_retriever.get_lexical_context(query, k=3)
+            if context:
+                return context
+
+            # 先查语义结果缓存：相似问题直接复用上一次的检索与格式化结果
+            result_cache = rag_retriever.result_cache
+            if result_cache:
+                version = rag_retriever.version
+                vector = rag_retriever.embed_query(query)
+                cached = result_cache.get(vector, k=3, version=version)
+                if cached is not None:
+                    logger.debug("Result cache hit, length: %d", len(cached))
+                    return cached
+                context = rag_retriever.get_context_by_vector(vector, k=3, query=query)
+            else:
+                context = rag_retriever.get_context(query, k=3)
 
             if not context or context.strip() == "":
-                # 搜索没有结果，检查是否真的没有文档
-                has_docs = rag_retriever.has_documents()
+                return no_match_message
+
+            logger.debug("Found context, length: %d", len(context))
+            if result_cache:
+                result_cache.put(vector, k=3, version=version, context=context)
+            return context
 
-                if not has_docs:
-                    return "知识库为空，没有可搜索的文档。请先上传文档。"
-                else:
-                    return "未找到与查询相关的文档。知识库中有文档，但没有匹配您查询的内容。请尝试用不同的关键词搜索。"
+        except Exception as e:
+            logger.exception("Knowledge search error: %s", e)
+            return f"搜索知识库时出错: {str(e)}"
 
-            print(f"[DEBUG] Found context, length: {len(context)}")
+    async def asearch_knowledge(query: str) -> str:
+        """从知识库中搜索相关信息（异步，嵌入与 Qdrant 查询都在事件循环上等待）"""
+        try:
+            logger.debug("Searching knowledge base for: %s", query)
+
+            # 与用户问题并行发起的推测式检索，查询相近时直接复用
+            prefetched = await take_prefetch("knowledge_search", query)
+            if prefetched is not None:
+                logger.debug("Using speculative knowledge search result, length: %d", len(prefetched))
+                return prefetched
+
+            if not rag_retriever.has_documents():
+                return empty_message
+
+            context = await rag_retriever.aget_lexical_context(query, k=3)
+            if context:
+                return context
+
+            result_cache = rag_retriever.result_cache
+            version = rag_retriever.version
+            vector = await rag_retriever.aembed_query(query)
+            if result_cache:
+                cached = result_cache.get(vector, k=3, version=version)
+                if cached is not None:
+                    logger.debug("Result cache hit, length: %d", len(cached))
+                    return cached
+
+            context = await rag_retriever.aget_context_by_vector(vector, k=3, query=query)
+            if not context or context.strip() == "":
+                return no_match_message
+
+            logger.debug("Found context, length: %d", len(context))
+            if result_cache:
+                result_cache.put(vector, k=3, version=version, context=context)
             return context
 
         except Exception as e:
-            print(f"[ERROR] Knowledge search error: {str(e)}")
-            import traceback
-            traceback.print_exc()
+            logger.exception("Knowledge search error: %s", e)
             return f"搜索知识库时出错: {str(e)}"
 
     return Tool(
@@ -50,7 +130,8 @@ def create_rag_tool(rag_retriever) -> Optional[Tool]:
             "当用户询问关于已上传文档的问题时使用此工具。"
             "输入应该是一个搜索查询字符串。"
         ),
-        func=search_knowledge
+        func=_timed("knowledge_search", search_knowledge),
+        coroutine=_timed("knowledge_search", asearch_knowledge, is_async=True)
     )
 
 
@@ -67,6 +148,8 @@ def create_search_tool(search_tool: SearchTool) -> Optional[Tool]:
     if not search_tool:
         return None
 
+    web_search_error_message = "网络搜索暂时不可用，请稍后再试或改用知识库检索。"
+
     def web_search(query: str) -> str:
         """在互联网上搜索信息"""
         try:
@@ -75,7 +158,24 @@ def create_search_tool(search_tool: SearchTool) -> Optional[Tool]:
                 return "未找到相关搜索结果。"
             return context
         except Exception as e:
-            return f"网络搜索时出错: {str(e)}"
+            # 不把异常文本交给 LLM：可能带有上游地址等内部信息
+            logger.warning("Web search failed: %s", type(e).__name__)
+            return web_search_error_message
+
+    async def aweb_search(query: str) -> str:
+        """在互联网上搜索信息（异步，共享连接池与请求合并）"""
+        try:
+            prefetched = await take_prefetch("web_search", query)
+            if prefetched is not None:
+                return prefetched
+            context = await search_tool.aget_search_context(query, num_results=3)
+            if not context:
+                return "未找到相关搜索结果。"
+            return context
+        except Exception as e:
+            # 不把异常文本交给 LLM：可能带有上游地址等内部信息
+            logger.warning("Web search failed: %s", type(e).__name__)
+            return web_search_error_message
 
     return Tool(
         name="web_search",
@@ -85,5 +185,6 @@ def create_search_tool(search_tool: SearchTool) -> Optional[Tool]:
             "当知识库中没有相关信息时也可以使用此工具。"
             "输入应该是一个搜索查询字符串。"
         ),
-        func=web_search
+        func=_timed("web_search", web_search),
+        coroutine=_timed("web_search", aweb_search, is_async=True)
     )
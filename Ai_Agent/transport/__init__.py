@@ -0,0 +1,4 @@
+"""传输模块"""
+from .ws_stream import WebSocketStreamSender, InvalidFrame, receive_event
+
+__all__ = ["WebSocketStreamSender", "InvalidFrame", "receive_event"]
@@ -0,0 +1,253 @@
+"""WebSocket 流式发送 - content token 合并、紧凑帧编码与慢客户端背压"""
+from typing import Any, Deque, Dict, List, Optional, Tuple
+from collections import deque
+from fastapi import WebSocket, WebSocketDisconnect
+import asyncio
+import json
+import time
+
+try:
+    import msgpack
+except ImportError:  # 可选依赖：未安装时只支持 JSON 文本帧
+    msgpack = None
+
+
+SUPPORTED_ENCODINGS = ("json", "msgpack")
+
+
+def negotiate_encoding(requested: Optional[str]) -> str:
+    """
+    协商帧编码
+
+    Args:
+        requested: 客户端请求的编码（json/msgpack）
+
+    Returns:
+        实际使用的编码；请求 msgpack 但未安装时回退到 json
+    """
+    if requested == "msgpack" and msgpack is not None:
+        return "msgpack"
+    return "json"
+
+
+class InvalidFrame(ValueError):
+    """客户端帧无法解码或不是对象；只影响这一帧，连接继续可用"""
+
+
+async def receive_event(websocket: WebSocket) -> Dict[str, Any]:
+    """
+    接收一条客户端消息（文本帧按 JSON、二进制帧按 msgpack 解码）
+
+    Raises:
+        WebSocketDisconnect: 客户端断开
+        InvalidFrame: 帧无法解码或解码结果不是对象
+    """
+    message = await websocket.receive()
+    if message["type"] == "websocket.disconnect":
+        raise WebSocketDisconnect(message.get("code", 1000))
+    try:
+        if message.get("bytes") is not None:
+            if msgpack is None:
+                raise InvalidFrame("msgpack 未安装，无法解析二进制帧")
+            data = msgpack.unpackb(message["bytes"], raw=False)
+        else:
+            data = json.loads(message.get("text") or "{}")
+    except InvalidFrame:
+        raise
+    except Exception as e:
+        raise InvalidFrame(f"无法解析消息: {type(e).__name__}") from e
+    if not isinstance(data, dict):
+        raise InvalidFrame("消息必须是对象")
+    return data
+
+
+class WebSocketStreamSender:
+    """WebSocket 流式发送器
+
+    - 连续的 content 事件按时间窗口或字节数合并成一帧，减少 JSON 编码、帧和系统调用次数
+    - 由单独的写协程负责发送；客户端慢时 content 在缓冲区中继续合并（自适应合并）
+    - 已封帧但未发出的数据超过上限时，send() 阻塞调用方，把背压传回上游
+    """
+
+    def __init__(
+        self,
+        websocket: WebSocket,
+        encoding: str = "json",
+        flush_interval: float = 0.03,
+        flush_bytes: int = 1024,
+        max_pending_bytes: int = 256 * 1024,
+    ):
+        """
+        初始化发送器
+
+        Args:
+            websocket: 已 accept 的 WebSocket
+            encoding: 帧编码（json 文本帧 / msgpack 二进制帧）
+            flush_interval: content 合并的最长等待时间（秒），0 表示不按时间合并
+            flush_bytes: content 合并达到该字节数立即封帧
+            max_pending_bytes: 已封帧未发送数据的上限，超过后 send() 等待
+        """
+        self.websocket = websocket
+        self.encoding = negotiate_encoding(encoding)
+        self.flush_interval = flush_interval
+        self.flush_bytes = flush_bytes
+        self.max_pending_bytes = max_pending_bytes
+
+        self._frames: Deque[Tuple[Any, int]] = deque()
+        self._frame_bytes = 0
+        self._content: Optional[Dict[str, Any]] = None
+        self._content_parts: List[str] = []
+        self._content_bytes = 0
+        self._content_since = 0.0
+
+        self._wake = asyncio.Event()
+        self._drained = asyncio.Event()
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self._error: Optional[BaseException] = None
+        self._closed = False
+        self._writer = asyncio.create_task(self._write_loop())
+
+    async def send(self, event: Dict[str, Any]):
+        """
+        发送一个事件（content 事件可能被合并后延迟发送，其他事件保证按顺序发送）
+
+        Raises:
+            WebSocketDisconnect 等发送异常: 客户端已断开
+        """
+        self._raise_if_failed()
+
+        if event.get("type") == "content":
+            content = event.get("content", "")
+            if self._content is not None and not self._same_stream(event):
+                self._seal_content()
+            # 只在开始新一段合并或产生新帧时唤醒写协程，追加 token 不唤醒
+            wake = self._content is None
+            if self._content is None:
+                self._content = {k: v for k, v in event.items() if k != "content"}
+                self._content_since = time.monotonic()
+            self._content_parts.append(content)
+            self._content_bytes += len(content.encode("utf-8"))
+            if self._content_bytes >= self.flush_bytes or self.flush_interval <= 0:
+                self._seal_content()
+                wake = True
+        else:
+            self._seal_content()
+            self._push_frame(event)
+            wake = True
+
+        if wake:
+            self._idle.clear()
+            self._wake.set()
+
+        # 背压：慢客户端导致积压过多时让调用方等待
+        while self._frame_bytes > self.max_pending_bytes:
+            self._drained.clear()
+            await self._drained.wait()
+            self._raise_if_failed()
+
+    async def flush(self):
+        """立即发送所有缓冲的数据并等待写完"""
+        self._seal_content()
+        self._wake.set()
+        # _frame_bytes 在帧真正写完后才扣减，包含写协程正在发送的帧
+        while self._frame_bytes > 0 or self._content is not None:
+            self._raise_if_failed()
+            self._idle.clear()
+            await self._idle.wait()
+        self._raise_if_failed()
+
+    async def aclose(self, flush: bool = True):
+        """
+        关闭发送器
+
+        Args:
+            flush: 是否先发送完缓冲的数据
+        """
+        if self._closed:
+            return
+        try:
+            if flush and self._error is None:
+                await self.flush()
+        except Exception:
+            pass
+        finally:
+            self._closed = True
+            self._writer.cancel()
+            try:
+                await self._writer
+            except (asyncio.CancelledError, Exception):
+                pass
+
+    def _raise_if_failed(self):
+        if self._error is not None:
+            raise self._error
+
+    def _same_stream(self, event: Dict[str, Any]) -> bool:
+        """除 content 外的字段都相同（如 request_id）才能合并"""
+        return all(event.get(k) == v for k, v in self._content.items()) and \
+            len(event) - 1 == len(self._content)
+
+    def _encode(self, event: Dict[str, Any]) -> Tuple[Any, int]:
+        if self.encoding == "msgpack":
+            payload = msgpack.packb(event, use_bin_type=True)
+            return payload, len(payload)
+        payload = json.dumps(event, ensure_ascii=False)
+        return payload, len(payload)
+
+    def _push_frame(self, event: Dict[str, Any]):
+        payload, size = self._encode(event)
+        self._frames.append((payload, size))
+        self._frame_bytes += size
+
+    def _seal_content(self):
+        """把合并中的 content 封装成一帧"""
+        if self._content is None:
+            return
+        event = dict(self._content)
+        event["content"] = "".join(self._content_parts)
+        self._content = None
+        self._content_parts = []
+        self._content_bytes = 0
+        self._push_frame(event)
+
+    async def _send_raw(self, payload: Any):
+        if self.encoding == "msgpack":
+            await self.websocket.send_bytes(payload)
+        else:
+            await self.websocket.send_text(payload)
+
+    async def _write_loop(self):
+        """写协程：按顺序发出已封帧的数据，按时间窗口封装合并中的 content"""
+        try:
+            while True:
+                if self._frames:
+                    payload, size = self._frames.popleft()
+                    await self._send_raw(payload)
+                    self._frame_bytes -= size
+                    if self._frame_bytes <= self.max_pending_bytes:
+                        self._drained.set()
+                    continue
+
+                if self._content is not None:
+                    delay = self._content_since + self.flush_interval - time.monotonic()
+                    if delay > 0:
+                        self._wake.clear()
+                        try:
+                            await asyncio.wait_for(self._wake.wait(), timeout=delay)
+                        except asyncio.TimeoutError:
+                            pass
+                    else:
+                        self._seal_content()
+                    continue
+
+                self._idle.set()
+                self._wake.clear()
+                await self._wake.wait()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            # 客户端断开等发送错误：唤醒所有等待方，由下一次 send() 抛出
+            self._error = e if isinstance(e, WebSocketDisconnect) else WebSocketDisconnect(1006)
+            self._drained.set()
+            self._idle.set()